@@ -0,0 +1,392 @@
+"""In-process snapshot of the tourism catalog (RNT rows plus approved user destinations)
+
+Both sources share one record layout, so search, filters, statistics and
+recommendations run over the union through the same indexes.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import orjson
+
+from catalog_stats import CatalogStatistics
+from compression import precompress
+from content_vectors import ContentIndex
+from facets import FacetIndex
+from geo_index import GeoGridIndex
+from search_index import SearchIndex
+from singleflight import SingleFlight
+from text_vectors import TextVectorIndex
+
+# Departments served by the app (RNT names come without accents)
+TARGET_DEPARTMENTS = ['BOYACA', 'CUNDINAMARCA']
+
+# Seconds a snapshot is considered fresh before the background refresh replaces it
+CATALOG_TTL_SECONDS = int(os.environ.get('CATALOG_TTL_SECONDS', '3600'))
+
+# Seconds to wait before retrying after a failed refresh
+CATALOG_RETRY_SECONDS = int(os.environ.get('CATALOG_RETRY_SECONDS', '60'))
+
+
+def filter_target_departments(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep only the rows that belong to Boyacá and Cundinamarca"""
+    return [row for row in rows if row.get('nomdep', '').strip().upper() in TARGET_DEPARTMENTS]
+
+
+def row_key(row: Dict[str, Any]) -> str:
+    """Content hash of one row, used to diff consecutive snapshots"""
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def compute_catalog_version(row_keys: List[str]) -> str:
+    """Content hash of the catalog rows, stable across refreshes that return the same data"""
+    digest = hashlib.sha1()
+    for key in sorted(row_keys):
+        digest.update(key.encode('ascii'))
+    return digest.hexdigest()[:12]
+
+
+class CatalogSnapshot:
+    """Immutable view of the filtered catalog at one point in time"""
+
+    def __init__(self, destinations: List[Dict[str, Any]], row_keys: List[str], loaded_at: Optional[float] = None):
+        # Processed destinations sorted by department and municipality
+        self.destinations = destinations
+        self.row_keys = row_keys
+        self.version = compute_catalog_version(row_keys)
+        self.loaded_at = loaded_at or time.time()
+        # 'upstream' or 'fallback' depending on where the rows came from
+        self.source = 'upstream'
+        # Full-text index over the same positions as destinations
+        self.search_index = SearchIndex(destinations)
+        # Department, category and municipality bitmaps over the same positions
+        self.facets = FacetIndex(destinations)
+        # Content feature vectors over the same positions, for recommendation scoring
+        self.content = ContentIndex(destinations)
+        # Text vectors and precomputed neighbours for "similar destinations" (with and without user rows)
+        self.similar = TextVectorIndex(destinations, excluded=[dest.get('source') == 'user' for dest in destinations])
+        # Rows with coordinates (user destinations), for radius queries
+        self.geo = GeoGridIndex()
+        for dest in destinations:
+            if dest.get('latitude') is not None and dest.get('longitude') is not None:
+                self.geo.add(dest['rnt'], dest['latitude'], dest['longitude'], dest.get('categoria'), dest)
+        self.statistics: Optional[CatalogStatistics] = None
+        self.statistics_payload: Dict[str, Any] = {}
+        # The payload serialized once, served as is by /api/destinations/statistics
+        self.statistics_json = b'{}'
+        # ... and compressed once per encoding, off the event loop
+        self.statistics_compressed: Dict[str, bytes] = {}
+
+    def install_statistics(self, previous: Optional['CatalogSnapshot'] = None):
+        """Compute statistics in one pass, or update the previous counters with only the changed rows"""
+        if previous is None or previous.statistics is None:
+            self.statistics = CatalogStatistics.from_rows(self.destinations)
+        elif previous.version == self.version:
+            self.statistics = previous.statistics
+        else:
+            old_keys = Counter(previous.row_keys)
+            new_keys = Counter(self.row_keys)
+            removed_keys = old_keys - new_keys
+            added_keys = new_keys - old_keys
+            self.statistics = previous.statistics.copy()
+            self.statistics.apply_changes(
+                self._rows_for(previous, removed_keys),
+                self._rows_for(self, added_keys)
+            )
+        self._serialize_statistics()
+
+    def _serialize_statistics(self):
+        self.statistics_payload = self.statistics.to_dict(self.version)
+        self.statistics_json = orjson.dumps(self.statistics_payload, option=orjson.OPT_NON_STR_KEYS)
+        self.statistics_compressed = precompress(self.statistics_json)
+
+    def with_destinations(self, destinations: List[Dict[str, Any]]) -> 'CatalogSnapshot':
+        """Copy of the snapshot with processed destinations added, or replacing the row with their rnt
+
+        Every index is updated with the changed rows only, so the current
+        snapshot keeps serving while this runs. New rows are appended after the
+        sorted ones and take their sorted place at the next full build.
+        """
+        snapshot = copy.copy(self)
+        snapshot.destinations = list(self.destinations)
+        snapshot.row_keys = list(self.row_keys)
+        snapshot.geo = self.geo.copy()
+        removed, added = [], []
+        for dest in destinations:
+            key = row_key(dest)
+            positions = snapshot.content.positions_of([dest['rnt']])
+            if positions:
+                position = positions[0]
+                replaced = snapshot.destinations[position]
+                if snapshot.row_keys[position] == key:
+                    continue
+                snapshot.destinations[position] = dest
+                snapshot.row_keys[position] = key
+                removed.append(replaced)
+            else:
+                position = len(snapshot.destinations)
+                replaced = None
+                snapshot.destinations.append(dest)
+                snapshot.row_keys.append(key)
+            added.append(dest)
+
+            snapshot.search_index = snapshot.search_index.with_document(position, dest, replaced)
+            snapshot.facets = snapshot.facets.with_destination(position, dest, replaced)
+            snapshot.content = snapshot.content.with_destination(position, dest, replaced)
+            snapshot.similar = snapshot.similar.with_document(position, dest, excluded=dest.get('source') == 'user')
+            snapshot.geo.remove(dest['rnt'])
+            if dest.get('latitude') is not None and dest.get('longitude') is not None:
+                snapshot.geo.add(dest['rnt'], dest['latitude'], dest['longitude'], dest.get('categoria'), dest)
+
+        if not added:
+            return self
+        snapshot.version = compute_catalog_version(snapshot.row_keys)
+        snapshot.statistics = self.statistics.copy()
+        snapshot.statistics.apply_changes(removed, added)
+        snapshot._serialize_statistics()
+        return snapshot
+
+    @staticmethod
+    def _rows_for(snapshot: 'CatalogSnapshot', keys: Counter) -> List[Dict[str, Any]]:
+        remaining = Counter(keys)
+        rows = []
+        for key, row in zip(snapshot.row_keys, snapshot.destinations):
+            if remaining[key] > 0:
+                remaining[key] -= 1
+                rows.append(row)
+        return rows
+
+    def age(self) -> float:
+        return time.time() - self.loaded_at
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat(),
+            "age_seconds": round(self.age(), 1),
+            "total_destinations": len(self.destinations),
+            "destinations_by_source": dict(Counter(dest.get('source', 'rnt') for dest in self.destinations)),
+            "source": self.source,
+        }
+
+
+def build_snapshot(
+    rows: List[Dict[str, Any]],
+    processor: Callable[[Dict[str, Any]], Dict[str, Any]],
+    previous: Optional[CatalogSnapshot] = None,
+) -> CatalogSnapshot:
+    """Filter, process and sort raw RNT rows into a snapshot (CPU bound, run off the event loop)"""
+    destinations = [processor(row) for row in filter_target_departments(rows)]
+    destinations.sort(key=lambda x: (x.get('nomdep', ''), x.get('nombre_muni', '')))
+    row_keys = [row_key(dest) for dest in destinations]
+    if previous is not None and previous.row_keys == row_keys:
+        # Same rows in the same order (the usual TTL refresh): keep every index
+        snapshot = copy.copy(previous)
+        snapshot.loaded_at = time.time()
+        return snapshot
+    snapshot = CatalogSnapshot(destinations, row_keys)
+    snapshot.install_statistics(previous)
+    return snapshot
+
+
+def update_snapshot(
+    snapshot: CatalogSnapshot,
+    rows: List[Dict[str, Any]],
+    processor: Callable[[Dict[str, Any]], Dict[str, Any]],
+) -> Optional[CatalogSnapshot]:
+    """Apply raw upserted rows to a snapshot incrementally (CPU bound, run off the event loop)
+
+    Returns None when a row already in the snapshot no longer passes the
+    department filter, since removing it needs a full build.
+    """
+    kept = filter_target_departments(rows)
+    if len(kept) < len(rows):
+        kept_rnts = {row['rnt'] for row in kept}
+        if snapshot.content.positions_of([row['rnt'] for row in rows if row['rnt'] not in kept_rnts]):
+            return None
+    return snapshot.with_destinations([processor(row) for row in kept])
+
+
+class CatalogStore:
+    """Holds the current snapshot and refreshes it in the background every TTL seconds
+
+    fallback loads rows from a local copy when the upstream loader fails, and
+    on_loaded receives every successful upstream download (e.g. to persist it).
+    extra_loader returns rows of a second source (already in the catalog
+    layout, keyed by a unique rnt) that are merged into every snapshot;
+    upsert_rows() adds to them and applies them to the current snapshot in the
+    background, without downloading or rebuilding the catalog.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        processor: Callable[[Dict[str, Any]], Dict[str, Any]],
+        ttl: int = CATALOG_TTL_SECONDS,
+        fallback: Optional[Callable[[], Awaitable[List[Dict[str, Any]]]]] = None,
+        on_loaded: Optional[Callable[[List[Dict[str, Any]]], Awaitable[Any]]] = None,
+        extra_loader: Optional[Callable[[], Awaitable[List[Dict[str, Any]]]]] = None,
+    ):
+        self._loader = loader
+        self._processor = processor
+        self._fallback = fallback
+        self._on_loaded = on_loaded
+        self._extra_loader = extra_loader
+        # Raw rows of the last load and the second-source rows by rnt, to rebuild without downloading
+        self._rows: List[Dict[str, Any]] = []
+        self._extra_rows: Dict[str, Dict[str, Any]] = {}
+        # Rows upserted while extra_loader runs, which its result may predate
+        self._upserted_during_load: Dict[str, Dict[str, Any]] = {}
+        # Refreshes and upsert rebuilds install snapshots one at a time
+        self._install_lock = asyncio.Lock()
+        # Upserts arriving while one is applied are coalesced into the next update
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._pending_rows: Dict[str, Dict[str, Any]] = {}
+        self._background_tasks = set()
+        self.ttl = ttl
+        self._snapshot: Optional[CatalogSnapshot] = None
+        # Cold-start reads and the background refresh share a single upstream download
+        self._flight = SingleFlight()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        return self._snapshot
+
+    async def get(self) -> CatalogSnapshot:
+        """Return the current snapshot, loading it first if none has been installed yet"""
+        if self._snapshot is None:
+            return await self.refresh()
+        return self._snapshot
+
+    async def refresh(self) -> CatalogSnapshot:
+        """Download the catalog and install a new snapshot, joining a refresh already in flight"""
+        return await self._flight.do('refresh', self._load)
+
+    async def _load(self) -> CatalogSnapshot:
+        source = 'upstream'
+        try:
+            rows = await self._loader()
+            self.last_error = None
+        except Exception as e:
+            if self._fallback is None:
+                raise
+            self.last_error = str(e)
+            print(f"Catalog upstream unavailable, using fallback: {str(e)}")
+            rows = await self._fallback()
+            if not rows:
+                raise
+            source = 'fallback'
+
+        extra_rows = None
+        if self._extra_loader is not None:
+            self._upserted_during_load = {}
+            try:
+                extra_rows = {row['rnt']: row for row in await self._extra_loader()}
+            except Exception as e:
+                print(f"Error loading extra catalog rows, keeping the previous ones: {str(e)}")
+
+        async with self._install_lock:
+            self._rows = rows
+            if extra_rows is not None:
+                self._extra_rows = {**extra_rows, **self._upserted_during_load}
+            snapshot = await self._install(source)
+        # Rows upserted before the first install, or while it was built, may be missing from it
+        self._schedule_update()
+
+        if source == 'upstream' and self._on_loaded is not None:
+            # Persist in the background so readers get the new snapshot right away
+            task = asyncio.create_task(self._run_on_loaded(rows))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return snapshot
+
+    async def _install(self, source: str) -> CatalogSnapshot:
+        rows = self._rows + list(self._extra_rows.values())
+        snapshot = await asyncio.to_thread(build_snapshot, rows, self._processor, self._snapshot)
+        snapshot.source = source
+        self._snapshot = snapshot
+        return snapshot
+
+    def upsert_rows(self, rows: List[Dict[str, Any]]):
+        """Add or replace second-source rows and schedule their update of the snapshot
+
+        Returns at once; the current snapshot keeps serving until the updated
+        one is installed.
+        """
+        for row in rows:
+            self._extra_rows[row['rnt']] = row
+            self._upserted_during_load[row['rnt']] = row
+            self._pending_rows[row['rnt']] = row
+        if self._snapshot is not None:
+            self._schedule_update()
+
+    def _schedule_update(self):
+        if self._rebuild_task is None and self._pending_rows:
+            self._rebuild_task = asyncio.create_task(self._rebuild_loop())
+
+    async def _rebuild_loop(self):
+        try:
+            while self._pending_rows:
+                rows = list(self._pending_rows.values())
+                self._pending_rows = {}
+                async with self._install_lock:
+                    snapshot = await asyncio.to_thread(update_snapshot, self._snapshot, rows, self._processor)
+                    if snapshot is None:
+                        await self._install(self._snapshot.source)
+                    else:
+                        self._snapshot = snapshot
+        except Exception as e:
+            print(f"Error updating catalog with upserted rows: {str(e)}")
+        finally:
+            self._rebuild_task = None
+
+    async def _run_on_loaded(self, rows: List[Dict[str, Any]]):
+        try:
+            await self._on_loaded(rows)
+        except Exception as e:
+            print(f"Error handling loaded catalog: {str(e)}")
+
+    def start(self):
+        """Start the background refresh loop (call from the app startup event)"""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._refresh_task, self._rebuild_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._refresh_task = None
+        self._rebuild_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = self.ttl
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving the previous snapshot and retry sooner
+                self.last_error = str(e)
+                print(f"Error refreshing catalog: {str(e)}")
+                delay = CATALOG_RETRY_SECONDS
+            await asyncio.sleep(delay)
+
+    def info(self) -> Dict[str, Any]:
+        info = self._snapshot.info() if self._snapshot else {"version": None, "total_destinations": 0}
+        info["ttl_seconds"] = self.ttl
+        info["last_error"] = self.last_error
+        info["refreshes"] = self._flight.stats()
+        return info
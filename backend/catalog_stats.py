@@ -0,0 +1,85 @@
+"""Destination statistics maintained as counters over the catalog snapshot"""
+import copy
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+from facets import DEPARTMENT_DISPLAY
+
+
+class CatalogStatistics:
+    """Counters filled in a single pass and updated incrementally with the rows that changed"""
+
+    def __init__(self):
+        self.total = 0
+        self.by_department = {dept: Counter() for dept in DEPARTMENT_DISPLAY}
+        self.department_totals = Counter()
+        self.by_category = Counter()
+        self.by_municipality = Counter()
+        self.total_rooms = 0
+        self.total_beds = 0
+        self.establishments_with_rooms = 0
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> 'CatalogStatistics':
+        stats = cls()
+        for row in rows:
+            stats.apply(row, 1)
+        return stats
+
+    def copy(self) -> 'CatalogStatistics':
+        return copy.deepcopy(self)
+
+    def apply(self, item: Dict[str, Any], sign: int):
+        """Add (sign=1) or remove (sign=-1) one processed destination from the counters"""
+        dept = item.get('nomdep', '').strip().upper()
+        category = item.get('categoria', 'No especificado')
+        municipality = item.get('nombre_muni', 'No especificado')
+        dept_display = 'Boyacá' if dept == 'BOYACA' else 'Cundinamarca'
+
+        self.total += sign
+        if dept in self.by_department:
+            self.department_totals[dept] += sign
+            self.by_department[dept][category] += sign
+        self.by_category[category] += sign
+        self.by_municipality[f"{municipality} ({dept_display})"] += sign
+
+        rooms = item.get('habitaciones')
+        if rooms:
+            self.total_rooms += sign * rooms
+            self.establishments_with_rooms += sign
+        beds = item.get('camas')
+        if beds:
+            self.total_beds += sign * beds
+
+    def apply_changes(self, removed: List[Dict[str, Any]], added: List[Dict[str, Any]]):
+        for row in removed:
+            self.apply(row, -1)
+        for row in added:
+            self.apply(row, 1)
+
+    def to_dict(self, version: str) -> Dict[str, Any]:
+        """Statistics payload in the /api/destinations/statistics layout"""
+        return {
+            'catalog_version': version,
+            'total_destinations': self.total,
+            'by_department': {
+                DEPARTMENT_DISPLAY[dept]: {
+                    'count': self.department_totals[dept],
+                    'categories': {category: count for category, count in categories.items() if count > 0}
+                }
+                for dept, categories in self.by_department.items()
+            },
+            'by_category': {category: count for category, count in self.by_category.items() if count > 0},
+            'by_municipality': dict(
+                sorted(
+                    ((muni, count) for muni, count in self.by_municipality.items() if count > 0),
+                    key=lambda x: x[1],
+                    reverse=True
+                )
+            ),
+            'accommodation_stats': {
+                'total_rooms': self.total_rooms,
+                'total_beds': self.total_beds,
+                'establishments_with_rooms': self.establishments_with_rooms
+            }
+        }
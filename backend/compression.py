@@ -0,0 +1,142 @@
+"""Response compression (brotli when installed, otherwise gzip) above a size threshold"""
+import asyncio
+import gzip
+import os
+from typing import Dict, List, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent as they are
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+# Bodies at least this large are compressed in a worker thread instead of on the event loop
+COMPRESSION_THREAD_MIN_SIZE = int(os.environ.get('COMPRESSION_THREAD_MIN_SIZE', str(64 * 1024)))
+# Fast levels: the catalog responses are compressed on every request
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+def available_encodings() -> List[str]:
+    return ['br', 'gzip'] if brotli_available() else ['gzip']
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """'br' or 'gzip' from an Accept-Encoding header (q=0 means refused), or None"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+async def compress_async(body: bytes, encoding: str) -> bytes:
+    """Compress small bodies inline and large ones in a worker thread, so the loop keeps serving"""
+    if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+        return await asyncio.to_thread(compress, body, encoding)
+    return compress(body, encoding)
+
+
+def precompress(body: bytes, minimum_size: int = COMPRESSION_MIN_SIZE) -> Dict[str, bytes]:
+    """body compressed with every available encoding, or nothing when it is below minimum_size
+
+    For payloads served many times unchanged, so they are compressed once.
+    """
+    if len(body) < minimum_size:
+        return {}
+    return {encoding: compress(body, encoding) for encoding in available_encodings()}
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses complete JSON/text bodies of at least minimum_size bytes
+
+    Streaming responses (sent in several body messages) and bodies that already
+    carry a Content-Encoding pass through unchanged.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        encoding = choose_encoding(headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            response_headers = [(name.lower(), value) for name, value in start_message.get('headers', [])]
+            content_type = dict(response_headers).get(b'content-type', b'').decode('latin-1')
+            if (
+                message.get('more_body', False)
+                or len(body) < self.minimum_size
+                or b'content-encoding' in dict(response_headers)
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = await compress_async(body, encoding)
+            response_headers = [
+                (name, value) for name, value in response_headers if name != b'content-length'
+            ]
+            response_headers.append((b'content-encoding', encoding.encode('latin-1')))
+            response_headers.append((b'content-length', str(len(compressed)).encode('latin-1')))
+            vary = [value for name, value in response_headers if name == b'vary']
+            if not vary:
+                response_headers.append((b'vary', b'Accept-Encoding'))
+            elif b'accept-encoding' not in vary[0].lower():
+                response_headers = [
+                    (name, value + b', Accept-Encoding' if name == b'vary' else value)
+                    for name, value in response_headers
+                ]
+            await send({**start_message, 'headers': response_headers})
+            await send({**message, 'body': compressed})
+
+        await self.app(scope, receive, send_compressed)
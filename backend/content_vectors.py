@@ -0,0 +1,214 @@
+"""Destination feature vectors for content-based recommendation scoring
+
+Every catalog row is encoded once, when the snapshot is built, into a binary
+row of a (destinations x features) matrix. A user profile becomes a weight
+vector over the same features, so scoring the whole catalog is a single
+matrix-vector product and the recommendation reasons come from the features
+that contributed to the score.
+"""
+import copy
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from facets import DEPARTMENT_DISPLAY
+from search_index import fold_accents
+
+# Weight of each matched preference: every preferred category found in the
+# destination category adds 3, every preferred department adds 2
+CATEGORY_WEIGHT = 3.0
+DEPARTMENT_WEIGHT = 2.0
+TRAVEL_STYLE_WEIGHT = 1.0
+
+# Folded keywords of the destination category that suit each travel style
+TRAVEL_STYLE_KEYWORDS = {
+    'aventura': ['rural'],
+    'cultural': ['guia', 'agencia'],
+    'relajacion': ['alojamiento'],
+}
+
+
+class ContentProfile:
+    """A user's preferences as a weight vector over the catalog features"""
+
+    def __init__(self, weights: np.ndarray, category_matches: List[Tuple[str, Set[int]]]):
+        self.weights = weights
+        # (preferred category, category columns it matches), in the user's order, for the reasons
+        self.category_matches = category_matches
+
+
+class ContentIndex:
+    """Binary destination x feature matrix over the same positions as the snapshot"""
+
+    def __init__(self, destinations: Sequence[Dict[str, Any]]):
+        self.size = len(destinations)
+        self._categories: Dict[str, int] = {}
+        self._departments: Dict[str, int] = {}
+
+        category_columns = []
+        department_columns = []
+        for dest in destinations:
+            category, department = self._features(dest)
+            category_columns.append(self._categories.setdefault(category, len(self._categories)))
+            department_columns.append(self._departments.setdefault(department, len(self._departments)))
+        self._layout()
+
+        self.matrix = np.zeros((self.size, self.feature_count), dtype=np.float32)
+        if self.size:
+            positions = np.arange(self.size)
+            self.matrix[positions, category_columns] = 1.0
+            self.matrix[positions, np.asarray(department_columns) + self._department_offset] = 1.0
+        # Keyword features are shared by every row of a category, so resolve them per category
+        for category, column in self._categories.items():
+            rows = self.matrix[:, column] > 0
+            for keyword, keyword_column in self._keywords.items():
+                if keyword in category:
+                    self.matrix[rows, keyword_column] = 1.0
+
+        self._category_of = category_columns
+        self._department_of = department_columns
+        self._positions: Dict[str, List[int]] = defaultdict(list)
+        for position, dest in enumerate(destinations):
+            if dest.get('rnt'):
+                self._positions[dest['rnt']].append(position)
+
+    @staticmethod
+    def _features(dest: Dict[str, Any]) -> Tuple[str, str]:
+        category = fold_accents((dest.get('categoria') or '').strip())
+        department = fold_accents((dest.get('nomdep') or '').strip()).upper()
+        return category, department
+
+    def _layout(self):
+        """Column offsets: categories first, then departments, then travel style keywords"""
+        keywords = sorted({keyword for words in TRAVEL_STYLE_KEYWORDS.values() for keyword in words})
+        self._department_offset = len(self._categories)
+        self._keyword_offset = self._department_offset + len(self._departments)
+        self._keywords = {keyword: self._keyword_offset + i for i, keyword in enumerate(keywords)}
+        self.feature_count = self._keyword_offset + len(keywords)
+        self._department_names = {column: name for name, column in self._departments.items()}
+
+    def with_destination(self, position: int, dest: Dict[str, Any], replaced: Optional[Dict[str, Any]] = None) -> 'ContentIndex':
+        """Copy of the index with dest appended (position == size) or put in place of replaced
+
+        A category or department not seen before gets a new zero column
+        inserted in its block, so existing rows keep their features.
+        """
+        index = copy.copy(self)
+        index._categories = dict(self._categories)
+        index._departments = dict(self._departments)
+        category, department = self._features(dest)
+        matrix = self.matrix
+        if category not in index._categories:
+            index._categories[category] = len(index._categories)
+            matrix = np.insert(matrix, self._department_offset, 0.0, axis=1)
+        if department not in index._departments:
+            index._departments[department] = len(index._departments)
+            matrix = np.insert(matrix, len(index._categories) + len(self._departments), 0.0, axis=1)
+        index._layout()
+
+        row = np.zeros(index.feature_count, dtype=np.float32)
+        row[index._categories[category]] = 1.0
+        row[index._department_offset + index._departments[department]] = 1.0
+        for keyword, column in index._keywords.items():
+            if keyword in category:
+                row[column] = 1.0
+
+        index._category_of = list(self._category_of)
+        index._department_of = list(self._department_of)
+        index._positions = defaultdict(list, self._positions)
+        if replaced is not None and replaced.get('rnt'):
+            remaining = [found for found in index._positions[replaced['rnt']] if found != position]
+            if remaining:
+                index._positions[replaced['rnt']] = remaining
+            else:
+                del index._positions[replaced['rnt']]
+        if dest.get('rnt'):
+            index._positions[dest['rnt']] = sorted(index._positions.get(dest['rnt'], []) + [position])
+
+        if position == self.size:
+            index.matrix = np.vstack([matrix, row])
+            index.size += 1
+            index._category_of.append(index._categories[category])
+            index._department_of.append(index._departments[department])
+        else:
+            index.matrix = matrix.copy() if matrix is self.matrix else matrix
+            index.matrix[position] = row
+            index._category_of[position] = index._categories[category]
+            index._department_of[position] = index._departments[department]
+        return index
+
+    def positions_of(self, rnts: Iterable[str]) -> List[int]:
+        """Catalog positions of the given rnt values (unknown ones are ignored)"""
+        positions = []
+        for rnt in rnts:
+            positions.extend(self._positions.get(rnt, ()))
+        return positions
+
+    def profile(self, user_prefs: Dict[str, Any]) -> ContentProfile:
+        """Map preferred categories, departments and travel style onto the feature columns"""
+        weights = np.zeros(self.feature_count, dtype=np.float32)
+
+        category_matches = []
+        for pref_category in user_prefs.get('preferred_categories') or []:
+            folded = fold_accents(pref_category)
+            columns = {column for category, column in self._categories.items() if folded in category}
+            for column in columns:
+                weights[column] += CATEGORY_WEIGHT
+            category_matches.append((pref_category, columns))
+
+        for pref_dept in user_prefs.get('preferred_departments') or []:
+            column = self._departments.get(fold_accents(pref_dept.strip()).upper())
+            if column is not None:
+                weights[self._department_offset + column] += DEPARTMENT_WEIGHT
+
+        travel_style = fold_accents(user_prefs.get('travel_style') or '')
+        keyword_columns = {self._keywords[keyword] for keyword in TRAVEL_STYLE_KEYWORDS.get(travel_style, [])}
+        for column in keyword_columns:
+            weights[column] = TRAVEL_STYLE_WEIGHT
+
+        return ContentProfile(weights, category_matches)
+
+    def scores(self, profile: ContentProfile) -> np.ndarray:
+        """Content score of every destination (one dot product per row, done as one matmul)"""
+        if not self.size:
+            return np.zeros(0, dtype=np.float32)
+        # A destination can match several style keywords but earns the style bonus once
+        keyword_part = self.matrix[:, self._keyword_offset:] @ profile.weights[self._keyword_offset:]
+        base = self.matrix[:, :self._keyword_offset] @ profile.weights[:self._keyword_offset]
+        return base + np.minimum(keyword_part, TRAVEL_STYLE_WEIGHT)
+
+    def top_k(self, profile: ContentProfile, k: int, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Best (position, score) pairs with a positive score, highest first, catalog order on ties"""
+        if k <= 0 or not self.size:
+            return []
+        scores = self.scores(profile)
+        excluded = list(exclude)
+        if excluded:
+            scores[excluded] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(int(position), float(scores[position])) for position in candidates]
+
+    def reason(self, position: int, profile: ContentProfile, is_collaborative: bool) -> str:
+        """Explain a recommendation from the features the destination shares with the profile"""
+        reasons = []
+
+        if is_collaborative:
+            reasons.append("Recomendado por usuarios con gustos similares")
+
+        category_column = self._category_of[position]
+        for pref_category, columns in profile.category_matches:
+            if category_column in columns:
+                reasons.append(f"Coincide con tu interés en {pref_category.lower()}")
+                break
+
+        department_column = self._department_of[position]
+        if profile.weights[self._department_offset + department_column] > 0:
+            department = self._department_names[department_column]
+            dept_display = DEPARTMENT_DISPLAY.get(department, department.title())
+            reasons.append(f"Ubicado en {dept_display}, tu departamento preferido")
+
+        return "; ".join(reasons) if reasons else "Destino popular en la región"
@@ -0,0 +1,31 @@
+"""Async MongoDB connection (Motor) shared by the API"""
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import round_trips
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+
+# Connection pool sizing: one worker overlaps up to MONGO_MAX_POOL_SIZE round trips
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '200'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+
+# Timeouts (milliseconds); MONGO_TIMEOUT_MS bounds every operation, including pool waits and retries
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_TIMEOUT_MS = int(os.environ.get('MONGO_TIMEOUT_MS', '10000'))
+
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    timeoutMS=MONGO_TIMEOUT_MS,
+    # Counts the round trips of each request (X-Mongo-Round-Trips) when MONGO_ROUND_TRIPS is set
+    event_listeners=[round_trips.listener] if round_trips.MONGO_ROUND_TRIPS else [],
+)
+db = client.tourism_app
@@ -0,0 +1,75 @@
+"""Materialized copy of the RNT catalog in the MongoDB destinations collection"""
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from pymongo import DeleteMany, UpdateOne
+
+from catalog import row_key
+
+# Fields added by the sync job that are not part of the RNT row
+SYNC_FIELDS = ['_id', 'row_hash', 'synced_at']
+
+# Maximum operations sent in one bulk_write call
+SYNC_BATCH_SIZE = 1000
+
+
+def plan_sync(
+    rows: List[Dict[str, Any]],
+    existing: Dict[str, str],
+    now: datetime,
+) -> Tuple[List[Any], int, List[str]]:
+    """Upserts of new and changed rows (hashing every row, CPU bound), rows kept and rnts to delete"""
+    operations = []
+    seen = set()
+    for row in rows:
+        rnt = row.get('rnt')
+        if not rnt or rnt in seen:
+            continue
+        seen.add(rnt)
+
+        # Same content hash as the catalog snapshot diff
+        digest = row_key(row)
+        if existing.get(rnt) == digest:
+            continue
+        operations.append(UpdateOne(
+            {'rnt': rnt},
+            {'$set': {**row, 'row_hash': digest, 'synced_at': now}},
+            upsert=True
+        ))
+
+    removed = [rnt for rnt in existing if rnt not in seen]
+    if removed:
+        operations.append(DeleteMany({'rnt': {'$in': removed}}))
+    return operations, len(seen), removed
+
+
+async def sync_destinations(collection, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Upsert new and changed rows and delete rows no longer published, keyed by rnt"""
+    existing = {
+        doc['rnt']: doc.get('row_hash')
+        async for doc in collection.find({}, {'rnt': 1, 'row_hash': 1, '_id': 0})
+    }
+
+    now = datetime.now()
+    operations, kept, removed = await asyncio.to_thread(plan_sync, rows, existing, now)
+    for start in range(0, len(operations), SYNC_BATCH_SIZE):
+        await collection.bulk_write(operations[start:start + SYNC_BATCH_SIZE], ordered=False)
+
+    result = {
+        'rows': kept,
+        'changed': len(operations) - (1 if removed else 0),
+        'deleted': len(removed),
+        'synced_at': now,
+    }
+    await collection.database.sync_state.update_one(
+        {'_id': collection.name},
+        {'$set': result},
+        upsert=True
+    )
+    return result
+
+
+async def load_destinations(collection) -> List[Dict[str, Any]]:
+    """Read the materialized rows back in RNT layout"""
+    return await collection.find({}, {field: 0 for field in SYNC_FIELDS}).to_list(None)
@@ -0,0 +1,137 @@
+"""Bitmap indexes for the department, category and municipality filters"""
+import copy
+from collections import defaultdict
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from search_index import fold_accents
+
+# Facet name -> destination field
+FACET_FIELDS = {
+    'department': 'nomdep',
+    'category': 'categoria',
+    'municipality': 'nombre_muni',
+}
+
+DEPARTMENT_DISPLAY = {'BOYACA': 'Boyacá', 'CUNDINAMARCA': 'Cundinamarca'}
+
+
+def positions_to_bitmap(positions: Sequence[int], size: int) -> int:
+    """Pack destination positions into an int whose bit i is set when position i matches"""
+    packed = bytearray((size + 7) // 8)
+    for position in positions:
+        packed[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(packed, 'little')
+
+
+def iter_positions(bitmap: int) -> Iterator[int]:
+    """Set bit positions in ascending order"""
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+class FacetIndex:
+    """One bitmap per facet value, so filter combinations resolve by AND-ing ints"""
+
+    def __init__(self, destinations: Sequence[Dict[str, Any]]):
+        self.size = len(destinations)
+        self.all = (1 << self.size) - 1
+
+        positions = {facet: defaultdict(list) for facet in FACET_FIELDS}
+        for position, dest in enumerate(destinations):
+            for facet, value in self._values(dest).items():
+                positions[facet][value].append(position)
+
+        self.bitmaps: Dict[str, Dict[str, int]] = {
+            facet: {value: positions_to_bitmap(found, self.size) for value, found in values.items()}
+            for facet, values in positions.items()
+        }
+        self._fold_values()
+
+    @staticmethod
+    def _values(dest: Dict[str, Any]) -> Dict[str, str]:
+        values = {}
+        for facet, field in FACET_FIELDS.items():
+            value = (dest.get(field) or '').strip()
+            values[facet] = value.upper() if facet == 'department' else value
+        return values
+
+    def _fold_values(self):
+        # Folded values for the accent and case insensitive substring filters
+        self._folded = {
+            facet: [(fold_accents(value), value) for value in values]
+            for facet, values in self.bitmaps.items()
+        }
+
+    def with_destination(self, position: int, dest: Dict[str, Any], replaced: Optional[Dict[str, Any]] = None) -> 'FacetIndex':
+        """Copy of the index with dest appended (position == size) or put in place of replaced"""
+        index = copy.copy(self)
+        index.bitmaps = {facet: dict(values) for facet, values in self.bitmaps.items()}
+        bit = 1 << position
+        if replaced is not None:
+            for facet, value in self._values(replaced).items():
+                remaining = index.bitmaps[facet][value] & ~bit
+                if remaining:
+                    index.bitmaps[facet][value] = remaining
+                else:
+                    del index.bitmaps[facet][value]
+        for facet, value in self._values(dest).items():
+            index.bitmaps[facet][value] = index.bitmaps[facet].get(value, 0) | bit
+        if position == self.size:
+            index.size += 1
+            index.all = (1 << index.size) - 1
+        index._fold_values()
+        return index
+
+    def match_department(self, department: str) -> Optional[int]:
+        """Bitmap for a department filter (unknown departments do not filter, as before)"""
+        requested = fold_accents(department.strip()).upper()
+        if requested in self.bitmaps['department'] or requested in DEPARTMENT_DISPLAY:
+            return self.bitmaps['department'].get(requested, 0)
+        return None
+
+    def match_contains(self, facet: str, text: str) -> int:
+        """Union of the bitmaps of every value containing text"""
+        needle = fold_accents(text)
+        bitmap = 0
+        for folded, value in self._folded[facet]:
+            if needle in folded:
+                bitmap |= self.bitmaps[facet][value]
+        return bitmap
+
+    def filter(
+        self,
+        department: Optional[str] = None,
+        category: Optional[str] = None,
+        municipality: Optional[str] = None,
+    ) -> Optional[int]:
+        """Intersect the requested filters, or None when nothing is filtered"""
+        bitmap = None
+        selections = []
+        if department:
+            selections.append(self.match_department(department))
+        if category:
+            selections.append(self.match_contains('category', category))
+        if municipality:
+            selections.append(self.match_contains('municipality', municipality))
+
+        for selection in selections:
+            if selection is None:
+                continue
+            bitmap = selection if bitmap is None else bitmap & selection
+        return bitmap
+
+    def counts(self, bitmap: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """Per-value counts of every facet within the given selection"""
+        selection = self.all if bitmap is None else bitmap
+        counts = {}
+        for facet, values in self.bitmaps.items():
+            facet_counts = {}
+            for value, value_bitmap in values.items():
+                count = (value_bitmap & selection).bit_count()
+                if count:
+                    label = DEPARTMENT_DISPLAY.get(value, value) if facet == 'department' else value
+                    facet_counts[label] = count
+            counts[facet] = dict(sorted(facet_counts.items(), key=lambda x: x[1], reverse=True))
+        return counts
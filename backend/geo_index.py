@@ -0,0 +1,176 @@
+"""In-memory grid index over geolocated destinations for radius queries
+
+Points are bucketed into fixed-size latitude/longitude cells. A query only
+visits the cells overlapping the radius' bounding box, drops candidates whose
+category does not match, and computes haversine distances with NumPy for the
+rest, so cost follows the density around the query point rather than the
+total number of points.
+"""
+import copy
+import math
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from search_index import fold_accents
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+# Cell size in degrees (about 5.5 km of latitude)
+DEFAULT_CELL_DEGREES = 0.05
+
+
+def geojson_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[Dict[str, Any]]:
+    """GeoJSON Point for a 2dsphere index (coordinates are [longitude, latitude])"""
+    if latitude is None or longitude is None:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoGridIndex:
+    """Destinations keyed by id, bucketed by grid cell, with a category code per point"""
+
+    def __init__(self, cell_degrees: float = DEFAULT_CELL_DEGREES, capacity: int = 1024):
+        self.cell_degrees = cell_degrees
+        self._latitudes = np.zeros(capacity, dtype=np.float64)
+        self._longitudes = np.zeros(capacity, dtype=np.float64)
+        self._category_codes = np.zeros(capacity, dtype=np.int32)
+        self._documents: List[Optional[Dict[str, Any]]] = []
+        self._slots: Dict[str, int] = {}
+        self._free_slots: List[int] = []
+        self._cells: Dict[Tuple[int, int], set] = defaultdict(set)
+        self._categories: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def copy(self) -> 'GeoGridIndex':
+        """Independent copy, so a new snapshot can add points while the current one serves"""
+        index = copy.copy(self)
+        index._latitudes = self._latitudes.copy()
+        index._longitudes = self._longitudes.copy()
+        index._category_codes = self._category_codes.copy()
+        index._documents = list(self._documents)
+        index._slots = dict(self._slots)
+        index._free_slots = list(self._free_slots)
+        index._cells = defaultdict(set, {cell: set(members) for cell, members in self._cells.items()})
+        index._categories = dict(self._categories)
+        return index
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def _category_code(self, category: str) -> int:
+        return self._categories.setdefault(fold_accents(category or '').strip(), len(self._categories))
+
+    def _slot(self) -> int:
+        if self._free_slots:
+            return self._free_slots.pop()
+        slot = len(self._documents)
+        if slot >= len(self._latitudes):
+            size = len(self._latitudes) * 2
+            self._latitudes = np.resize(self._latitudes, size)
+            self._longitudes = np.resize(self._longitudes, size)
+            self._category_codes = np.resize(self._category_codes, size)
+        self._documents.append(None)
+        return slot
+
+    def add(self, key: str, latitude: float, longitude: float, category: str, document: Dict[str, Any]):
+        """Insert or move a point"""
+        self.remove(key)
+        slot = self._slot()
+        self._latitudes[slot] = latitude
+        self._longitudes[slot] = longitude
+        self._category_codes[slot] = self._category_code(category)
+        self._documents[slot] = document
+        self._slots[key] = slot
+        self._cells[self._cell(latitude, longitude)].add(slot)
+
+    def remove(self, key: str):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        cell = self._cell(self._latitudes[slot], self._longitudes[slot])
+        self._cells[cell].discard(slot)
+        if not self._cells[cell]:
+            del self._cells[cell]
+        self._documents[slot] = None
+        self._free_slots.append(slot)
+
+    def _candidate_slots(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        lat_delta = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles; near them scan every longitude
+        cos_lat = math.cos(math.radians(min(abs(latitude) + lat_delta, 90.0)))
+        lon_delta = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-6 else 180.0
+        south, west = self._cell(latitude - lat_delta, longitude - min(lon_delta, 180.0))
+        north, east = self._cell(latitude + lat_delta, longitude + min(lon_delta, 180.0))
+
+        slots: List[int] = []
+        if (north - south + 1) * (east - west + 1) > len(self._cells):
+            # Radius larger than the populated area: walking the occupied cells is cheaper
+            for (row, column), members in self._cells.items():
+                if south <= row <= north and west <= column <= east:
+                    slots.extend(members)
+        else:
+            for row in range(south, north + 1):
+                for column in range(west, east + 1):
+                    slots.extend(self._cells.get((row, column), ()))
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        category: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """(document, distance_km) within radius_km, nearest first
+
+        category matches as an accent and case insensitive substring, like the
+        destination filters.
+        """
+        if limit <= 0 or radius_km <= 0:
+            return []
+        slots = self._candidate_slots(latitude, longitude, radius_km)
+        if category:
+            requested = fold_accents(category).strip()
+            codes = [code for name, code in self._categories.items() if requested in name]
+            slots = slots[np.isin(self._category_codes[slots], codes)]
+        if not len(slots):
+            return []
+
+        distances = haversine_km(latitude, longitude, self._latitudes[slots], self._longitudes[slots])
+        within = distances <= radius_km
+        slots, distances = slots[within], distances[within]
+        if len(slots) > limit:
+            best = np.argpartition(distances, limit - 1)[:limit]
+            slots, distances = slots[best], distances[best]
+        order = np.argsort(distances, kind='stable')
+        return [(self._documents[slot], float(distances[i])) for i, slot in zip(order, slots[order])]
+
+
+async def backfill_locations(collection) -> int:
+    """Derive the GeoJSON location of destinations stored with only latitude/longitude"""
+    result = await collection.update_many(
+        {
+            "location": {"$exists": False},
+            "latitude": {"$gte": -90, "$lte": 90},
+            "longitude": {"$gte": -180, "$lte": 180}
+        },
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+    )
+    return result.modified_count
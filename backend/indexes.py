@@ -0,0 +1,194 @@
+"""Declared MongoDB indexes, created at startup, and a query-plan check for the endpoint queries
+
+Run `python indexes.py --check` to create the indexes and fail (exit code 1)
+if any endpoint query falls back to a collection scan.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+
+from trend_rollups import HOUR_BUCKET_RETENTION_DAYS
+
+# Indexes required by the queries in server.py, per collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    'destinations': [
+        IndexModel([('rnt', ASCENDING)], unique=True),
+    ],
+    'user_preferences': [
+        IndexModel([('id', ASCENDING)], unique=True),
+    ],
+    'user_interactions': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING), ('action', ASCENDING)]),
+        IndexModel([('action', ASCENDING), ('destination_rnt', ASCENDING)]),
+        IndexModel([('processed', ASCENDING)], partialFilterExpression={'processed': False}),
+    ],
+    'point_transactions': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING), ('timestamp', DESCENDING)]),
+        IndexModel([('applied', ASCENDING)], partialFilterExpression={'applied': False}),
+    ],
+    'user_balances': [
+        IndexModel([('user_id', ASCENDING)], unique=True),
+    ],
+    'rewards': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('active', ASCENDING), ('points_required', ASCENDING)]),
+    ],
+    'user_destinations': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('approved_at', DESCENDING)]),
+        IndexModel([('location', GEOSPHERE)]),
+    ],
+    'item_neighbors': [
+        IndexModel([('rnt', ASCENDING)], unique=True),
+    ],
+    'trend_rollups': [
+        IndexModel([('granularity', ASCENDING), ('bucket', ASCENDING), ('dimension', ASCENDING), ('value', ASCENDING)], unique=True),
+        # Hour buckets expire; buckets are naive local times, so expiry is off by the UTC offset
+        IndexModel(
+            [('bucket', ASCENDING)],
+            name='hour_bucket_ttl',
+            expireAfterSeconds=HOUR_BUCKET_RETENTION_DAYS * 24 * 3600,
+            partialFilterExpression={'granularity': 'hour'}
+        ),
+    ],
+    'redemptions': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('redeemed_at', ASCENDING)]),
+    ],
+}
+
+# Indexes created by earlier versions that no query uses any more, dropped at startup
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    # The fallback path reads the whole destinations collection, filters run on the snapshot
+    'destinations': ['nomdep_1', 'categoria_1', 'subcategoria_1', 'nombre_muni_1'],
+    # item_neighbors is swapped in whole by renaming a freshly built collection
+    'item_neighbors': ['built_at_1'],
+}
+
+# Representative endpoint queries as explain commands (sample values are irrelevant to the plan)
+QUERY_PLANS: List[Dict[str, Any]] = [
+    {'name': 'recommendations: user preferences', 'explain': {'find': 'user_preferences', 'filter': {'id': 'sample'}}},
+    {'name': 'recommendations: user interactions', 'explain': {'find': 'user_interactions', 'filter': {'user_id': 'sample'}}},
+    {'name': 'recommendations: similar user likes', 'explain': {
+        'find': 'user_interactions', 'filter': {'user_id': {'$in': ['sample']}, 'action': 'like'}
+    }},
+    {'name': 'recommendations: item neighbours', 'explain': {'find': 'item_neighbors', 'filter': {'rnt': {'$in': ['sample']}}}},
+    {'name': 'trends: rollup range', 'explain': {'aggregate': 'trend_rollups', 'cursor': {}, 'pipeline': [
+        {'$match': {'granularity': 'day'}},
+        {'$group': {'_id': {'dimension': '$dimension', 'value': '$value'}, 'count': {'$sum': '$count'}}},
+    ]}},
+    {'name': 'interactions: unprocessed sweep', 'explain': {'find': 'user_interactions', 'filter': {'processed': False}}},
+    {'name': 'popular destinations: rebuild', 'explain': {
+        'find': 'user_interactions', 'filter': {'action': {'$in': ['like', 'view']}},
+        'projection': {'_id': 0, 'action': 1, 'destination_rnt': 1, 'timestamp': 1}
+    }},
+    {'name': 'points: balance', 'explain': {'find': 'user_balances', 'filter': {'user_id': 'sample'}}},
+    {'name': 'points: ledger total', 'explain': {'aggregate': 'point_transactions', 'cursor': {}, 'pipeline': [
+        {'$match': {'user_id': 'sample'}},
+        {'$group': {'_id': None, 'total_points': {'$sum': '$points'}}},
+    ]}},
+    {'name': 'points: pending transactions', 'explain': {'find': 'point_transactions', 'filter': {'applied': False}}},
+    {'name': 'points: recent transactions', 'explain': {
+        'find': 'point_transactions', 'filter': {'user_id': 'sample'}, 'sort': {'timestamp': -1}, 'limit': 20
+    }},
+    {'name': 'redemptions: pending sweep', 'explain': {
+        'find': 'redemptions', 'filter': {'status': 'pending', 'redeemed_at': {'$lt': datetime(2000, 1, 1)}}
+    }},
+    {'name': 'rewards: active', 'explain': {'find': 'rewards', 'filter': {'active': True}, 'sort': {'points_required': 1}}},
+    {'name': 'rewards: by id', 'explain': {'find': 'rewards', 'filter': {'id': 'sample'}}},
+    {'name': 'user destinations: by user', 'explain': {'find': 'user_destinations', 'filter': {'user_id': 'sample'}}},
+    {'name': 'user destinations: by id', 'explain': {'find': 'user_destinations', 'filter': {'id': 'sample'}}},
+    {'name': 'user destinations: approved', 'explain': {
+        'find': 'user_destinations', 'filter': {'status': 'approved'}, 'sort': {'approved_at': -1}, 'limit': 50
+    }},
+    {'name': 'destinations: by rnt', 'explain': {'find': 'destinations', 'filter': {'rnt': 'sample'}}},
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every declared index and drop obsolete ones (idempotent), return the index names per collection"""
+    created = {}
+    for collection, models in INDEXES.items():
+        created[collection] = await db[collection].create_indexes(models)
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+    return created
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """Every stage name found anywhere in an explain output"""
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get('stage'), str):
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+async def check_query_plans(db) -> List[Dict[str, Any]]:
+    """Explain each endpoint query and report the stages of its winning plan"""
+    report = []
+    for query in QUERY_PLANS:
+        explain = await db.command({'explain': query['explain'], 'verbosity': 'queryPlanner'})
+        winning = plan_stages(_find_key(explain, 'winningPlan'))
+        report.append({
+            'name': query['name'],
+            'stages': winning,
+            'collscan': 'COLLSCAN' in winning,
+        })
+    return report
+
+
+def _find_key(document: Any, key: str) -> List[Any]:
+    """Values of key at any depth (aggregate explains nest the query planner under $cursor)"""
+    found = []
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                found.append(value)
+            else:
+                found.extend(_find_key(value, key))
+    elif isinstance(document, list):
+        for value in document:
+            found.extend(_find_key(value, key))
+    return found
+
+
+async def main(check: bool) -> int:
+    from database import db
+
+    created = await ensure_indexes(db)
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names)}")
+
+    if not check:
+        return 0
+
+    failures = 0
+    for result in await check_query_plans(db):
+        status = 'COLLSCAN' if result['collscan'] else 'ok'
+        failures += result['collscan']
+        print(f"[{status}] {result['name']}: {' > '.join(result['stages'])}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--check', action='store_true', help='explain the endpoint queries and fail on COLLSCAN')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.check)))
@@ -0,0 +1,149 @@
+"""Interaction events and the point transactions they award, written in bulk
+
+Interactions are stored with processed=False. Everything that follows the
+insert (points, rollups) is derived from the stored events and
+the flag is set last, so a retried batch finishes the events an earlier
+attempt left unprocessed instead of skipping them as duplicates. Events that
+are never retried are finished by the sweep in server.py.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from points import apply_transactions, build_transaction
+
+# Points awarded per interaction type
+POINTS_BY_ACTION = {
+    'like': 3,
+    'view': 1,
+    'save': 2
+}
+
+POINT_DESCRIPTIONS = {
+    'like': 'Me gusta en destino',
+    'view': 'Visualización de destino',
+    'save': 'Destino guardado'
+}
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Namespace of the ledger ids derived from interaction ids
+INTERACTION_TRANSACTIONS = uuid.UUID('688da7cf-6d46-47e6-b536-aff49fe5560b')
+
+
+def interaction_points(action: str) -> int:
+    return POINTS_BY_ACTION.get(action, 0)
+
+
+def build_points_transaction(interaction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Point transaction awarded for one interaction, or None if the action earns nothing
+
+    Its id is derived from the interaction id, so every attempt writes the same ledger row.
+    """
+    points = interaction_points(interaction['action'])
+    if points <= 0:
+        return None
+    return build_transaction(
+        interaction['user_id'],
+        points,
+        f"interaction_{interaction['action']}",
+        POINT_DESCRIPTIONS.get(interaction['action'], 'Interacción con destino'),
+        interaction['destination_rnt'],
+        str(uuid.uuid5(INTERACTION_TRANSACTIONS, interaction['id']))
+    )
+
+
+def _duplicate_positions(error: BulkWriteError) -> Set[int]:
+    positions = set()
+    for write_error in error.details.get('writeErrors', []):
+        if write_error.get('code') != DUPLICATE_KEY_ERROR:
+            raise error
+        positions.add(write_error['index'])
+    return positions
+
+
+async def insert_interactions(db, interactions: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Set[int]]:
+    """Insert interactions flagged unprocessed with one insert_many
+
+    Returns the events to process, i.e. the new ones plus the stored copies of
+    repeated ids that an earlier attempt did not finish, and the positions of
+    the repeated ids that were already processed.
+    """
+    documents = [{**interaction, 'processed': False} for interaction in interactions]
+    repeated = set()
+    try:
+        await db.user_interactions.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        repeated = _duplicate_positions(e)
+
+    pending = []
+    seen = set()
+    earlier_ids = {}
+    for position, document in enumerate(documents):
+        if position not in repeated:
+            pending.append(document)
+            seen.add(document['id'])
+        elif document['id'] not in seen:
+            seen.add(document['id'])
+            earlier_ids[document['id']] = position
+
+    duplicates = repeated
+    if earlier_ids:
+        unfinished = await db.user_interactions.find(
+            {"id": {"$in": list(earlier_ids)}, "processed": False}, {"_id": 0}
+        ).to_list(None)
+        pending.extend(unfinished)
+        duplicates = repeated - {earlier_ids[document['id']] for document in unfinished}
+    return pending, duplicates
+
+
+async def award_points(db, interactions: List[Dict[str, Any]]):
+    """Write the ledger rows of the interactions (ids already in the ledger are kept) and apply them"""
+    transactions = [
+        transaction
+        for transaction in map(build_points_transaction, interactions)
+        if transaction is not None
+    ]
+    if not transactions:
+        return
+    try:
+        await db.point_transactions.insert_many(transactions, ordered=False)
+    except BulkWriteError as e:
+        _duplicate_positions(e)
+    # Balances skip the ids they already applied
+    await apply_transactions(db, transactions)
+
+
+async def persist_interactions(db, interactions: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Set[int]]:
+    """Store interactions and award their points
+
+    Returns the events whose processing must still be finished with
+    mark_processed, and the positions of already processed duplicates, which
+    earn no points.
+    """
+    if not interactions:
+        return [], set()
+    pending, duplicates = await insert_interactions(db, interactions)
+    await award_points(db, pending)
+    return pending, duplicates
+
+
+async def mark_processed(db, interactions: List[Dict[str, Any]]):
+    """Flag interactions whose points and rollups have both been recorded"""
+    if interactions:
+        await db.user_interactions.update_many(
+            {"id": {"$in": [interaction['id'] for interaction in interactions]}},
+            {"$set": {"processed": True}}
+        )
+
+
+async def unprocessed_interactions(db, older_than: float) -> List[Dict[str, Any]]:
+    """Stored interactions still unprocessed older_than seconds after their insert (nobody retried them)"""
+    # The _id records the insert time; client timestamps of offline events can be much older
+    cutoff = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=older_than))
+    return await db.user_interactions.find(
+        {"processed": False, "_id": {"$lt": cutoff}}, {"_id": 0}
+    ).to_list(None)
@@ -0,0 +1,186 @@
+"""Item-item collaborative filtering: top-N co-interaction neighbours per destination
+
+An offline job builds a sparse user x destination matrix from user_interactions,
+computes cosine similarity between destination columns and stores the best
+neighbours of each rnt in item_neighbors. Recommendations then only read the
+neighbour lists of the destinations a user already interacted with.
+
+Run `python item_neighbors.py [--top N]` to rebuild the table, e.g. from cron;
+the API workers only rebuild it when ITEM_NEIGHBORS_REBUILD_SECONDS is set.
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from indexes import INDEXES
+
+# Strength of each interaction type; a user's weight for a destination is their strongest action
+INTERACTION_WEIGHTS = {
+    'view': 1.0,
+    'save': 2.0,
+    'like': 3.0
+}
+
+# Neighbours kept per destination
+DEFAULT_TOP_NEIGHBORS = 20
+
+WRITE_BATCH_SIZE = 1000
+
+
+def interaction_weights(interactions: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], float]:
+    """Strongest interaction weight per (user_id, destination_rnt)"""
+    weights: Dict[Tuple[str, str], float] = {}
+    for interaction in interactions:
+        weight = INTERACTION_WEIGHTS.get(interaction.get('action'), 0.0)
+        if weight <= 0 or not interaction.get('user_id') or not interaction.get('destination_rnt'):
+            continue
+        key = (interaction['user_id'], interaction['destination_rnt'])
+        if weight > weights.get(key, 0.0):
+            weights[key] = weight
+    return weights
+
+
+def compute_item_neighbors(
+    weights: Dict[Tuple[str, str], float],
+    top_n: int = DEFAULT_TOP_NEIGHBORS,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Cosine similarity between destination columns of the user x destination matrix"""
+    if not weights:
+        return {}
+
+    users: Dict[str, int] = {}
+    items: Dict[str, int] = {}
+    rows, columns, values = [], [], []
+    for (user_id, rnt), weight in weights.items():
+        rows.append(users.setdefault(user_id, len(users)))
+        columns.append(items.setdefault(rnt, len(items)))
+        values.append(weight)
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, columns)),
+        shape=(len(users), len(items))
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = matrix @ sparse.diags(1.0 / norms).astype(np.float32)
+    # Only destinations sharing at least one user get a non-zero entry
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    rnts = [None] * len(items)
+    for rnt, column in items.items():
+        rnts[column] = rnt
+
+    neighbors = {}
+    for column in range(similarity.shape[0]):
+        start, end = similarity.indptr[column], similarity.indptr[column + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        others = similarity.indices[start:end]
+        if len(scores) > top_n:
+            best = np.argpartition(-scores, top_n - 1)[:top_n]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        neighbors[rnts[column]] = [
+            {"rnt": rnts[others[i]], "score": round(float(scores[i]), 6)}
+            for i in best
+        ]
+    return neighbors
+
+
+def weights_pipeline() -> List[Dict[str, Any]]:
+    """Strongest interaction weight per (user_id, destination_rnt), grouped by MongoDB"""
+    return [
+        {"$match": {
+            "action": {"$in": list(INTERACTION_WEIGHTS)},
+            "user_id": {"$nin": [None, ""]},
+            "destination_rnt": {"$nin": [None, ""]}
+        }},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "rnt": "$destination_rnt"},
+            "weight": {"$max": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$action", action]}, "then": weight}
+                    for action, weight in INTERACTION_WEIGHTS.items()
+                ],
+                "default": 0
+            }}}
+        }}
+    ]
+
+
+async def rebuild_item_neighbors(db, top_n: int = DEFAULT_TOP_NEIGHBORS) -> Dict[str, Any]:
+    """Recompute the neighbour table from user_interactions and swap it in atomically
+
+    The table is written to a collection of its own and renamed over
+    item_neighbors, so readers never see a partial table and concurrent
+    rebuilds cannot delete each other's rows (the last rename wins).
+    """
+    started = datetime.now()
+    weights = {}
+    async for pair in db.user_interactions.aggregate(weights_pipeline(), allowDiskUse=True):
+        weights[(pair["_id"]["user_id"], pair["_id"]["rnt"])] = pair["weight"]
+    neighbors = await asyncio.to_thread(compute_item_neighbors, weights, top_n)
+
+    staging = db[f"item_neighbors_build_{uuid.uuid4().hex}"]
+    try:
+        await staging.create_indexes(INDEXES['item_neighbors'])
+        documents = [{"rnt": rnt, "neighbors": items, "built_at": started} for rnt, items in neighbors.items()]
+        for offset in range(0, len(documents), WRITE_BATCH_SIZE):
+            await staging.insert_many(documents[offset:offset + WRITE_BATCH_SIZE], ordered=False)
+        await staging.rename('item_neighbors', dropTarget=True)
+    except BaseException:
+        await staging.drop()
+        raise
+
+    return {
+        "pairs": len(weights),
+        "destinations": len(neighbors),
+        "seconds": round((datetime.now() - started).total_seconds(), 3),
+    }
+
+
+async def score_from_history(db, history: Dict[str, float], exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+    """Rank unseen destinations by similarity to the user's weighted history
+
+    One $in query over the user's own destinations, so the cost follows the
+    size of the history rather than the catalog or the user base.
+    """
+    if not history:
+        return []
+    seen = set(exclude) | set(history)
+    scores = defaultdict(float)
+    async for doc in db.item_neighbors.find({"rnt": {"$in": list(history)}}, {"_id": 0, "rnt": 1, "neighbors": 1}):
+        weight = history.get(doc["rnt"], 0.0)
+        for neighbor in doc.get("neighbors", []):
+            if neighbor["rnt"] not in seen:
+                scores[neighbor["rnt"]] += weight * neighbor["score"]
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+async def main(top_n: int) -> int:
+    from database import db
+
+    result = await rebuild_item_neighbors(db, top_n)
+    print(
+        f"{result['destinations']} destinations with neighbours from {result['pairs']} user/destination pairs "
+        f"in {result['seconds']}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_NEIGHBORS, help='neighbours kept per destination')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.top)))
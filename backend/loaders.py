@@ -0,0 +1,85 @@
+"""Batched lookups (DataLoader style) that turn N key lookups into one $in query
+
+Every load() made while the event loop runs the same batch of callbacks is
+collected and resolved with a single query; results are memoized for the
+lifetime of the loaders (one recommendation computation).
+"""
+import asyncio
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+class DataLoader:
+    """Batch and memoize key lookups; batch_fn maps a list of keys to {key: value}"""
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]], default: Any = None):
+        self._batch_fn = batch_fn
+        self._default = default
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._dispatches = set()
+        self.batches = 0
+
+    def load(self, key: Hashable) -> 'asyncio.Future':
+        future = self._cache.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[key] = future
+        if not self._pending:
+            # Resolve once the callers currently running have queued their keys
+            loop.call_soon(self._schedule_dispatch)
+        self._pending[key] = future
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _schedule_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        self.batches += 1
+        try:
+            found = await self._batch_fn(list(pending))
+        except Exception as e:
+            for key, future in pending.items():
+                # Failed keys are retried by the next load instead of caching the error
+                self._cache.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(key, self._default))
+
+
+def find_one_by(collection, field: str, projection: Optional[Dict[str, Any]] = None) -> DataLoader:
+    """Loader of the document whose field equals each key"""
+    async def batch(keys):
+        return {doc[field]: doc async for doc in collection.find({field: {"$in": keys}}, projection)}
+    return DataLoader(batch)
+
+
+def find_many_by(collection, field: str, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> DataLoader:
+    """Loader of every document (matching query) whose field equals each key"""
+    async def batch(keys):
+        grouped = defaultdict(list)
+        async for doc in collection.find({**(query or {}), field: {"$in": keys}}, projection):
+            grouped[doc[field]].append(doc)
+        return grouped
+    return DataLoader(batch, default=[])
+
+
+class RecommendationLoaders:
+    """Loaders shared by every lookup of one recommendation computation"""
+
+    def __init__(self, db):
+        self.user_preferences = find_one_by(db.user_preferences, 'id')
+        self.user_interactions = find_many_by(db.user_interactions, 'user_id')
+        self.user_likes = find_many_by(db.user_interactions, 'user_id', {'action': 'like'})
+
@@ -0,0 +1,392 @@
+"""Points ledger (point_transactions) and the materialized per-user balance (user_balances)
+
+Every transaction is inserted into the ledger first and then applied to the
+balance with an $inc keyed by its id, so a retry or the startup sweep can
+finish a transaction without counting it twice.
+
+Run `python points.py reconcile [--fix]` to compare every balance against the ledger.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+
+# Ids of the most recent transactions applied to a balance, kept on the balance document
+# so applying the same transaction twice (a retry, the pending sweep) is a no-op
+APPLIED_IDS_WINDOW = int(os.environ.get('APPLIED_IDS_WINDOW', '1000'))
+
+# Seconds a redemption may stay pending before the sweep completes or rolls it back
+REDEMPTION_RECONCILE_AFTER_SECONDS = int(os.environ.get('REDEMPTION_RECONCILE_AFTER_SECONDS', '600'))
+
+
+def build_transaction(
+    user_id: str,
+    points: int,
+    transaction_type: str,
+    description: str,
+    reference_id: Optional[str] = None,
+    transaction_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    return {
+        "id": transaction_id or str(uuid.uuid4()),
+        "user_id": user_id,
+        "points": points,
+        "transaction_type": transaction_type,
+        "description": description,
+        "reference_id": reference_id,
+        "timestamp": datetime.now(),
+        # Set once the points are in user_balances; pending rows are applied by the sweep
+        "applied": False
+    }
+
+
+async def ledger_total(db, user_id: str) -> int:
+    """Sum of the user's applied transactions (rows written before the flag existed count as applied)"""
+    pipeline = [
+        {"$match": {"user_id": user_id, "applied": {"$ne": False}}},
+        {"$group": {"_id": None, "total_points": {"$sum": "$points"}}}
+    ]
+    result = await db.point_transactions.aggregate(pipeline).to_list(None)
+    return result[0]["total_points"] if result else 0
+
+
+async def initialize_balance(db, user_id: str) -> int:
+    """Create the balance of a user that predates user_balances from the applied ledger rows
+
+    A transaction is only flagged applied after it reached an existing
+    balance, so rows still pending are left for apply_transactions.
+    """
+    total = await ledger_total(db, user_id)
+    await db.user_balances.update_one(
+        {"user_id": user_id},
+        {"$setOnInsert": {"balance": total, "applied_ids": [], "updated_at": datetime.now()}},
+        upsert=True
+    )
+    doc = await db.user_balances.find_one({"user_id": user_id}, {"balance": 1})
+    return doc["balance"] if doc else total
+
+
+def balance_update(
+    transaction: Dict[str, Any],
+    condition: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Filter and update that $inc one transaction into its balance unless its id is already applied"""
+    return (
+        {"user_id": transaction["user_id"], "applied_ids": {"$ne": transaction["id"]}, **(condition or {})},
+        {
+            "$inc": {"balance": transaction["points"]},
+            "$push": {"applied_ids": {"$each": [transaction["id"]], "$slice": -APPLIED_IDS_WINDOW}},
+            "$set": {"updated_at": datetime.now()}
+        }
+    )
+
+
+async def apply_transactions(db, transactions: List[Dict[str, Any]]):
+    """Apply ledger rows to their balances exactly once, then flag them applied
+
+    Each $inc is conditional on the transaction id, so a retry after a
+    failure between the ledger insert and this call does not count twice.
+    """
+    if not transactions:
+        return
+    user_ids = list({transaction["user_id"] for transaction in transactions})
+    existing = {
+        doc["user_id"]
+        async for doc in db.user_balances.find({"user_id": {"$in": user_ids}}, {"user_id": 1})
+    }
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        await asyncio.gather(*(initialize_balance(db, user_id) for user_id in missing))
+
+    await db.user_balances.bulk_write(
+        [UpdateOne(*balance_update(transaction)) for transaction in transactions], ordered=False
+    )
+    await db.point_transactions.update_many(
+        {"id": {"$in": [transaction["id"] for transaction in transactions]}},
+        {"$set": {"applied": True}}
+    )
+
+
+async def apply_pending_transactions(db) -> int:
+    """Apply every ledger row left unapplied by a failure after its insert"""
+    pending = await db.point_transactions.find({"applied": False}, {"_id": 0}).to_list(None)
+    await apply_transactions(db, pending)
+    return len(pending)
+
+
+async def record_transaction(
+    db,
+    user_id: str,
+    points: int,
+    transaction_type: str,
+    description: str,
+    reference_id: Optional[str] = None,
+    transaction_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Append a transaction to the ledger and apply it to the user's balance
+
+    Passing a deterministic transaction_id makes a retried call idempotent.
+    """
+    transaction = build_transaction(user_id, points, transaction_type, description, reference_id, transaction_id)
+    try:
+        await db.point_transactions.insert_one(transaction)
+    except DuplicateKeyError:
+        # Written by an earlier attempt: finish applying the stored row
+        transaction = await db.point_transactions.find_one({"id": transaction["id"]}, {"_id": 0})
+        if transaction.get("applied", True):
+            return transaction
+    await apply_transactions(db, [transaction])
+    return transaction
+
+
+async def get_balance(db, user_id: str) -> int:
+    """Current points from user_balances (one indexed read)"""
+    doc = await db.user_balances.find_one({"user_id": user_id}, {"balance": 1})
+    if doc is None:
+        return await initialize_balance(db, user_id)
+    return doc["balance"]
+
+
+class RedemptionError(Exception):
+    """A redemption rejected by one of the conditional writes"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def reserve_reward(db, reward_id: str) -> Dict[str, Any]:
+    """Take one unit of stock with a conditional $inc that checks active and max_redemptions"""
+    reward = await db.rewards.find_one_and_update(
+        {
+            "id": reward_id,
+            "active": True,
+            "$or": [
+                # A missing or zero max_redemptions means unlimited stock
+                {"max_redemptions": {"$in": [None, 0]}},
+                {"$expr": {"$lt": ["$current_redemptions", "$max_redemptions"]}}
+            ]
+        },
+        {"$inc": {"current_redemptions": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if reward is not None:
+        return reward
+
+    # Only the failure path pays for a read, to explain why
+    existing = await db.rewards.find_one({"id": reward_id}, {"active": 1})
+    if not existing:
+        raise RedemptionError(404, "Reward not found")
+    if not existing.get("active"):
+        raise RedemptionError(400, "Reward is not active")
+    raise RedemptionError(400, "Reward redemption limit reached")
+
+
+async def debit_balance(db, transaction: Dict[str, Any]) -> bool:
+    """Apply a negative transaction only if the balance covers it, in a single conditional update"""
+    query, update = balance_update(transaction, {"balance": {"$gte": -transaction["points"]}})
+    for _ in range(2):
+        result = await db.user_balances.update_one(query, update)
+        if result.modified_count:
+            return True
+        # Retry once if the user simply has no balance document yet
+        if await db.user_balances.count_documents({"user_id": transaction["user_id"]}, limit=1):
+            return False
+        await initialize_balance(db, transaction["user_id"])
+    return False
+
+
+def redemption_transaction(redemption: Dict[str, Any], reward: Dict[str, Any]) -> Dict[str, Any]:
+    transaction = build_transaction(
+        redemption["user_id"],
+        -reward["points_required"],
+        'redeem_reward',
+        f'Canjeado: {reward["title"]}',
+        reward["id"],
+        redemption["transaction_id"]
+    )
+    # Written after the debit, which already applied it
+    transaction["applied"] = True
+    return transaction
+
+
+async def complete_redemption(db, redemption: Dict[str, Any], reward: Dict[str, Any]) -> Dict[str, Any]:
+    """Ledger row, then activation of a debited redemption (each idempotent)
+
+    The redemption stays pending until its ledger row exists, so the sweep
+    finishes any redemption interrupted in between.
+    """
+    try:
+        await db.point_transactions.insert_one(redemption_transaction(redemption, reward))
+    except DuplicateKeyError:
+        pass
+    completed = {"status": "active", "points_spent": reward["points_required"], "expires_at": reward.get("valid_until")}
+    await db.redemptions.update_one({"id": redemption["id"], "status": "pending"}, {"$set": completed})
+    return {**redemption, **completed}
+
+
+async def fail_redemption(db, redemption: Dict[str, Any]) -> bool:
+    """Mark a pending redemption failed and give back its unit of stock, at most once
+
+    Only the caller whose update moves the redemption out of pending
+    releases the unit, so a request and a sweep failing it together release
+    it once.
+    """
+    failed = await db.redemptions.find_one_and_update(
+        {"id": redemption["id"], "status": "pending"},
+        {"$set": {"status": "failed"}},
+        projection={"_id": 1}
+    )
+    if failed is None:
+        return False
+    await db.rewards.update_one({"id": redemption["reward_id"]}, {"$inc": {"current_redemptions": -1}})
+    return True
+
+
+async def redeem_reward(db, user_id: str, reward_id: str) -> Dict[str, Any]:
+    """Redeem a reward without read-then-write races, in steps a sweep can finish
+
+    1. one unit of stock is reserved (conditional on active and max_redemptions)
+    2. the redemption is recorded as pending, with the id of its ledger transaction
+    3. the balance is debited (conditional on covering the cost, keyed by the transaction id)
+    4. the ledger row is written and the redemption activated
+
+    The reward document gets a single conditional $inc per redemption, so
+    concurrent redemptions can neither exceed max_redemptions nor overspend
+    points. Every pending redemption holds a unit: a rejected debit releases
+    it, and a crash leaves a pending redemption that reconcile_redemptions
+    completes or rolls back. A crash between steps 1 and 2 keeps the unit
+    reserved (stock is never oversold, at worst one unit is lost).
+    """
+    reward = await reserve_reward(db, reward_id)
+
+    redemption = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "reward_id": reward_id,
+        "transaction_id": str(uuid.uuid4()),
+        "points_spent": None,
+        "status": "pending",
+        "redeemed_at": datetime.now(),
+        "expires_at": None
+    }
+    await db.redemptions.insert_one(redemption)
+    redemption.pop("_id", None)
+
+    if not await debit_balance(db, redemption_transaction(redemption, reward)):
+        await fail_redemption(db, redemption)
+        raise RedemptionError(400, "Insufficient points")
+
+    redemption = await complete_redemption(db, redemption, reward)
+    return {"reward": reward, "redemption": redemption}
+
+
+async def reconcile_redemptions(db, older_than: float = REDEMPTION_RECONCILE_AFTER_SECONDS) -> Dict[str, int]:
+    """Finish redemptions left pending by a crash: complete the debited ones, roll back the rest
+
+    Only redemptions pending for more than older_than seconds are touched, so
+    requests still in flight are left alone. Every step is idempotent or
+    gated on the pending status, so several workers may sweep at the same time.
+    """
+    cutoff = datetime.now() - timedelta(seconds=older_than)
+    result = {"completed": 0, "rolled_back": 0}
+    async for redemption in db.redemptions.find({"status": "pending", "redeemed_at": {"$lt": cutoff}}, {"_id": 0}):
+        transaction_id = redemption["transaction_id"]
+        debited = (
+            await db.point_transactions.count_documents({"id": transaction_id}, limit=1)
+            or await db.user_balances.count_documents(
+                {"user_id": redemption["user_id"], "applied_ids": transaction_id}, limit=1
+            )
+        )
+        if debited:
+            reward = await db.rewards.find_one({"id": redemption["reward_id"]}, {"_id": 0})
+            if reward is None:
+                # The ledger row needs the reward's title and cost
+                print(f"Redemption {redemption['id']} was debited but its reward no longer exists")
+                continue
+            await complete_redemption(db, redemption, reward)
+            result["completed"] += 1
+        elif await fail_redemption(db, redemption):
+            result["rolled_back"] += 1
+    return result
+
+
+async def reconcile_balances(db, fix: bool = False) -> List[Dict[str, Any]]:
+    """Compare every materialized balance with its applied ledger rows and optionally repair drift
+
+    A repair only lands if the balance still holds the value that was
+    compared, so an $inc applied in between is never overwritten (the
+    balance is reported again on the next run instead).
+    """
+    ledger = {
+        item["_id"]: item["total_points"]
+        async for item in db.point_transactions.aggregate([
+            # Pending rows are not in the balance yet (same rule as ledger_total)
+            {"$match": {"applied": {"$ne": False}}},
+            {"$group": {"_id": "$user_id", "total_points": {"$sum": "$points"}}}
+        ])
+    }
+    balances = {
+        doc["user_id"]: doc.get("balance", 0)
+        async for doc in db.user_balances.find({}, {"user_id": 1, "balance": 1})
+    }
+
+    mismatches = []
+    for user_id in set(ledger) | set(balances):
+        expected = ledger.get(user_id, 0)
+        actual = balances.get(user_id)
+        if actual != expected:
+            mismatch = {"user_id": user_id, "balance": actual, "ledger": expected}
+            if fix:
+                mismatch["fixed"] = await repair_balance(db, user_id, actual, expected)
+            mismatches.append(mismatch)
+    return mismatches
+
+
+async def repair_balance(db, user_id: str, observed: Optional[int], expected: int) -> bool:
+    """Set the balance to the ledger sum if it still equals the observed value (create it if missing)"""
+    if observed is None:
+        result = await db.user_balances.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": {"balance": expected, "applied_ids": [], "updated_at": datetime.now()}},
+            upsert=True
+        )
+        return result.upserted_id is not None
+    result = await db.user_balances.update_one(
+        {"user_id": user_id, "balance": observed},
+        {"$set": {"balance": expected, "updated_at": datetime.now()}}
+    )
+    return result.modified_count == 1
+
+
+async def main(fix: bool) -> int:
+    from database import db
+
+    if fix:
+        applied = await apply_pending_transactions(db)
+        print(f"{applied} pending transactions applied")
+        redemptions = await reconcile_redemptions(db)
+        print(f"Pending redemptions: {redemptions}")
+    mismatches = await reconcile_balances(db, fix=fix)
+    for item in mismatches:
+        changed = " (changed meanwhile, not fixed)" if fix and not item["fixed"] else ""
+        print(f"{item['user_id']}: balance={item['balance']} ledger={item['ledger']}{changed}")
+    unfixed = [item for item in mismatches if not item.get("fixed")]
+    print(f"{len(mismatches)} mismatched balances, {len(mismatches) - len(unfixed)} fixed")
+    return 1 if unfixed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['reconcile'])
+    parser.add_argument('--fix', action='store_true', help='overwrite drifted balances with the ledger sum')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.fix)))
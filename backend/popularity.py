@@ -0,0 +1,162 @@
+"""Streaming top-K of popular destinations (Space-Saving), all time and time-decayed "trending"
+
+Both summaries keep at most `capacity` counters, so memory stays bounded no
+matter how many interactions arrive. Trending uses forward exponential decay:
+each event is weighted by exp((t - landmark) / tau), which keeps the ranking
+stable between events and only needs a rescale when the weights grow large.
+
+Trackers read user_interactions in _id order: one full pass at startup, then
+catch_up() only reads what was inserted since, so every worker counts the
+events of all workers exactly once.
+"""
+import heapq
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from bson import ObjectId
+
+# Interactions that count towards popularity
+POPULAR_ACTIONS = ['like', 'view']
+
+POPULARITY_CAPACITY = int(os.environ.get('POPULARITY_CAPACITY', '1000'))
+# Hours after which an interaction weighs half as much in the trending ranking
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '24'))
+
+# Seconds an insert may lag behind its _id (ObjectIds are generated by each worker),
+# so catch_up() stops this far behind the present and misses no late insert
+CATCH_UP_LAG_SECONDS = float(os.environ.get('POPULARITY_CATCH_UP_LAG_SECONDS', '5'))
+
+CATCH_UP_BATCH_SIZE = 1000
+
+# Rescale trending counters once event weights exceed exp(RESCALE_EXPONENT)
+RESCALE_EXPONENT = 50.0
+
+WINDOWS = ('all', 'trending')
+
+
+class SpaceSaving:
+    """Approximate heavy hitters: a new item replaces the smallest counter and inherits its count
+
+    Every item whose true count exceeds total / capacity is guaranteed to be
+    tracked; a tracked count overestimates the truth by at most its error.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, float] = {}
+        self.errors: Dict[Hashable, float] = {}
+        # Min-heap of (count, item); entries left behind by increments are skipped lazily
+        self._heap: List[Tuple[float, Hashable]] = []
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add(self, item: Hashable, weight: float = 1.0):
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0.0
+        else:
+            victim, floor = self._pop_min()
+            del self.counts[victim]
+            del self.errors[victim]
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _pop_min(self) -> Tuple[Hashable, float]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item, count
+
+    def _rebuild_heap(self):
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def scale(self, factor: float):
+        """Multiply every counter (used to renormalize decayed weights)"""
+        for item in self.counts:
+            self.counts[item] *= factor
+            self.errors[item] *= factor
+        self._rebuild_heap()
+
+    def top(self, k: int) -> List[Tuple[Hashable, float, float]]:
+        """(item, count, error) of the k largest counters"""
+        best = heapq.nlargest(k, self.counts.items(), key=lambda entry: entry[1])
+        return [(item, count, self.errors[item]) for item, count in best]
+
+
+class PopularityTracker:
+    """All-time and trending Space-Saving summaries fed one interaction at a time"""
+
+    def __init__(self, capacity: int = POPULARITY_CAPACITY, half_life_hours: float = TRENDING_HALF_LIFE_HOURS):
+        self.all_time = SpaceSaving(capacity)
+        self.trending = SpaceSaving(capacity)
+        self._tau = half_life_hours * 3600 / math.log(2)
+        self._landmark: Optional[float] = None
+        self.events = 0
+        # _id of the last stored interaction read by catch_up()
+        self.last_id: Optional[ObjectId] = None
+
+    def add(self, rnt: str, timestamp: Optional[datetime] = None):
+        moment = (timestamp or datetime.now()).timestamp()
+        if self._landmark is None:
+            self._landmark = moment
+        exponent = (moment - self._landmark) / self._tau
+        if exponent > RESCALE_EXPONENT:
+            self.trending.scale(math.exp(-exponent))
+            self._landmark = moment
+            exponent = 0.0
+        self.all_time.add(rnt)
+        self.trending.add(rnt, math.exp(exponent))
+        self.events += 1
+
+    def add_interactions(self, interactions: List[Dict[str, Any]]):
+        for interaction in interactions:
+            if interaction.get('action') in POPULAR_ACTIONS and interaction.get('destination_rnt'):
+                self.add(interaction['destination_rnt'], interaction.get('timestamp'))
+
+    def top(self, k: int, window: str = 'all') -> List[Tuple[str, float]]:
+        """(rnt, score) best first; trending scores are event counts decayed to the current time"""
+        if window != 'trending':
+            return [(rnt, count) for rnt, count, error in self.all_time.top(k)]
+        if self._landmark is None:
+            return []
+        decay = math.exp(-(datetime.now().timestamp() - self._landmark) / self._tau)
+        return [(rnt, count * decay) for rnt, count, error in self.trending.top(k)]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "events": self.events,
+            "tracked": len(self.all_time),
+            "capacity": self.all_time.capacity,
+        }
+
+    async def catch_up(self, collection, lag_seconds: float = CATCH_UP_LAG_SECONDS) -> int:
+        """Add the stored interactions inserted since the last call (only the fields popularity needs)"""
+        id_range = {"$lt": ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=lag_seconds))}
+        if self.last_id is not None:
+            id_range["$gt"] = self.last_id
+        cursor = collection.find(
+            {"_id": id_range, "action": {"$in": POPULAR_ACTIONS}},
+            {"_id": 1, "action": 1, "destination_rnt": 1, "timestamp": 1}
+        ).sort("_id", 1).batch_size(CATCH_UP_BATCH_SIZE)
+        added = 0
+        async for interaction in cursor:
+            self.add_interactions([interaction])
+            self.last_id = interaction["_id"]
+            added += 1
+        return added
+
+    @classmethod
+    async def load(cls, collection, **kwargs) -> 'PopularityTracker':
+        """Replay every stored interaction once (later ones are added by catch_up)"""
+        tracker = cls(**kwargs)
+        await tracker.catch_up(collection)
+        return tracker
@@ -0,0 +1,123 @@
+"""Per-user cache of computed recommendation lists with LRU eviction under a memory budget"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+# Number of generation counters users are hashed into
+GENERATION_STRIPES = 4096
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate footprint of a cached value: the length of its JSON encoding"""
+    return len(json.dumps(value, default=str))
+
+
+class _Entry:
+    __slots__ = ('value', 'version', 'size', 'stored_at')
+
+    def __init__(self, value: Any, version: str, size: int):
+        self.value = value
+        self.version = version
+        self.size = size
+        self.stored_at = time.monotonic()
+
+
+class RecommendationCache:
+    """Lists keyed by (user_id, limit), valid for one catalog version
+
+    invalidate(user_id) drops every list of that user. Computations read
+    generation(user_id) before they start and pass it to put(), so a result
+    computed from data that changed meanwhile is never stored. ttl bounds how
+    long another worker's writes can go unnoticed.
+
+    Generations are kept per hash stripe rather than per user, so they take
+    fixed memory however many users are invalidated; users sharing a stripe
+    only cost each other an occasional skipped put.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 300, stripes: int = GENERATION_STRIPES):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple[str, Hashable], _Entry]' = OrderedDict()
+        self._keys_by_user: Dict[str, Set[Hashable]] = {}
+        self._generations = [0] * stripes
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _stripe(self, user_id: str) -> int:
+        return hash(user_id) % len(self._generations)
+
+    def generation(self, user_id: str) -> int:
+        return self._generations[self._stripe(user_id)]
+
+    def get(self, user_id: str, key: Hashable, version: str) -> Optional[Any]:
+        """Cached list for the user, or None when missing, expired or from another catalog version"""
+        entry = self._entries.get((user_id, key))
+        if entry is not None and (entry.version != version or time.monotonic() - entry.stored_at > self.ttl):
+            self._remove((user_id, key))
+            self.stale += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((user_id, key))
+        self.hits += 1
+        return entry.value
+
+    def put(self, user_id: str, key: Hashable, version: str, value: Any, generation: int):
+        """Store a list unless the user's data changed since generation was read"""
+        if generation != self.generation(user_id):
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self._remove((user_id, key))
+        self._entries[(user_id, key)] = _Entry(value, version, size)
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Forget every list of the user (their preferences or interactions changed)"""
+        self._generations[self._stripe(user_id)] += 1
+        for key in list(self._keys_by_user.get(user_id, ())):
+            self._remove((user_id, key))
+        self.invalidations += 1
+
+    def _remove(self, cache_key: Tuple[str, Hashable]):
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        user_id, key = cache_key
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale": self.stale,
+        }
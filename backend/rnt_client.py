@@ -0,0 +1,205 @@
+"""Non-blocking, pooled HTTP client for the datos.gov.co RNT dataset"""
+import codecs
+import json
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+# Colombian National Tourism Registry (RNT) dataset
+RNT_API_URL = os.environ.get('RNT_API_URL', 'https://www.datos.gov.co/resource/jqjy-rhzv.json')
+
+# Connection pool and timeout settings (seconds)
+RNT_CONNECT_TIMEOUT = float(os.environ.get('RNT_CONNECT_TIMEOUT', '5'))
+RNT_READ_TIMEOUT = float(os.environ.get('RNT_READ_TIMEOUT', '30'))
+RNT_MAX_CONNECTIONS = int(os.environ.get('RNT_MAX_CONNECTIONS', '20'))
+RNT_MAX_KEEPALIVE = int(os.environ.get('RNT_MAX_KEEPALIVE', '10'))
+RNT_KEEPALIVE_EXPIRY = float(os.environ.get('RNT_KEEPALIVE_EXPIRY', '30'))
+
+# Rows requested per page during full ingestion
+RNT_PAGE_SIZE = int(os.environ.get('RNT_PAGE_SIZE', '5000'))
+
+# Columns the app actually uses, pushed down as $select
+RNT_FIELDS = os.environ.get(
+    'RNT_FIELDS',
+    'rnt,categoria,subcategoria,nomdep,nombre_muni,razon_social,habitaciones,camas,empleados'
+).split(',')
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (installed with httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def department_filter(departments: List[str]) -> str:
+    """SoQL $where clause restricting rows to the given departments
+
+    nomdep is normalized with upper(trim()) like filter_target_departments in
+    catalog.py, which still runs locally on every loaded row.
+    """
+    quoted = ",".join("'" + dept.strip().upper().replace("'", "''") + "'" for dept in departments)
+    return f"upper(trim(nomdep)) in({quoted})"
+
+
+class JSONArrayStream:
+    """Incremental parser that yields the objects of a JSON array as its text arrives"""
+
+    _SEPARATORS = re.compile(r'[\s,]*')
+    _NUMBER_CONTINUATION = frozenset('0123456789.eE+-')
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._started = False
+        self.finished = False
+
+    def feed(self, text: str) -> List[Any]:
+        self._buffer += text
+        items = []
+        pos = 0
+        while not self.finished:
+            pos = self._SEPARATORS.match(self._buffer, pos).end()
+            if pos >= len(self._buffer):
+                break
+            char = self._buffer[pos]
+            if not self._started:
+                if char != '[':
+                    raise ValueError(f"Expected a JSON array, got {char!r}")
+                self._started = True
+                pos += 1
+            elif char == ']':
+                self.finished = True
+                pos += 1
+            else:
+                try:
+                    item, end = self._decoder.raw_decode(self._buffer, pos)
+                except json.JSONDecodeError:
+                    # Element is incomplete, wait for the next chunk
+                    break
+                if end == len(self._buffer) or self._buffer[end] in self._NUMBER_CONTINUATION:
+                    # A number cut by the chunk boundary decodes too ("12" of "123", "-4" of "-4.5"),
+                    # so only accept an element once the character after it is a delimiter
+                    break
+                items.append(item)
+                pos = end
+        # Drop what has been consumed so the buffer only holds one partial element
+        self._buffer = self._buffer[pos:]
+        return items
+
+    def close(self):
+        if not self.finished:
+            raise ValueError("Truncated JSON array in RNT response")
+
+
+class IngestStats:
+    """Throughput counters for one full ingestion run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.pages = 0
+        self.started_at = time.perf_counter()
+        self.seconds = 0.0
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        seconds = self.seconds or (time.perf_counter() - self.started_at)
+        return {
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "pages": self.pages,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else None,
+            "bytes_per_second": round(self.bytes / seconds, 1) if seconds else None,
+        }
+
+
+class RNTClient:
+    """Wraps one shared httpx.AsyncClient so every upstream call reuses pooled keep-alive connections"""
+
+    def __init__(self, url: str = RNT_API_URL):
+        self.url = url
+        self._client: Optional[httpx.AsyncClient] = None
+        self.last_ingest: Optional[Dict[str, Any]] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=http2_available(),
+                timeout=httpx.Timeout(RNT_READ_TIMEOUT, connect=RNT_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=RNT_MAX_CONNECTIONS,
+                    max_keepalive_connections=RNT_MAX_KEEPALIVE,
+                    keepalive_expiry=RNT_KEEPALIVE_EXPIRY,
+                ),
+                headers={'Accept': 'application/json'},
+            )
+        return self._client
+
+    async def fetch(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Run one SoQL query and return the decoded rows"""
+        response = await self.client.get(self.url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def iter_rows(
+        self,
+        where: Optional[str] = None,
+        select: Optional[List[str]] = None,
+        page_size: int = RNT_PAGE_SIZE,
+        stats: Optional[IngestStats] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Page through the whole result with $offset/$order, streaming and parsing each page"""
+        stats = stats or IngestStats()
+        offset = 0
+        while True:
+            params = {'$order': ':id', '$limit': page_size, '$offset': offset}
+            if where:
+                params['$where'] = where
+            if select:
+                params['$select'] = ','.join(select)
+
+            page_rows = 0
+            async with self.client.stream('GET', self.url, params=params) as response:
+                response.raise_for_status()
+                decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+                parser = JSONArrayStream()
+                async for chunk in response.aiter_bytes():
+                    stats.bytes += len(chunk)
+                    for row in parser.feed(decoder.decode(chunk)):
+                        page_rows += 1
+                        yield row
+                for row in parser.feed(decoder.decode(b'', final=True)):
+                    page_rows += 1
+                    yield row
+                parser.close()
+
+            stats.pages += 1
+            stats.rows += page_rows
+            if page_rows < page_size:
+                break
+            offset += page_size
+
+    async def ingest(self, departments: List[str]) -> List[Dict[str, Any]]:
+        """Download every row for the given departments and record the ingest throughput"""
+        stats = IngestStats()
+        rows = [row async for row in self.iter_rows(department_filter(departments), RNT_FIELDS, stats=stats)]
+        stats.finish()
+        self.last_ingest = stats.as_dict()
+        print(f"RNT ingest: {self.last_ingest}")
+        return rows
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,102 @@
+"""Per-request count of MongoDB round trips, collected with a pymongo command listener
+
+Motor runs each operation in a thread with a copy of the caller's context, so
+the listener sees the counter that RoundTripMiddleware put in request_counter.
+Only enabled with MONGO_ROUND_TRIPS=true (the listener and the middleware
+cost a little on every command and request).
+"""
+import os
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+
+MONGO_ROUND_TRIPS = os.environ.get('MONGO_ROUND_TRIPS', 'false').lower() in ('1', 'true', 'yes')
+
+
+class RoundTripCounter:
+    """Commands sent to MongoDB while handling one request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+request_counter: ContextVar[Optional[RoundTripCounter]] = ContextVar('mongo_round_trips', default=None)
+
+
+class RoundTripListener(monitoring.CommandListener):
+    """Count every command started inside a request context (getMore batches included)"""
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        counter = request_counter.get()
+        if counter is not None:
+            counter.increment()
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        pass
+
+
+class RoundTripStats:
+    """Round trips per route, to spot endpoints that regress into N+1 query patterns"""
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, int]] = {}
+
+    def record(self, route: str, round_trips: int):
+        stats = self._routes.setdefault(route, {"requests": 0, "round_trips": 0, "max": 0})
+        stats["requests"] += 1
+        stats["round_trips"] += round_trips
+        stats["max"] = max(stats["max"], round_trips)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            route: {
+                "requests": stats["requests"],
+                "avg": round(stats["round_trips"] / stats["requests"], 2),
+                "max": stats["max"],
+            }
+            for route, stats in sorted(self._routes.items())
+        }
+
+
+listener = RoundTripListener()
+
+
+class RoundTripMiddleware:
+    """ASGI middleware giving each request its own counter, reported as X-Mongo-Round-Trips"""
+
+    def __init__(self, app, stats: RoundTripStats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        counter = RoundTripCounter()
+        token = request_counter.set(counter)
+
+        async def send_with_count(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'x-mongo-round-trips', str(counter.count).encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            request_counter.reset(token)
+            # The router stores the matched route in the scope
+            route = scope.get('route')
+            self.stats.record(route.path if route else 'unmatched', counter.count)
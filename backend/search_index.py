@@ -0,0 +1,152 @@
+"""Inverted index with accent folding and BM25 ranking over the catalog text fields"""
+import bisect
+import copy
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Fields indexed for full-text search, with their BM25 boost
+SEARCH_FIELDS = {
+    'razon_social': 2.0,
+    'categoria': 1.0,
+    'subcategoria': 1.0,
+    'nombre_muni': 1.5,
+}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def fold_accents(text: str) -> str:
+    """Lowercase and strip diacritics so 'Boyacá' and 'BOYACA' compare equal"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(fold_accents(text))
+
+
+def term_frequencies(doc: Dict[str, Any], fields: Dict[str, float] = SEARCH_FIELDS) -> Tuple[Dict[str, float], float]:
+    """Boosted frequency of every term of a document, and the document length"""
+    frequencies = defaultdict(float)
+    length = 0.0
+    for field, boost in fields.items():
+        for token in tokenize(str(doc.get(field) or '')):
+            frequencies[token] += boost
+            length += boost
+    return frequencies, length
+
+
+class SearchIndex:
+    """Postings map each folded term to (document position, weighted term frequency)"""
+
+    def __init__(self, documents: Sequence[Dict[str, Any]], fields: Dict[str, float] = SEARCH_FIELDS):
+        self.size = len(documents)
+        self.fields = fields
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.doc_lengths: List[float] = []
+
+        postings = defaultdict(list)
+        for position, doc in enumerate(documents):
+            frequencies, length = term_frequencies(doc, fields)
+            for token, frequency in frequencies.items():
+                postings[token].append((position, frequency))
+            self.doc_lengths.append(length)
+
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+        self.average_length = (sum(self.doc_lengths) / self.size) if self.size else 0.0
+
+    def with_document(self, position: int, doc: Dict[str, Any], replaced: Optional[Dict[str, Any]] = None) -> 'SearchIndex':
+        """Copy of the index with doc appended (position == size) or put in place of replaced
+
+        Only the posting lists of the terms involved are copied, so the
+        current index keeps serving unchanged.
+        """
+        index = copy.copy(self)
+        index.postings = dict(self.postings)
+        index.doc_lengths = list(self.doc_lengths)
+        index.terms = list(self.terms)
+
+        if replaced is not None:
+            for token in term_frequencies(replaced, self.fields)[0]:
+                remaining = [posting for posting in index.postings[token] if posting[0] != position]
+                if remaining:
+                    index.postings[token] = remaining
+                else:
+                    del index.postings[token]
+                    index.terms.pop(bisect.bisect_left(index.terms, token))
+
+        frequencies, length = term_frequencies(doc, self.fields)
+        for token, frequency in frequencies.items():
+            if token not in index.postings:
+                bisect.insort(index.terms, token)
+            index.postings[token] = index.postings.get(token, []) + [(position, frequency)]
+
+        if position == self.size:
+            index.doc_lengths.append(length)
+            index.size += 1
+        else:
+            index.doc_lengths[position] = length
+        index.average_length = sum(index.doc_lengths) / index.size
+        return index
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        position = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            matches.append(self.terms[position])
+            position += 1
+        return matches
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """Positions of documents containing every query term, best BM25 score first
+
+        The last query term also matches as a prefix so partial words typed in
+        the search box still find results.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        term_postings = []
+        for index, term in enumerate(terms):
+            if index == len(terms) - 1 and term not in self.postings:
+                expanded = self._prefix_terms(term)
+            else:
+                expanded = [term] if term in self.postings else []
+            if not expanded:
+                return []
+            term_postings.append([(t, self.postings[t]) for t in expanded])
+
+        # Intersect starting from the rarest term so work follows the shortest posting list
+        term_postings.sort(key=lambda group: sum(len(p) for _, p in group))
+        scores: Dict[int, float] = {}
+        for group_index, group in enumerate(term_postings):
+            group_scores: Dict[int, float] = {}
+            for term, postings in group:
+                idf = self._idf(term)
+                for position, frequency in postings:
+                    if group_index and position not in scores:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / (self.average_length or 1))
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    group_scores[position] = max(group_scores.get(position, 0.0), score)
+            if group_index:
+                scores = {position: scores[position] + score for position, score in group_scores.items()}
+            else:
+                scores = group_scores
+            if not scores:
+                return []
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
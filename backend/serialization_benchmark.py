@@ -0,0 +1,100 @@
+"""Serialization and compression cost of a catalog-sized /api/destinations response
+
+Compares FastAPI's default path (response_model validation, jsonable_encoder,
+json.dumps) with rendering the rows straight through orjson, and reports the
+bytes sent raw, gzip-ed and brotli-ed.
+
+Run `python serialization_benchmark.py [--rows 5000] [--repeat 20]` from backend/.
+"""
+import argparse
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Union
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from compression import brotli_available, compress
+
+CATEGORIES = {
+    'ALOJAMIENTO HOTELERO': 'Hoteles y hospedajes',
+    'ALOJAMIENTO RURAL': 'Turismo rural y ecológico',
+    'AGENCIA DE VIAJES': 'Servicios de viaje y turismo',
+    'GUÍA DE TURISMO': 'Guías turísticos profesionales',
+    'TRANSPORTE TURÍSTICO': 'Transporte especializado'
+}
+DEPARTMENTS = {'BOYACA': 'Boyacá', 'CUNDINAMARCA': 'Cundinamarca'}
+MUNICIPALITIES = ['VILLA DE LEYVA', 'TUNJA', 'PAIPA', 'ZIPAQUIRÁ', 'GUATAVITA', 'CHÍA', 'SOGAMOSO', 'LA VEGA']
+
+
+def synthetic_rows(count: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Rows in the layout process_destination_data produces"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        categoria = rng.choice(list(CATEGORIES))
+        nomdep = rng.choice(list(DEPARTMENTS))
+        municipio = rng.choice(MUNICIPALITIES)
+        rows.append({
+            'rnt': str(10000 + i),
+            'categoria': categoria,
+            'subcategoria': rng.choice(['HOTEL', 'HOSTAL', 'CABAÑA', 'OPERADOR', 'FINCA TURÍSTICA']),
+            'nomdep': nomdep,
+            'nombre_muni': municipio,
+            'razon_social': f"{rng.choice(['HOTEL', 'HOSTAL', 'TURISMO'])} {municipio.title()} {i} S.A.S.",
+            'habitaciones': rng.randint(1, 120),
+            'camas': rng.randint(1, 240),
+            'empleados': rng.randint(1, 60),
+            'department_display': DEPARTMENTS[nomdep],
+            'location': f"{municipio}, {DEPARTMENTS[nomdep]}",
+            'category_description': CATEGORIES[categoria],
+            'source': 'rnt'
+        })
+    return rows
+
+
+def best_of(function: Callable[[], Any], repeat: int) -> float:
+    """Fastest of `repeat` runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    # What response_model=Union[List[Dict[str, Any]], Dict[str, Any]] used to validate
+    response_model = TypeAdapter(Union[List[Dict[str, Any]], Dict[str, Any]])
+
+    timings = [
+        ("response_model + jsonable_encoder + json",
+         lambda: JSONResponse(jsonable_encoder(response_model.validate_python(rows))).body),
+        ("jsonable_encoder + json", lambda: JSONResponse(jsonable_encoder(rows)).body),
+        ("orjson", lambda: ORJSONResponse(rows).body),
+    ]
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for name, function in timings:
+        print(f"  {name:<42} {best_of(function, args.repeat):8.2f} ms")
+
+    body = ORJSONResponse(rows).body
+    encodings = ['gzip', 'br'] if brotli_available() else ['gzip']
+    print("wire size")
+    print(f"  {'identity':<42} {len(body):8d} bytes")
+    for encoding in encodings:
+        compressed = compress(body, encoding)
+        elapsed = best_of(lambda: compress(body, encoding), args.repeat)
+        print(f"  {encoding:<42} {len(compressed):8d} bytes  {elapsed:6.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
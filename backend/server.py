@@ -1,15 +1,41 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ValidationError
+from pymongo import ReturnDocument
 from typing import List, Optional, Dict, Any
-import requests
+from itertools import islice
+import asyncio
 import os
-from pymongo import MongoClient
 from datetime import datetime
 import uuid
 import uvicorn
 
-app = FastAPI()
+from database import db
+from catalog import CatalogStore, TARGET_DEPARTMENTS
+from compression import CompressionMiddleware, choose_encoding
+from facets import iter_positions, positions_to_bitmap
+from destination_sync import load_destinations, sync_destinations
+from geo_index import backfill_locations, geojson_point
+from indexes import check_query_plans, ensure_indexes
+from interaction_events import award_points, interaction_points, mark_processed, persist_interactions, unprocessed_interactions
+from item_neighbors import interaction_weights, rebuild_item_neighbors, score_from_history
+from loaders import RecommendationLoaders
+from points import RedemptionError, apply_pending_transactions, get_balance, reconcile_redemptions, record_transaction
+from points import redeem_reward as redeem_reward_atomically
+from popularity import WINDOWS, PopularityTracker
+from recommendation_cache import RecommendationCache
+from rnt_client import RNTClient
+from round_trips import MONGO_ROUND_TRIPS, RoundTripMiddleware, RoundTripStats
+from search_index import fold_accents
+from singleflight import SingleFlight
+from text_vectors import SIMILAR_TOP_K
+from trend_rollups import backfill_once, read_trends, record_interactions, rollups_status
+from user_vectors import UserVectorIndex
+from write_behind import WriteBehindBuffer
+
+# orjson for every response; hot endpoints return ORJSONResponse directly to skip jsonable_encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # CORS configuration
 app.add_middleware(
@@ -20,10 +46,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = MongoClient(MONGO_URL)
-db = client.tourism_app
+# brotli/gzip for JSON bodies above COMPRESSION_MIN_SIZE bytes
+app.add_middleware(CompressionMiddleware)
+
+# MongoDB round trips per route, also reported on every response as X-Mongo-Round-Trips (opt-in)
+round_trip_stats = RoundTripStats()
+if MONGO_ROUND_TRIPS:
+    app.add_middleware(RoundTripMiddleware, stats=round_trip_stats)
+
+# Largest batch accepted by /api/users/interactions/batch
+INTERACTION_BATCH_MAX_SIZE = int(os.environ.get('INTERACTION_BATCH_MAX_SIZE', '500'))
+
+# Optional write-behind mode for interaction events
+INTERACTION_WRITE_BEHIND = os.environ.get('INTERACTION_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+WRITE_BEHIND_MAX_QUEUE = int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', '10000'))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500'))
+WRITE_BEHIND_FLUSH_INTERVAL_MS = int(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL_MS', '200'))
+# What to do when the queue is full: 'sync' writes directly, 'reject' returns 503
+WRITE_BEHIND_OVERFLOW = os.environ.get('WRITE_BEHIND_OVERFLOW', 'sync').lower()
+
+# Memory budget and maximum age of the per-user recommendation cache
+RECOMMENDATION_CACHE_MAX_BYTES = int(os.environ.get('RECOMMENDATION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.environ.get('RECOMMENDATION_CACHE_TTL_SECONDS', '300'))
+
+# Seconds between reads of the interactions stored since the last one (every worker's events)
+POPULARITY_CATCH_UP_SECONDS = float(os.environ.get('POPULARITY_CATCH_UP_SECONDS', '5'))
+
+# Seconds between sweeps for unprocessed interactions, half-applied point transactions and
+# pending redemptions (interactions are swept once they are this old, so clients retry first)
+PENDING_WRITES_SWEEP_SECONDS = int(os.environ.get('PENDING_WRITES_SWEEP_SECONDS', '300'))
+
+# Largest radius accepted by /api/destinations/nearby (km)
+NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', '200'))
+
+# Seconds between full reloads of the user preference vectors (picks up writes from other workers)
+USER_VECTORS_RELOAD_SECONDS = int(os.environ.get('USER_VECTORS_RELOAD_SECONDS', '300'))
+
+# Seconds between rebuilds of the item-item neighbour table in this worker; by default
+# (0) it is left to an offline `python item_neighbors.py` run, e.g. from cron
+ITEM_NEIGHBORS_REBUILD_SECONDS = int(os.environ.get('ITEM_NEIGHBORS_REBUILD_SECONDS', '0'))
+
+# Shared non-blocking client for the datos.gov.co RNT API
+rnt_client = RNTClient()
 
 # Pydantic models
 class UserPreference(BaseModel):
@@ -105,55 +169,42 @@ class TourismDestination(BaseModel):
 async def health_check():
     return {"status": "healthy"}
 
-@app.get("/api/destinations", response_model=List[Dict[str, Any]])
-async def get_destinations(department: Optional[str] = None, category: Optional[str] = None, limit: int = 50):
+@app.get("/api/destinations")
+async def get_destinations(
+    department: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = 50,
+    include_facets: bool = False
+):
     """Get tourism destinations from Colombian RNT API filtered for Boyacá and Cundinamarca"""
     try:
-        # Fetch data from Colombian government API with higher limit to ensure we get enough data
-        url = "https://www.datos.gov.co/resource/jqjy-rhzv.json"
-        params = {'$limit': 2000}  # Get more data to filter from
+        # Destinations are already filtered, processed and sorted by department and municipality
+        snapshot = await catalog_store.get()
         
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        all_destinations = response.json()
-        
-        # Filter for Boyacá and Cundinamarca (corrected department names without accents)
-        target_departments = ['BOYACA', 'CUNDINAMARCA']
-        filtered_destinations = []
+        # Resolve the filters by intersecting the precomputed facet bitmaps
+        selection = snapshot.facets.filter(department=department, category=category)
+        if selection is None:
+            filtered_destinations = snapshot.destinations[:limit]
+        else:
+            filtered_destinations = [
+                snapshot.destinations[position]
+                for position in islice(iter_positions(selection), limit)
+            ]
         
-        for dest in all_destinations:
-            dept_name = dest.get('nomdep', '').strip().upper()
-            
-            # Check if destination is in our target departments
-            if dept_name in target_departments:
-                # Additional filtering by specific department if requested
-                if department:
-                    requested_dept = department.strip().upper()
-                    # Handle both with and without accents
-                    if requested_dept in ['BOYACÁ', 'BOYACA'] and dept_name != 'BOYACA':
-                        continue
-                    elif requested_dept == 'CUNDINAMARCA' and dept_name != 'CUNDINAMARCA':
-                        continue
-                
-                # Filter by category if specified
-                if category:
-                    dest_category = dest.get('categoria', '').lower()
-                    if category.lower() not in dest_category:
-                        continue
-                
-                # Clean and enrich destination data
-                processed_dest = process_destination_data(dest)
-                filtered_destinations.append(processed_dest)
-        
-        # Sort by municipality and limit results
-        filtered_destinations.sort(key=lambda x: (x.get('nomdep', ''), x.get('nombre_muni', '')))
-        
-        return filtered_destinations[:limit]
+        if include_facets:
+            return catalog_response(snapshot, {
+                "results": filtered_destinations,
+                "facets": snapshot.facets.counts(selection)
+            })
+        return catalog_response(snapshot, filtered_destinations)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching destinations: {str(e)}")
 
+def catalog_response(snapshot, content: Any) -> ORJSONResponse:
+    """Serialize catalog rows straight with orjson and tag the snapshot version"""
+    return ORJSONResponse(content, headers={'X-Catalog-Version': snapshot.version})
+
 def process_destination_data(destination):
     """Process and enrich destination data for better presentation"""
     processed = destination.copy()
@@ -196,8 +247,227 @@ def process_destination_data(destination):
         processed.get('categoria', '')
     )
     
+    # 'rnt' for datos.gov.co rows, 'user' for approved user submissions
+    processed.setdefault('source', 'rnt')
+    
     return processed
 
+def user_destination_row(destination: Dict[str, Any]) -> Dict[str, Any]:
+    """Approved user destination in the RNT row layout, so it joins the same catalog"""
+    return {
+        "rnt": f"USR-{destination['id']}",
+        "source": "user",
+        "user_destination_id": destination['id'],
+        "user_id": destination.get('user_id'),
+        "razon_social": destination.get('name'),
+        "categoria": (destination.get('category') or '').strip().upper(),
+        "subcategoria": (destination.get('subcategory') or '').strip().upper(),
+        "nomdep": fold_accents((destination.get('department') or '').strip()).upper(),
+        "nombre_muni": (destination.get('municipality') or '').strip().upper(),
+        "description": destination.get('description'),
+        "address": destination.get('address'),
+        "phone": destination.get('phone'),
+        "email": destination.get('email'),
+        "website": destination.get('website'),
+        "services": destination.get('services') or [],
+        "photos": destination.get('photos') or [],
+        "latitude": destination.get('latitude'),
+        "longitude": destination.get('longitude'),
+        "approved_at": destination.get('approved_at')
+    }
+
+# Catalog snapshot (RNT plus approved user destinations) shared by the destination, statistics and recommendation endpoints
+
+async def fetch_rnt_catalog() -> List[Dict[str, Any]]:
+    """Download every Boyacá and Cundinamarca row, filtered server-side and paged"""
+    return await rnt_client.ingest(TARGET_DEPARTMENTS)
+
+async def load_stored_catalog() -> List[Dict[str, Any]]:
+    """Read the materialized destinations collection when datos.gov.co is unavailable"""
+    return await load_destinations(db.destinations)
+
+async def load_approved_user_destinations() -> List[Dict[str, Any]]:
+    """Approved user destinations, merged into every catalog snapshot"""
+    destinations = await db.user_destinations.find({"status": "approved"}, {"_id": 0}).to_list(None)
+    return [user_destination_row(dest) for dest in destinations]
+
+async def sync_stored_catalog(rows: List[Dict[str, Any]]):
+    """Upsert the rows that changed since the last sync into the destinations collection"""
+    result = await sync_destinations(db.destinations, rows)
+    print(f"Destinations sync: {result}")
+
+catalog_store = CatalogStore(
+    fetch_rnt_catalog,
+    process_destination_data,
+    fallback=load_stored_catalog,
+    on_loaded=sync_stored_catalog,
+    extra_loader=load_approved_user_destinations
+)
+
+# Concurrent identical expensive computations share one in-flight task
+computations = SingleFlight()
+
+# Computed recommendation lists per user, dropped when the user's data or the catalog changes
+recommendation_cache = RecommendationCache(
+    max_bytes=RECOMMENDATION_CACHE_MAX_BYTES,
+    ttl=RECOMMENDATION_CACHE_TTL_SECONDS
+)
+
+async def store_interactions(interactions: List[Dict[str, Any]]):
+    """Persist interactions with their points, count them in the trend rollups,
+    then drop their users' cached recommendations
+
+    Events are flagged processed only after every step, so retrying a failed call
+    finishes them (points are applied exactly once; rollups at least once).
+    Popularity reads the stored events by itself (reload_popularity).
+    """
+    pending, duplicates = await persist_interactions(db, interactions)
+    await finish_interactions(pending)
+    for user_id in {interaction['user_id'] for interaction in interactions}:
+        recommendation_cache.invalidate(user_id)
+    return duplicates
+
+async def finish_interactions(pending: List[Dict[str, Any]]):
+    """Steps after the points: trend rollups and the processed flag"""
+    await record_interactions(db, pending)
+    await mark_processed(db, pending)
+
+# All-time and trending heavy hitters, fed from the stored interactions by reload_popularity
+popularity = PopularityTracker()
+
+# Buffered interaction writes (only started when INTERACTION_WRITE_BEHIND is enabled)
+interaction_buffer = WriteBehindBuffer(
+    store_interactions,
+    max_queue=WRITE_BEHIND_MAX_QUEUE,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000
+)
+
+# Preference vectors of every user for collaborative filtering
+user_vectors = UserVectorIndex()
+
+async def reload_user_vectors():
+    """Rebuild the preference vectors from MongoDB periodically"""
+    global user_vectors
+    while True:
+        try:
+            user_vectors = await UserVectorIndex.load(db.user_preferences)
+        except Exception as e:
+            print(f"Error loading user vectors: {str(e)}")
+        await asyncio.sleep(USER_VECTORS_RELOAD_SECONDS)
+
+async def reload_popularity():
+    """Load the popularity summaries once, then add the interactions stored since (by any worker)"""
+    global popularity
+    loaded = False
+    while True:
+        try:
+            if not loaded:
+                popularity = await PopularityTracker.load(db.user_interactions)
+                loaded = True
+            else:
+                await popularity.catch_up(db.user_interactions)
+        except Exception as e:
+            print(f"Error loading popularity: {str(e)}")
+        await asyncio.sleep(POPULARITY_CATCH_UP_SECONDS)
+
+async def backfill_destination_locations():
+    """Derive the GeoJSON location of user destinations stored before it existed"""
+    try:
+        backfilled = await backfill_locations(db.user_destinations)
+        if backfilled:
+            print(f"Backfilled {backfilled} destination locations")
+    except Exception as e:
+        print(f"Error backfilling destination locations: {str(e)}")
+
+async def rebuild_item_neighbors_periodically():
+    """Recompute item_neighbors from user_interactions outside the request path"""
+    while True:
+        try:
+            result = await rebuild_item_neighbors(db)
+            print(f"Item neighbours rebuilt: {result}")
+        except Exception as e:
+            print(f"Error rebuilding item neighbours: {str(e)}")
+        await asyncio.sleep(ITEM_NEIGHBORS_REBUILD_SECONDS)
+
+async def sweep_pending_writes():
+    """Finish interactions, point transactions and redemptions a crash left half done"""
+    while True:
+        try:
+            interactions = await unprocessed_interactions(db, PENDING_WRITES_SWEEP_SECONDS)
+            if interactions:
+                await award_points(db, interactions)
+                await finish_interactions(interactions)
+                for user_id in {interaction['user_id'] for interaction in interactions}:
+                    recommendation_cache.invalidate(user_id)
+                print(f"Finished {len(interactions)} unprocessed interactions")
+            applied = await apply_pending_transactions(db)
+            if applied:
+                print(f"Applied {applied} pending point transactions")
+            redemptions = await reconcile_redemptions(db)
+            if any(redemptions.values()):
+                print(f"Pending redemptions reconciled: {redemptions}")
+        except Exception as e:
+            print(f"Error sweeping pending writes: {str(e)}")
+        await asyncio.sleep(PENDING_WRITES_SWEEP_SECONDS)
+
+async def backfill_trend_rollups():
+    """Build the trend rollups once for interactions stored before they existed (one worker does it)"""
+    try:
+        result = await backfill_once(db)
+        if result:
+            print(f"Trend rollups built from {result['interactions']} interactions")
+    except Exception as e:
+        print(f"Error building trend rollups: {str(e)}")
+
+background_tasks = []
+
+@app.on_event("startup")
+async def start_catalog_refresh():
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        print(f"Error creating indexes: {str(e)}")
+    catalog_store.start()
+    background_tasks.append(asyncio.create_task(reload_user_vectors()))
+    background_tasks.append(asyncio.create_task(reload_popularity()))
+    background_tasks.append(asyncio.create_task(backfill_destination_locations()))
+    background_tasks.append(asyncio.create_task(sweep_pending_writes()))
+    background_tasks.append(asyncio.create_task(backfill_trend_rollups()))
+    if ITEM_NEIGHBORS_REBUILD_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(rebuild_item_neighbors_periodically()))
+    if INTERACTION_WRITE_BEHIND:
+        interaction_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_catalog_refresh():
+    # Drain buffered interactions before the process exits
+    await interaction_buffer.stop()
+    for task in background_tasks:
+        task.cancel()
+    await catalog_store.stop()
+    await rnt_client.close()
+
+@app.get("/api/destinations/catalog")
+async def get_catalog_info():
+    """Get the version and freshness of the destinations catalog snapshot"""
+    info = catalog_store.info()
+    info["ingest"] = rnt_client.last_ingest
+    return info
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Internal counters for buffers, caches and request coalescing"""
+    return {
+        "interaction_write_behind": interaction_buffer.metrics(),
+        "computations": computations.stats(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "mongo_round_trips": round_trip_stats.metrics() if MONGO_ROUND_TRIPS else None,
+        "user_vectors": len(user_vectors),
+        "popularity": popularity.metrics(),
+        "catalog": catalog_store.info()
+    }
+
 @app.post("/api/users/preferences")
 async def save_user_preferences(preferences: UserPreference):
     """Save user preferences"""
@@ -209,11 +479,13 @@ async def save_user_preferences(preferences: UserPreference):
         user_data['created_at'] = datetime.now()
         
         # Update or insert user preferences
-        db.user_preferences.replace_one(
+        await db.user_preferences.replace_one(
             {"id": preferences.id},
             user_data,
             upsert=True
         )
+        user_vectors.upsert(user_data)
+        recommendation_cache.invalidate(preferences.id)
         
         return {"message": "Preferences saved successfully", "user_id": preferences.id}
     except Exception as e:
@@ -227,214 +499,162 @@ async def track_user_interaction(interaction: UserInteraction):
             interaction.id = str(uuid.uuid4())
         
         interaction.timestamp = datetime.now()
-        
         interaction_data = interaction.dict()
-        db.user_interactions.insert_one(interaction_data)
         
-        # Award points based on interaction type
-        points_map = {
-            'like': 3,
-            'view': 1,
-            'save': 2
-        }
+        # Write-behind mode: respond once the event is queued, it is flushed in batches
+        if INTERACTION_WRITE_BEHIND:
+            if interaction_buffer.offer(interaction_data):
+                return {
+                    "message": "Interaction tracked successfully",
+                    "points_earned": interaction_points(interaction.action),
+                    "queued": True
+                }
+            # Queue full: apply backpressure instead of dropping the event
+            if WRITE_BEHIND_OVERFLOW == 'reject':
+                raise HTTPException(status_code=503, detail="Interaction queue is full, retry later", headers={"Retry-After": "1"})
         
-        points = points_map.get(interaction.action, 0)
-        if points > 0:
-            descriptions = {
-                'like': 'Me gusta en destino',
-                'view': 'Visualización de destino',
-                'save': 'Destino guardado'
-            }
-            
-            await add_points(
-                interaction.user_id,
-                points,
-                f'interaction_{interaction.action}',
-                descriptions.get(interaction.action, 'Interacción con destino'),
-                interaction.destination_rnt
-            )
+        # Interaction and the points it awards (a repeated id earns nothing)
+        duplicates = await store_interactions([interaction_data])
+        points = 0 if duplicates else interaction_points(interaction.action)
         
         return {"message": "Interaction tracked successfully", "points_earned": points}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error tracking interaction: {str(e)}")
 
-@app.get("/api/recommendations/{user_id}")
-async def get_user_recommendations(user_id: str, limit: int = 10):
-    """Get personalized recommendations using enhanced collaborative filtering for Colombian tourism"""
+@app.post("/api/users/interactions/batch")
+async def track_user_interactions_batch(interactions: List[Dict[str, Any]] = Body(...)):
+    """Track a batch of interactions (e.g. queued offline by mobile clients) with bulk writes"""
+    if len(interactions) > INTERACTION_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {INTERACTION_BATCH_MAX_SIZE} interactions")
+    
     try:
-        # Get user preferences
-        user_prefs = db.user_preferences.find_one({"id": user_id})
-        if not user_prefs:
-            raise HTTPException(status_code=404, detail="User preferences not found")
-        
-        # Get user interactions
-        user_interactions = list(db.user_interactions.find({"user_id": user_id}))
-        user_liked_destinations = [i['destination_rnt'] for i in user_interactions if i['action'] == 'like']
-        user_viewed_destinations = [i['destination_rnt'] for i in user_interactions]
-        
-        # Fetch all destinations for analysis
-        url = "https://www.datos.gov.co/resource/jqjy-rhzv.json"
-        response = requests.get(url, params={'$limit': 5000})
-        response.raise_for_status()
-        all_destinations_data = response.json()
-        
-        # Filter for Boyacá and Cundinamarca
-        target_departments = ['BOYACA', 'CUNDINAMARCA']
-        available_destinations = [
-            d for d in all_destinations_data 
-            if d.get('nomdep', '').strip().upper() in target_departments
-        ]
+        results = []
+        accepted = []
         
-        # Find similar users (collaborative filtering)
-        similar_users = []
-        all_users = list(db.user_preferences.find({"id": {"$ne": user_id}}))
-        
-        for other_user in all_users:
-            similarity_score = calculate_user_similarity(user_prefs, other_user)
-            if similarity_score > 0:
-                similar_users.append((other_user['id'], similarity_score))
-        
-        # Sort by similarity
-        similar_users.sort(key=lambda x: x[1], reverse=True)
-        
-        # Get destinations liked by similar users
-        collaborative_recommendations = []
-        for similar_user_id, similarity in similar_users[:3]:  # Top 3 similar users
-            similar_user_interactions = list(db.user_interactions.find({
-                "user_id": similar_user_id,
-                "action": "like"
-            }))
+        for index, item in enumerate(interactions):
+            try:
+                interaction = UserInteraction(**item)
+            except ValidationError as e:
+                results.append({"index": index, "id": item.get('id'), "status": "invalid", "points_earned": 0, "error": str(e)})
+                continue
             
-            for interaction in similar_user_interactions:
-                if interaction['destination_rnt'] not in user_viewed_destinations:
-                    collaborative_recommendations.append(interaction['destination_rnt'])
+            if not interaction.id:
+                interaction.id = str(uuid.uuid4())
+            # Keep the client timestamp of events that were queued offline
+            if not interaction.timestamp:
+                interaction.timestamp = datetime.now()
+            accepted.append((index, interaction.dict()))
         
-        # Content-based recommendations based on user preferences
-        content_recommendations = []
-        user_preferred_categories = user_prefs.get('preferred_categories', [])
-        user_preferred_departments = user_prefs.get('preferred_departments', [])
+        # One insert_many for the interactions and one for the points they award
+        duplicates = await store_interactions([doc for _, doc in accepted])
         
-        for dest in available_destinations:
-            if dest.get('rnt') in user_viewed_destinations:
-                continue
-                
-            score = calculate_content_score(dest, user_prefs)
-            if score > 0:
-                content_recommendations.append((dest.get('rnt'), score))
-        
-        # Sort content recommendations by score
-        content_recommendations.sort(key=lambda x: x[1], reverse=True)
-        content_rnt_list = [rnt for rnt, score in content_recommendations[:limit]]
-        
-        # Combine collaborative and content-based recommendations
-        combined_recommendations = list(set(collaborative_recommendations + content_rnt_list))
-        
-        # If no collaborative recommendations, use content-based + popular destinations
-        if not combined_recommendations:
-            # Get popular destinations as fallback
-            popular_pipeline = [
-                {"$match": {"action": {"$in": ["like", "view"]}}},
-                {"$group": {"_id": "$destination_rnt", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$limit": limit}
-            ]
-            
-            popular_destinations = list(db.user_interactions.aggregate(popular_pipeline))
-            popular_rnt_list = [item['_id'] for item in popular_destinations]
-            combined_recommendations = content_rnt_list + popular_rnt_list
-        
-        # Remove duplicates and limit
-        final_recommendations = list(set(combined_recommendations))[:limit]
-        
-        # Fetch full destination data and process
-        recommendations_data = []
-        for dest in available_destinations:
-            if dest.get('rnt') in final_recommendations:
-                processed_dest = process_destination_data(dest)
-                # Add recommendation reason
-                processed_dest['recommendation_reason'] = get_recommendation_reason(
-                    dest, user_prefs, dest.get('rnt') in collaborative_recommendations
-                )
-                recommendations_data.append(processed_dest)
-        
-        return recommendations_data[:limit]
+        for position, (index, doc) in enumerate(accepted):
+            if position in duplicates:
+                results.append({"index": index, "id": doc['id'], "status": "duplicate", "points_earned": 0})
+            else:
+                results.append({"index": index, "id": doc['id'], "status": "tracked", "points_earned": interaction_points(doc['action'])})
         
+        results.sort(key=lambda x: x['index'])
+        
+        return {
+            "message": f"{len(accepted) - len(duplicates)} interactions tracked successfully",
+            "points_earned": sum(result['points_earned'] for result in results),
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error tracking interactions: {str(e)}")
+
+@app.get("/api/recommendations/{user_id}")
+async def get_user_recommendations(user_id: str, limit: int = 10):
+    """Get personalized recommendations using enhanced collaborative filtering for Colombian tourism"""
+    try:
+        snapshot = await catalog_store.get()
+        cached = recommendation_cache.get(user_id, limit, snapshot.version)
+        if cached is not None:
+            return catalog_response(snapshot, cached)
+        
+        # The generation is part of the key so no caller joins a computation started before an invalidation
+        generation = recommendation_cache.generation(user_id)
+        recommendations = await computations.do(
+            ('recommendations', user_id, limit, generation), compute_user_recommendations, user_id, limit
+        )
+        recommendation_cache.put(user_id, limit, snapshot.version, recommendations, generation)
+        return catalog_response(snapshot, recommendations)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
-def calculate_user_similarity(user1_prefs, user2_prefs):
-    """Calculate similarity score between two users"""
-    similarity_score = 0
+async def compute_user_recommendations(user_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Combine collaborative and content-based scoring into a recommendation list"""
+    loaders = RecommendationLoaders(db)
     
-    # Department preference similarity (weight: 3)
-    common_departments = set(user1_prefs.get('preferred_departments', [])) & set(user2_prefs.get('preferred_departments', []))
-    similarity_score += len(common_departments) * 3
-    
-    # Category preference similarity (weight: 2)
-    common_categories = set(user1_prefs.get('preferred_categories', [])) & set(user2_prefs.get('preferred_categories', []))
-    similarity_score += len(common_categories) * 2
+    # Get user preferences and interactions (batched with any other lookups of this request)
+    user_prefs, user_interactions = await asyncio.gather(
+        loaders.user_preferences.load(user_id),
+        loaders.user_interactions.load(user_id)
+    )
+    if not user_prefs:
+        raise HTTPException(status_code=404, detail="User preferences not found")
     
-    # Age range similarity (weight: 1)
-    if user1_prefs.get('age_range') == user2_prefs.get('age_range'):
-        similarity_score += 1
+    user_viewed_destinations = [i['destination_rnt'] for i in user_interactions]
     
-    # Travel style similarity (weight: 2)
-    if user1_prefs.get('travel_style') == user2_prefs.get('travel_style'):
-        similarity_score += 2
+    # Boyacá and Cundinamarca destinations from the catalog snapshot
+    snapshot = await catalog_store.get()
+    available_destinations = snapshot.destinations
     
-    return similarity_score
-
-def calculate_content_score(destination, user_prefs):
-    """Calculate content-based recommendation score"""
-    score = 0
+    # Item-item collaborative filtering: neighbours of the destinations in the user's history
+    history = {rnt: weight for (_, rnt), weight in interaction_weights(user_interactions).items()}
+    item_scores = await score_from_history(db, history, exclude=user_viewed_destinations)
+    collaborative_recommendations = [rnt for rnt, score in item_scores[:limit]]
     
-    # Category match
-    dest_category = destination.get('categoria', '')
-    for pref_category in user_prefs.get('preferred_categories', []):
-        if pref_category.lower() in dest_category.lower():
-            score += 3
+    # Find similar users (collaborative filtering) with one matrix-vector product
+    # over the preference vectors of every user
+    user_vectors.upsert(user_prefs)
+    similar_users = user_vectors.top_similar(user_prefs, 3, exclude=[user_id])
     
-    # Department match
-    dest_dept = destination.get('nomdep', '').strip().upper()
-    for pref_dept in user_prefs.get('preferred_departments', []):
-        pref_dept_clean = pref_dept.strip().upper()
-        if pref_dept_clean in ['BOYACÁ', 'BOYACA'] and dest_dept == 'BOYACA':
-            score += 2
-        elif pref_dept_clean == 'CUNDINAMARCA' and dest_dept == 'CUNDINAMARCA':
-            score += 2
+    # Get destinations liked by similar users
+    similar_user_likes = await loaders.user_likes.load_many(
+        [similar_user_id for similar_user_id, similarity in similar_users]
+    )
+    for likes in similar_user_likes:
+        for interaction in likes:
+            if interaction['destination_rnt'] not in user_viewed_destinations:
+                collaborative_recommendations.append(interaction['destination_rnt'])
     
-    # Travel style bonuses
-    travel_style = user_prefs.get('travel_style', '').lower()
-    if travel_style == 'aventura' and 'rural' in dest_category.lower():
-        score += 1
-    elif travel_style == 'cultural' and any(word in dest_category.lower() for word in ['guía', 'agencia']):
-        score += 1
-    elif travel_style == 'relajacion' and 'alojamiento' in dest_category.lower():
-        score += 1
+    # Content-based recommendations: one dot product over the precomputed destination vectors
+    content = snapshot.content
+    profile = content.profile(user_prefs)
+    content_ranked = content.top_k(profile, limit, exclude=content.positions_of(user_viewed_destinations))
+    content_rnt_list = [available_destinations[position].get('rnt') for position, score in content_ranked]
     
-    return score
-
-def get_recommendation_reason(destination, user_prefs, is_collaborative):
-    """Generate explanation for why destination was recommended"""
-    reasons = []
+    # Combine collaborative and content-based recommendations, best collaborative scores first
+    combined_recommendations = list(dict.fromkeys(collaborative_recommendations + content_rnt_list))
     
-    if is_collaborative:
-        reasons.append("Recomendado por usuarios con gustos similares")
+    # If no collaborative recommendations, use content-based + popular destinations
+    if not combined_recommendations:
+        # Trending destinations from the in-memory heavy hitters as fallback
+        popular_rnt_list = [rnt for rnt, score in popularity.top(limit, 'trending')]
+        combined_recommendations = content_rnt_list + popular_rnt_list
     
-    # Category match
-    dest_category = destination.get('categoria', '')
-    for pref_category in user_prefs.get('preferred_categories', []):
-        if pref_category.lower() in dest_category.lower():
-            reasons.append(f"Coincide con tu interés en {pref_category.lower()}")
-            break
+    # Remove duplicates and limit
+    final_recommendations = list(dict.fromkeys(combined_recommendations))[:limit]
     
-    # Location match
-    dest_dept = destination.get('nomdep', '').strip().upper()
-    dept_display = 'Boyacá' if dest_dept == 'BOYACA' else 'Cundinamarca'
-    if dept_display in user_prefs.get('preferred_departments', []):
-        reasons.append(f"Ubicado en {dept_display}, tu departamento preferido")
+    # Fetch full destination data and process
+    collaborative = set(collaborative_recommendations)
+    recommendations_data = []
+    for position in content.positions_of(final_recommendations):
+        processed_dest = dict(available_destinations[position])
+        # Add recommendation reason
+        processed_dest['recommendation_reason'] = content.reason(
+            position, profile, processed_dest.get('rnt') in collaborative
+        )
+        recommendations_data.append(processed_dest)
     
-    return "; ".join(reasons) if reasons else "Destino popular en la región"
+    return recommendations_data[:limit]
+
 
 # User Destinations and Points System Endpoints
 
@@ -449,7 +669,11 @@ async def create_user_destination(destination: UserDestination):
         destination.status = 'pending'
         
         destination_data = destination.dict()
-        db.user_destinations.insert_one(destination_data)
+        # GeoJSON copy of latitude/longitude for the 2dsphere index
+        location = geojson_point(destination.latitude, destination.longitude)
+        if location:
+            destination_data['location'] = location
+        await db.user_destinations.insert_one(destination_data)
         
         # Give points for submitting a destination (pending approval)
         await add_points(
@@ -468,7 +692,7 @@ async def create_user_destination(destination: UserDestination):
 async def get_user_destinations(user_id: str):
     """Get destinations submitted by a specific user"""
     try:
-        destinations = list(db.user_destinations.find({"user_id": user_id}))
+        destinations = await db.user_destinations.find({"user_id": user_id}).to_list(None)
         for dest in destinations:
             dest['_id'] = str(dest['_id'])  # Convert ObjectId to string
         return destinations
@@ -479,10 +703,10 @@ async def get_user_destinations(user_id: str):
 async def get_approved_user_destinations(limit: int = 50):
     """Get all approved user-submitted destinations"""
     try:
-        destinations = list(db.user_destinations.find(
+        destinations = await db.user_destinations.find(
             {"status": "approved"},
             limit=limit
-        ).sort("approved_at", -1))
+        ).sort("approved_at", -1).to_list(None)
         
         for dest in destinations:
             dest['_id'] = str(dest['_id'])
@@ -494,8 +718,8 @@ async def get_approved_user_destinations(limit: int = 50):
 async def approve_destination(destination_id: str, approved_by: str):
     """Approve a user-submitted destination (admin function)"""
     try:
-        # Update destination status
-        result = db.user_destinations.update_one(
+        # Update destination status and read back the document in the same round trip
+        destination = await db.user_destinations.find_one_and_update(
             {"id": destination_id},
             {
                 "$set": {
@@ -503,25 +727,36 @@ async def approve_destination(destination_id: str, approved_by: str):
                     "approved_at": datetime.now(),
                     "approved_by": approved_by
                 }
-            }
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.matched_count == 0:
+        if destination is None:
             raise HTTPException(status_code=404, detail="Destination not found")
         
-        # Get destination to find user_id
-        destination = db.user_destinations.find_one({"id": destination_id})
-        if destination:
-            # Give additional points for approved destination
-            await add_points(
-                destination['user_id'],
-                15,
-                'destination_approved',
-                f'Destino "{destination["name"]}" aprobado',
-                destination_id
-            )
+        # Submissions stored before the GeoJSON copy existed get it now (the startup backfill covers the rest)
+        if 'location' not in destination:
+            location = geojson_point(destination.get('latitude'), destination.get('longitude'))
+            if location:
+                await db.user_destinations.update_one({"id": destination_id}, {"$set": {"location": location}})
+                destination['location'] = location
+        
+        # Merge into this worker's catalog in the background (others pick it up on their next refresh)
+        catalog_store.upsert_rows([user_destination_row(destination)])
+        
+        # Give additional points for approved destination
+        await add_points(
+            destination['user_id'],
+            15,
+            'destination_approved',
+            f'Destino "{destination["name"]}" aprobado',
+            destination_id
+        )
         
         return {"message": "Destination approved successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error approving destination: {str(e)}")
 
@@ -529,19 +764,11 @@ async def approve_destination(destination_id: str, approved_by: str):
 async def get_user_points(user_id: str):
     """Get user's current points and transaction history"""
     try:
-        # Calculate total points
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {"$group": {"_id": None, "total_points": {"$sum": "$points"}}}
-        ]
-        
-        result = list(db.point_transactions.aggregate(pipeline))
-        total_points = result[0]["total_points"] if result else 0
-        
-        # Get recent transactions
-        transactions = list(db.point_transactions.find(
-            {"user_id": user_id}
-        ).sort("timestamp", -1).limit(20))
+        # Materialized balance and recent transactions, fetched concurrently
+        total_points, transactions = await asyncio.gather(
+            get_balance(db, user_id),
+            db.point_transactions.find({"user_id": user_id}, {"applied": 0}).sort("timestamp", -1).limit(20).to_list(None)
+        )
         
         for trans in transactions:
             trans['_id'] = str(trans['_id'])
@@ -562,7 +789,7 @@ async def get_rewards(active_only: bool = True):
     """Get available rewards for redemption"""
     try:
         query = {"active": True} if active_only else {}
-        rewards = list(db.rewards.find(query).sort("points_required", 1))
+        rewards = await db.rewards.find(query).sort("points_required", 1).to_list(None)
         
         for reward in rewards:
             reward['_id'] = str(reward['_id'])
@@ -575,63 +802,19 @@ async def get_rewards(active_only: bool = True):
 async def redeem_reward(user_id: str, reward_id: str):
     """Redeem a reward using user points"""
     try:
-        # Get user's current points
-        user_points_data = await get_user_points(user_id)
-        current_points = user_points_data["total_points"]
-        
-        # Get reward details
-        reward = db.rewards.find_one({"id": reward_id})
-        if not reward:
-            raise HTTPException(status_code=404, detail="Reward not found")
-        
-        if not reward["active"]:
-            raise HTTPException(status_code=400, detail="Reward is not active")
-        
-        if current_points < reward["points_required"]:
-            raise HTTPException(status_code=400, detail="Insufficient points")
-        
-        # Check redemption limits
-        if reward.get("max_redemptions") and reward["current_redemptions"] >= reward["max_redemptions"]:
-            raise HTTPException(status_code=400, detail="Reward redemption limit reached")
-        
-        # Process redemption
-        redemption_id = str(uuid.uuid4())
-        
-        # Deduct points
-        await add_points(
-            user_id,
-            -reward["points_required"],
-            'redeem_reward',
-            f'Canjeado: {reward["title"]}',
-            reward_id
-        )
-        
-        # Update reward redemption count
-        db.rewards.update_one(
-            {"id": reward_id},
-            {"$inc": {"current_redemptions": 1}}
-        )
-        
-        # Create redemption record
-        redemption_data = {
-            "id": redemption_id,
-            "user_id": user_id,
-            "reward_id": reward_id,
-            "points_spent": reward["points_required"],
-            "status": "active",
-            "redeemed_at": datetime.now(),
-            "expires_at": reward.get("valid_until")
-        }
-        
-        db.redemptions.insert_one(redemption_data)
+        # Stock and balance are checked inside conditional atomic updates
+        result = await redeem_reward_atomically(db, user_id, reward_id)
+        reward = result["reward"]
         
         return {
             "message": "Reward redeemed successfully",
-            "redemption_id": redemption_id,
+            "redemption_id": result["redemption"]["id"],
             "points_spent": reward["points_required"],
             "partner_contact": reward["partner_contact"]
         }
         
+    except RedemptionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error redeeming reward: {str(e)}")
 
@@ -640,17 +823,8 @@ async def redeem_reward(user_id: str, reward_id: str):
 async def add_points(user_id: str, points: int, transaction_type: str, description: str, reference_id: str = None):
     """Helper function to add/subtract points and create transaction record"""
     try:
-        transaction_data = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "points": points,
-            "transaction_type": transaction_type,
-            "description": description,
-            "reference_id": reference_id,
-            "timestamp": datetime.now()
-        }
-        
-        db.point_transactions.insert_one(transaction_data)
+        # Ledger insert plus $inc of the user's materialized balance
+        await record_transaction(db, user_id, points, transaction_type, description, reference_id)
         
     except Exception as e:
         print(f"Error adding points: {str(e)}")
@@ -762,94 +936,38 @@ async def initialize_sample_rewards():
         ]
         
         # Insert sample rewards
-        db.rewards.insert_many(sample_rewards)
+        await db.rewards.insert_many(sample_rewards)
         
         return {"message": f"Initialized {len(sample_rewards)} sample rewards successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error initializing rewards: {str(e)}")
 
+@app.get("/api/admin/query-plans")
+async def get_query_plans():
+    """Explain the endpoint queries and report any that fall back to a collection scan (admin function)"""
+    try:
+        report = await check_query_plans(db)
+        return {
+            "ok": not any(result["collscan"] for result in report),
+            "queries": report
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking query plans: {str(e)}")
+
 @app.get("/api/destinations/statistics")
-async def get_destinations_statistics():
+async def get_destinations_statistics(request: Request):
     """Get detailed statistics about tourism destinations in Boyacá and Cundinamarca"""
     try:
-        url = "https://www.datos.gov.co/resource/jqjy-rhzv.json"
-        response = requests.get(url, params={'$limit': 5000})
-        response.raise_for_status()
-        
-        all_data = response.json()
-        
-        # Filter for our target departments
-        target_departments = ['BOYACA', 'CUNDINAMARCA']
-        filtered_data = [d for d in all_data if d.get('nomdep', '').strip().upper() in target_departments]
-        
-        # Calculate statistics
-        stats = {
-            'total_destinations': len(filtered_data),
-            'by_department': {},
-            'by_category': {},
-            'by_municipality': {},
-            'accommodation_stats': {
-                'total_rooms': 0,
-                'total_beds': 0,
-                'establishments_with_rooms': 0
-            }
-        }
-        
-        # Department statistics
-        for dept in target_departments:
-            dept_data = [d for d in filtered_data if d.get('nomdep', '').strip().upper() == dept]
-            dept_display = 'Boyacá' if dept == 'BOYACA' else 'Cundinamarca'
-            
-            stats['by_department'][dept_display] = {
-                'count': len(dept_data),
-                'categories': {}
-            }
-            
-            # Categories by department
-            for item in dept_data:
-                category = item.get('categoria', 'No especificado')
-                if category not in stats['by_department'][dept_display]['categories']:
-                    stats['by_department'][dept_display]['categories'][category] = 0
-                stats['by_department'][dept_display]['categories'][category] += 1
-        
-        # Overall category statistics
-        for item in filtered_data:
-            category = item.get('categoria', 'No especificado')
-            if category not in stats['by_category']:
-                stats['by_category'][category] = 0
-            stats['by_category'][category] += 1
-            
-            # Municipality statistics
-            municipality = item.get('nombre_muni', 'No especificado')
-            dept_name = 'Boyacá' if item.get('nomdep', '').strip().upper() == 'BOYACA' else 'Cundinamarca'
-            muni_key = f"{municipality} ({dept_name})"
-            
-            if muni_key not in stats['by_municipality']:
-                stats['by_municipality'][muni_key] = 0
-            stats['by_municipality'][muni_key] += 1
-            
-            # Accommodation statistics
-            if item.get('habitaciones'):
-                try:
-                    rooms = int(float(item['habitaciones']))
-                    stats['accommodation_stats']['total_rooms'] += rooms
-                    stats['accommodation_stats']['establishments_with_rooms'] += 1
-                except (ValueError, TypeError):
-                    pass
-            
-            if item.get('camas'):
-                try:
-                    beds = int(float(item['camas']))
-                    stats['accommodation_stats']['total_beds'] += beds
-                except (ValueError, TypeError):
-                    pass
-        
-        # Sort municipalities by count
-        stats['by_municipality'] = dict(
-            sorted(stats['by_municipality'].items(), key=lambda x: x[1], reverse=True)
-        )
-        
-        return stats
+        # Computed, serialized and compressed once per catalog snapshot and kept up to date incrementally
+        snapshot = await catalog_store.get()
+        headers = {'X-Catalog-Version': snapshot.version}
+        content = snapshot.statistics_json
+        encoding = choose_encoding(request.headers.get('accept-encoding', ''))
+        if encoding in snapshot.statistics_compressed:
+            # Already encoded, so the compression middleware passes it through
+            content = snapshot.statistics_compressed[encoding]
+            headers.update({'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+        return Response(content=content, media_type="application/json", headers=headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching statistics: {str(e)}")
@@ -860,149 +978,140 @@ async def search_destinations(
     department: Optional[str] = None,
     category: Optional[str] = None,
     municipality: Optional[str] = None,
-    limit: int = 20
+    limit: int = 20,
+    include_facets: bool = False
 ):
     """Advanced search for tourism destinations"""
     try:
-        url = "https://www.datos.gov.co/resource/jqjy-rhzv.json"
-        response = requests.get(url, params={'$limit': 5000})
-        response.raise_for_status()
-        
-        all_data = response.json()
+        # Boyacá and Cundinamarca destinations from the catalog snapshot
+        snapshot = await catalog_store.get()
         
-        # Filter for Boyacá and Cundinamarca
-        target_departments = ['BOYACA', 'CUNDINAMARCA']
-        results = []
-        
-        for item in all_data:
-            dept_name = item.get('nomdep', '').strip().upper()
-            if dept_name not in target_departments:
-                continue
-            
-            # Apply filters
-            if department:
-                req_dept = department.strip().upper()
-                if req_dept in ['BOYACÁ', 'BOYACA'] and dept_name != 'BOYACA':
-                    continue
-                elif req_dept == 'CUNDINAMARCA' and dept_name != 'CUNDINAMARCA':
-                    continue
-            
-            if category and category.lower() not in item.get('categoria', '').lower():
-                continue
-            
-            if municipality and municipality.lower() not in item.get('nombre_muni', '').lower():
-                continue
-            
-            # Text search in name and category
-            if query:
-                search_text = f"{item.get('razon_social', '')} {item.get('categoria', '')} {item.get('nombre_muni', '')}".lower()
-                if query.lower() not in search_text:
-                    continue
-            
-            # Process and add to results
-            processed_item = process_destination_data(item)
-            results.append(processed_item)
+        # Filters resolve by intersecting the precomputed facet bitmaps
+        selection = snapshot.facets.filter(department=department, category=category, municipality=municipality)
         
-        # Sort by relevance (name match first, then by municipality)
+        # Text search goes through the inverted index, already sorted by BM25 relevance
+        # (ties keep the department/municipality order of the snapshot)
         if query:
-            results.sort(key=lambda x: (
-                0 if query.lower() in x.get('razon_social', '').lower() else 1,
-                x.get('nombre_muni', '')
-            ))
+            hits = [position for position, score in snapshot.search_index.search(query)]
+            if selection is not None:
+                hits = [position for position in hits if selection >> position & 1]
+            if include_facets:
+                selection = positions_to_bitmap(hits, len(snapshot.destinations))
+            results = [snapshot.destinations[position] for position in hits[:limit]]
+        elif selection is not None:
+            results = [snapshot.destinations[position] for position in islice(iter_positions(selection), limit)]
         else:
-            results.sort(key=lambda x: (x.get('nomdep', ''), x.get('nombre_muni', '')))
+            results = snapshot.destinations[:limit]
         
-        return results[:limit]
+        if include_facets:
+            return catalog_response(snapshot, {
+                "results": results,
+                "facets": snapshot.facets.counts(selection)
+            })
+        return catalog_response(snapshot, results)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching destinations: {str(e)}")
-async def get_popular_destinations(limit: int = 10):
-    """Get most popular destinations based on user interactions"""
+
+@app.get("/api/destinations/{rnt}/similar")
+async def get_similar_destinations(rnt: str, limit: int = 10, include_user_destinations: bool = False):
+    """Destinations most similar to one catalog entry by name, category and municipality"""
+    if not 1 <= limit <= SIMILAR_TOP_K:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SIMILAR_TOP_K}")
     try:
-        pipeline = [
-            {"$match": {"action": {"$in": ["like", "view"]}}},
-            {"$group": {"_id": "$destination_rnt", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": limit}
-        ]
-        
-        popular_destinations = list(db.user_interactions.aggregate(pipeline))
+        snapshot = await catalog_store.get()
         
-        # Fetch full destination data
-        destination_rnts = [item['_id'] for item in popular_destinations]
-        if destination_rnts:
-            url = "https://www.datos.gov.co/resource/jqjy-rhzv.json"
-            response = requests.get(url, params={"$limit": 1000})
-            all_destinations = response.json()
-            
-            result = []
-            for item in popular_destinations:
-                dest = next((d for d in all_destinations if d.get('rnt') == item['_id']), None)
-                if dest:
-                    dest['interaction_count'] = item['count']
-                    result.append(dest)
-            
-            return result
+        positions = snapshot.content.positions_of([rnt])
+        if not positions:
+            raise HTTPException(status_code=404, detail="Destination not found")
+        position = positions[0]
         
-        return []
+        # Neighbours were computed with the snapshot, so this only reads the top-k entries
+        results = []
+        for neighbor, score in snapshot.similar.similar(position, limit, filtered=not include_user_destinations):
+            dest = dict(snapshot.destinations[neighbor])
+            dest['similarity_score'] = round(score, 4)
+            results.append(dest)
+        
+        return catalog_response(snapshot, results)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching similar destinations: {str(e)}")
+
+@app.get("/api/destinations/nearby")
+async def get_nearby_destinations(
+    lat: float,
+    lon: float,
+    radius: float = 10,
+    category: Optional[str] = None,
+    limit: int = 50
+):
+    """Geolocated catalog destinations within `radius` km of a point, nearest first"""
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="lat must be within [-90, 90] and lon within [-180, 180]")
+    if not 0 < radius <= NEARBY_MAX_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"radius must be greater than 0 and at most {NEARBY_MAX_RADIUS_KM:g} km")
+    
+    try:
+        # Grid cells around the point, category filtered before distances are computed
+        snapshot = await catalog_store.get()
+        found = snapshot.geo.nearby(lat, lon, radius, category=category, limit=limit)
         
+        results = []
+        for destination, distance in found:
+            dest = dict(destination)
+            dest['distance_km'] = round(distance, 3)
+            results.append(dest)
+        return catalog_response(snapshot, results)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching popular destinations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching nearby destinations: {str(e)}")
 
-@app.get("/api/analytics/trends")
-async def get_travel_trends():
-    """Get travel trends and patterns"""
+@app.get("/api/destinations/popular")
+async def get_popular_destinations(limit: int = 10, window: str = 'all'):
+    """Get most popular destinations based on user interactions ('all' time or 'trending' now)"""
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of: {', '.join(WINDOWS)}")
+    
     try:
-        # Department trends
-        dept_pipeline = [
-            {"$lookup": {
-                "from": "user_preferences",
-                "localField": "user_id", 
-                "foreignField": "id",
-                "as": "user_prefs"
-            }},
-            {"$unwind": "$user_prefs"},
-            {"$unwind": "$user_prefs.preferred_departments"},
-            {"$group": {"_id": "$user_prefs.preferred_departments", "count": {"$sum": 1}}}
-        ]
+        snapshot = await catalog_store.get()
         
-        department_trends = list(db.user_interactions.aggregate(dept_pipeline))
-        
-        # Category trends
-        cat_pipeline = [
-            {"$lookup": {
-                "from": "user_preferences",
-                "localField": "user_id",
-                "foreignField": "id", 
-                "as": "user_prefs"
-            }},
-            {"$unwind": "$user_prefs"},
-            {"$unwind": "$user_prefs.preferred_categories"},
-            {"$group": {"_id": "$user_prefs.preferred_categories", "count": {"$sum": 1}}}
-        ]
+        # Ask for a few extra in case some popular rnt values left the catalog
+        result = []
+        for rnt, score in popularity.top(limit * 2, window):
+            positions = snapshot.content.positions_of([rnt])
+            if not positions:
+                continue
+            dest = dict(snapshot.destinations[positions[0]])
+            dest['interaction_count'] = round(score, 2) if window == 'trending' else int(score)
+            result.append(dest)
+            if len(result) == limit:
+                break
         
-        category_trends = list(db.user_interactions.aggregate(cat_pipeline))
-        
-        # Travel style trends
-        style_pipeline = [
-            {"$lookup": {
-                "from": "user_preferences",
-                "localField": "user_id",
-                "foreignField": "id",
-                "as": "user_prefs"
-            }},
-            {"$unwind": "$user_prefs"},
-            {"$group": {"_id": "$user_prefs.travel_style", "count": {"$sum": 1}}}
-        ]
+        return catalog_response(snapshot, result)
         
-        travel_style_trends = list(db.user_interactions.aggregate(style_pipeline))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching popular destinations: {str(e)}")
+
+@app.get("/api/analytics/trends")
+async def get_travel_trends(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Get travel trends and patterns, optionally for interactions in [start, end)"""
+    try:
+        # Hourly/daily counters maintained as interactions arrive
+        trends, total_users, status = await asyncio.gather(
+            read_trends(db, start, end),
+            db.user_preferences.count_documents({}),
+            rollups_status(db)
+        )
         
         return {
-            "department_trends": department_trends,
-            "category_trends": category_trends,
-            "travel_style_trends": travel_style_trends,
-            "total_users": db.user_preferences.count_documents({}),
-            "total_interactions": db.user_interactions.count_documents({})
+            "department_trends": trends["department_trends"],
+            "category_trends": trends["category_trends"],
+            "travel_style_trends": trends["travel_style_trends"],
+            "total_users": total_users,
+            "total_interactions": trends["total_interactions"],
+            # Anything but "built" means the counts miss interactions stored before the rollups
+            "rollups_status": status
         }
         
     except Exception as e:
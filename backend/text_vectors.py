@@ -0,0 +1,188 @@
+"""Hashed TF-IDF vectors over the catalog text fields and precomputed "similar destinations"
+
+Tokens are hashed into a fixed number of columns, so no vocabulary has to be
+kept per snapshot. Each destination's top-k neighbours are computed when the snapshot is built
+and kept as int32/float32 arrays, so a lookup only reads k entries.
+"""
+import copy
+import os
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from search_index import SEARCH_FIELDS, tokenize
+
+# Number of hashed feature columns
+HASH_FEATURES = 1 << 18
+
+# Neighbours precomputed per destination
+SIMILAR_TOP_K = int(os.environ.get('SIMILAR_TOP_K', '20'))
+
+# Rows scored per block while computing neighbours (bounds the dense block to BLOCK x size floats)
+NEIGHBOR_BLOCK_SIZE = 512
+
+
+def hashed_terms(doc: Dict[str, Any], fields: Dict[str, float] = SEARCH_FIELDS) -> Dict[int, float]:
+    """Boosted term frequencies of a document keyed by hashed column"""
+    frequencies = defaultdict(float)
+    for field, boost in fields.items():
+        for token in tokenize(str(doc.get(field) or '')):
+            frequencies[zlib.crc32(token.encode('utf-8')) % HASH_FEATURES] += boost
+    return frequencies
+
+
+class TextVectorIndex:
+    """L2-normalized TF-IDF rows over the same positions as the snapshot, with top-k neighbours
+
+    excluded marks positions left out of a second, filtered neighbour list
+    (e.g. user destinations), so a filtered lookup still finds top_k entries.
+    """
+
+    def __init__(
+        self,
+        documents: Sequence[Dict[str, Any]],
+        top_k: int = SIMILAR_TOP_K,
+        excluded: Optional[Sequence[bool]] = None,
+    ):
+        self.size = len(documents)
+        self.top_k = top_k
+        self.excluded = np.asarray(excluded if excluded is not None else [False] * self.size, dtype=bool)
+
+        counts = self._term_matrix(documents)
+        document_frequency = np.bincount(counts.indices, minlength=HASH_FEATURES)
+        self.idf = np.log((1 + self.size) / (1 + document_frequency)).astype(np.float32) + 1.0
+        self.matrix = self._weigh(counts)
+
+        self.neighbors = np.full((self.size, top_k), -1, dtype=np.int32)
+        self.scores = np.zeros((self.size, top_k), dtype=np.float32)
+        if self.excluded.any():
+            self.filtered_neighbors = np.full((self.size, top_k), -1, dtype=np.int32)
+            self.filtered_scores = np.zeros((self.size, top_k), dtype=np.float32)
+        else:
+            self.filtered_neighbors, self.filtered_scores = self.neighbors, self.scores
+        self._compute_neighbors()
+
+    @staticmethod
+    def _term_matrix(documents: Sequence[Dict[str, Any]]) -> sparse.csr_matrix:
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for doc in documents:
+            for column, frequency in hashed_terms(doc).items():
+                indices.append(column)
+                data.append(frequency)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(documents), HASH_FEATURES)
+        )
+
+    def _weigh(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Sublinear TF times IDF, each row scaled to unit length"""
+        weighted = counts.copy()
+        weighted.data = (1.0 + np.log(weighted.data)) * self.idf[weighted.indices]
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return (sparse.diags((1.0 / norms).astype(np.float32)) @ weighted).tocsr()
+
+    def _compute_neighbors(self, rows: Optional[np.ndarray] = None):
+        """Fill the neighbour lists of the given rows (all of them by default)"""
+        if self.size < 2 or self.top_k <= 0:
+            return
+        rows = np.arange(self.size) if rows is None else rows
+        k = min(self.top_k, self.size - 1)
+        filtered = self.filtered_neighbors is not self.neighbors
+        transposed = self.matrix.T.tocsc()
+        for start in range(0, len(rows), NEIGHBOR_BLOCK_SIZE):
+            block_rows = rows[start:start + NEIGHBOR_BLOCK_SIZE]
+            block = (self.matrix[block_rows] @ transposed).toarray()
+            block[np.arange(len(block_rows)), block_rows] = -1.0
+            self.neighbors[block_rows, :k], self.scores[block_rows, :k] = self._best(block, k)
+            if filtered:
+                block[:, self.excluded] = -1.0
+                self.filtered_neighbors[block_rows, :k], self.filtered_scores[block_rows, :k] = self._best(block, k)
+
+    def with_document(self, position: int, doc: Dict[str, Any], excluded: bool = False) -> 'TextVectorIndex':
+        """Copy of the index with doc appended (position == size) or put in place of the row there
+
+        The row is weighted with the IDF of the last full build. Only its own
+        neighbours are computed; the other rows take it into their lists when
+        it beats their k-th neighbour, and rows that listed the replaced row
+        are recomputed, since it may have dropped out of their top k.
+        """
+        index = copy.copy(self)
+        row = self._weigh(self._term_matrix([doc]))
+        appended = position == self.size
+
+        def resized(array: np.ndarray, fill) -> np.ndarray:
+            return np.pad(array, ((0, 1), (0, 0)), constant_values=fill) if appended else array.copy()
+
+        if appended:
+            index.size += 1
+            index.matrix = sparse.vstack([self.matrix, row], format='csr')
+            index.excluded = np.append(self.excluded, excluded)
+        else:
+            index.matrix = sparse.vstack([self.matrix[:position], row, self.matrix[position + 1:]], format='csr')
+            index.excluded = self.excluded.copy()
+            index.excluded[position] = excluded
+        index.neighbors = resized(self.neighbors, -1)
+        index.scores = resized(self.scores, 0)
+        if not index.excluded.any():
+            index.filtered_neighbors, index.filtered_scores = index.neighbors, index.scores
+        elif self.filtered_neighbors is self.neighbors:
+            # The first excluded row splits the filtered lists off the full ones
+            index.filtered_neighbors, index.filtered_scores = index.neighbors.copy(), index.scores.copy()
+        else:
+            index.filtered_neighbors = resized(self.filtered_neighbors, -1)
+            index.filtered_scores = resized(self.filtered_scores, 0)
+        if index.size < 2 or index.top_k <= 0:
+            return index
+
+        similarities = (index.matrix @ row.T).toarray().ravel()
+        similarities[position] = -1.0
+        lists = [(index.neighbors, index.scores, None)]
+        if index.filtered_neighbors is not index.neighbors:
+            lists.append((index.filtered_neighbors, index.filtered_scores, index.excluded))
+        stale = set()
+        for neighbors, scores, skipped in lists:
+            stale.update(np.flatnonzero((neighbors == position).any(axis=1)).tolist())
+            if skipped is not None and skipped[position]:
+                continue
+            # Rows the new row enters: merge it in and keep the best top_k
+            entered = np.flatnonzero((similarities > 0) & (similarities > scores[:, -1]))
+            if len(entered):
+                candidates = np.hstack([neighbors[entered], np.full((len(entered), 1), position, dtype=np.int32)])
+                candidate_scores = np.hstack([scores[entered], similarities[entered, None].astype(np.float32)])
+                order = np.argsort(-candidate_scores, axis=1, kind='stable')[:, :index.top_k]
+                neighbors[entered] = np.take_along_axis(candidates, order, axis=1)
+                scores[entered] = np.take_along_axis(candidate_scores, order, axis=1)
+        stale.discard(position)
+        index._compute_neighbors(np.asarray(sorted(stale | {position}), dtype=np.int64))
+        return index
+
+    @staticmethod
+    def _best(block: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k columns of every row of a similarity block, most similar first"""
+        best = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(block, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        # Neighbours sharing no term are left as -1
+        best[best_scores <= 0] = -1
+        return best, np.maximum(best_scores, 0)
+
+    def similar(self, position: int, k: int, filtered: bool = False) -> List[Tuple[int, float]]:
+        """Precomputed (position, cosine similarity) neighbours, most similar first
+
+        filtered leaves out the excluded positions.
+        """
+        neighbors, scores = (self.filtered_neighbors, self.filtered_scores) if filtered else (self.neighbors, self.scores)
+        return [
+            (int(neighbor), float(score))
+            for neighbor, score in zip(neighbors[position, :k], scores[position, :k])
+            if neighbor >= 0
+        ]
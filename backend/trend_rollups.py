@@ -0,0 +1,312 @@
+"""Hourly and daily interaction counters per department, category and travel style (trend_rollups)
+
+Each interaction is attributed to the preferences of its user at the time it
+is tracked and $inc-ed into one document per (granularity, bucket, dimension,
+value), so /api/analytics/trends reads a few small documents instead of
+joining every interaction with user_preferences.
+
+The first API worker to start on a database without rollups backfills them
+once from the raw events, guarded by a lease in sync_state so other workers
+skip it; until it finishes, trends report rollups_status "building". Run
+`python trend_rollups.py rebuild` to recompute the counters by hand.
+
+Hour buckets expire after HOUR_BUCKET_RETENTION_DAYS (TTL index); ranges
+reaching further back are answered with day resolution.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+GRANULARITIES = ('hour', 'day')
+
+# Dimension of the per-bucket interaction total
+TOTAL_DIMENSION = 'interactions'
+
+WRITE_BATCH_SIZE = 1000
+
+# Days hour buckets are kept (day buckets are kept forever)
+HOUR_BUCKET_RETENTION_DAYS = int(os.environ.get('HOUR_BUCKET_RETENTION_DAYS', '30'))
+
+# Seconds a worker may hold the backfill lease before another one takes over
+BACKFILL_LEASE_SECONDS = int(os.environ.get('TREND_ROLLUPS_BACKFILL_LEASE_SECONDS', '3600'))
+
+# sync_state document recording whether the rollups were built
+SYNC_STATE_ID = 'trend_rollups'
+
+# Set once the rollups are known to be built, so trends stop reading sync_state
+_built = False
+
+
+def local_naive(timestamp: datetime) -> datetime:
+    """Timestamps are stored naive in server local time, like datetime.now()"""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    timestamp = local_naive(timestamp)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def interaction_dimensions(prefs: Optional[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """(dimension, value) pairs one interaction counts towards, given its user's preferences"""
+    dimensions = [(TOTAL_DIMENSION, '')]
+    if not prefs:
+        return dimensions
+    for dept in prefs.get('preferred_departments') or []:
+        dimensions.append(('department', dept))
+    for category in prefs.get('preferred_categories') or []:
+        dimensions.append(('category', category))
+    if prefs.get('travel_style') is not None:
+        dimensions.append(('travel_style', prefs['travel_style']))
+    return dimensions
+
+
+def count_interactions(
+    interactions: Iterable[Dict[str, Any]],
+    prefs_by_user: Dict[str, Dict[str, Any]],
+) -> Counter:
+    """Counter keyed by (granularity, bucket, dimension, value)"""
+    counts = Counter()
+    for interaction in interactions:
+        timestamp = interaction.get('timestamp') or datetime.now()
+        dimensions = interaction_dimensions(prefs_by_user.get(interaction['user_id']))
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(timestamp, granularity)
+            for dimension, value in dimensions:
+                counts[(granularity, bucket, dimension, value)] += 1
+    return counts
+
+
+def _updates(counts: Counter) -> List[UpdateOne]:
+    return [
+        UpdateOne(
+            {"granularity": granularity, "bucket": bucket, "dimension": dimension, "value": value},
+            {"$inc": {"count": count}},
+            upsert=True
+        )
+        for (granularity, bucket, dimension, value), count in counts.items()
+    ]
+
+
+async def _preferences_by_user(db, query: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {
+        prefs['id']: prefs
+        async for prefs in db.user_preferences.find(
+            query, {"_id": 0, "id": 1, "preferred_departments": 1, "preferred_categories": 1, "travel_style": 1}
+        )
+    }
+
+
+async def record_interactions(db, interactions: List[Dict[str, Any]]):
+    """$inc the rollups for newly stored interactions (one preferences read, one bulk_write)"""
+    if not interactions:
+        return
+    user_ids = list({interaction['user_id'] for interaction in interactions})
+    prefs_by_user = await _preferences_by_user(db, {"id": {"$in": user_ids}})
+    operations = _updates(count_interactions(interactions, prefs_by_user))
+    for offset in range(0, len(operations), WRITE_BATCH_SIZE):
+        await db.trend_rollups.bulk_write(operations[offset:offset + WRITE_BATCH_SIZE], ordered=False)
+
+
+def _bucket_range(low: Optional[datetime], high: Optional[datetime]) -> Dict[str, Any]:
+    condition = {}
+    if low is not None:
+        condition["$gte"] = low
+    if high is not None:
+        condition["$lt"] = high
+    return {"bucket": condition} if condition else {}
+
+
+def _day_resolution(timestamp: datetime, round_up: bool) -> datetime:
+    day = bucket_start(timestamp, 'day')
+    if round_up and day < timestamp:
+        day += timedelta(days=1)
+    return day
+
+
+def range_buckets(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Bucket filters covering [start, end): whole days where possible, hours at the edges
+
+    Hour buckets containing start or end are counted whole, so ranges have
+    hour resolution; an edge older than the hour bucket retention is widened
+    to the day that contains it.
+    """
+    if start is None and end is None:
+        return [{"granularity": "day"}]
+    retained = bucket_start(now or datetime.now(), 'day') - timedelta(days=HOUR_BUCKET_RETENTION_DAYS - 1)
+    start = bucket_start(start, 'hour') if start is not None else None
+    end = local_naive(end) if end is not None else None
+    if start is not None and start < retained:
+        start = _day_resolution(start, round_up=False)
+    if end is not None and end < retained:
+        end = _day_resolution(end, round_up=True)
+    if start is not None and end is not None and end <= start:
+        return []
+
+    first_day = None
+    if start is not None:
+        first_day = bucket_start(start, 'day')
+        if first_day < start:
+            first_day += timedelta(days=1)
+    last_day = bucket_start(end, 'day') if end is not None else None
+    if first_day is not None and last_day is not None and first_day >= last_day:
+        return [{"granularity": "hour", **_bucket_range(start, end)}]
+
+    filters = [{"granularity": "day", **_bucket_range(first_day, last_day)}]
+    if start is not None and start < first_day:
+        filters.append({"granularity": "hour", **_bucket_range(start, first_day)})
+    if end is not None and last_day < end:
+        filters.append({"granularity": "hour", **_bucket_range(last_day, end)})
+    return filters
+
+
+async def read_trends(db, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Summed counters per dimension for a time range (all time when neither bound is given)"""
+    filters = range_buckets(start, end)
+    totals: Dict[str, List[Dict[str, Any]]] = {"department": [], "category": [], "travel_style": [], TOTAL_DIMENSION: []}
+    if filters:
+        pipeline = [
+            {"$match": filters[0] if len(filters) == 1 else {"$or": filters}},
+            {"$group": {"_id": {"dimension": "$dimension", "value": "$value"}, "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}}
+        ]
+        async for item in db.trend_rollups.aggregate(pipeline):
+            dimension = item["_id"]["dimension"]
+            if dimension in totals:
+                totals[dimension].append({"_id": item["_id"]["value"], "count": item["count"]})
+
+    interactions = totals[TOTAL_DIMENSION]
+    return {
+        "department_trends": totals["department"],
+        "category_trends": totals["category"],
+        "travel_style_trends": totals["travel_style"],
+        "total_interactions": interactions[0]["count"] if interactions else 0
+    }
+
+
+async def rebuild_rollups(db) -> Dict[str, int]:
+    """Recompute every counter from user_interactions and the current user_preferences
+
+    The counters are built in a staging collection and renamed over
+    trend_rollups, so readers never see a partial table. Interactions
+    inserted while the rebuild ran (their $inc went to the replaced
+    collection) are counted again afterwards; one recorded between the
+    rename and that replay can be counted twice. Run one rebuild at a time.
+    """
+    from indexes import INDEXES
+
+    # Interactions inserted up to now are counted from the raw events, later ones are replayed
+    cutoff = ObjectId()
+    prefs_by_user = await _preferences_by_user(db, {})
+    counts = Counter()
+    interactions = 0
+    async for interaction in db.user_interactions.find(
+        {"_id": {"$lt": cutoff}}, {"_id": 0, "user_id": 1, "timestamp": 1}
+    ):
+        counts.update(count_interactions([interaction], prefs_by_user))
+        interactions += 1
+
+    staging = db[f"trend_rollups_build_{uuid.uuid4().hex}"]
+    try:
+        await staging.create_indexes(INDEXES['trend_rollups'])
+        operations = _updates(counts)
+        for offset in range(0, len(operations), WRITE_BATCH_SIZE):
+            await staging.bulk_write(operations[offset:offset + WRITE_BATCH_SIZE], ordered=False)
+        await staging.rename('trend_rollups', dropTarget=True)
+    except BaseException:
+        await staging.drop()
+        raise
+
+    late = await db.user_interactions.find(
+        {"_id": {"$gte": cutoff}}, {"_id": 0, "user_id": 1, "timestamp": 1}
+    ).to_list(None)
+    await record_interactions(db, late)
+    return {"interactions": interactions + len(late), "counters": len(operations), "replayed": len(late)}
+
+
+async def _mark_built(db, result: Dict[str, int]):
+    global _built
+    await db.sync_state.update_one(
+        {"_id": SYNC_STATE_ID},
+        {"$set": {"status": "built", "built_at": datetime.now(), **result}, "$unset": {"lease_until": ""}},
+        upsert=True
+    )
+    _built = True
+
+
+async def rollups_status(db) -> str:
+    """'built', 'building', 'failed' or 'missing' (no backfill attempted yet)"""
+    global _built
+    if _built:
+        return 'built'
+    state = await db.sync_state.find_one({"_id": SYNC_STATE_ID}, {"status": 1})
+    status = state.get("status", 'missing') if state else 'missing'
+    _built = status == 'built'
+    return status
+
+
+async def backfill_once(db) -> Optional[Dict[str, int]]:
+    """Build the rollups from the raw events unless they were built already or another worker is at it
+
+    The lease is taken with one upsert on the sync_state document: it only
+    matches a failed or expired attempt, and when the document does not exist
+    yet the insert races on _id, so exactly one worker wins.
+    """
+    now = datetime.now()
+    try:
+        await db.sync_state.update_one(
+            {
+                "_id": SYNC_STATE_ID,
+                "$or": [{"status": "failed"}, {"status": "building", "lease_until": {"$lt": now}}]
+            },
+            {"$set": {"status": "building", "lease_until": now + timedelta(seconds=BACKFILL_LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Built already, or another worker holds the lease
+        await rollups_status(db)
+        return None
+
+    try:
+        result = await rebuild_rollups(db)
+    except BaseException:
+        await db.sync_state.update_one({"_id": SYNC_STATE_ID}, {"$set": {"status": "failed"}})
+        raise
+    await _mark_built(db, result)
+    return result
+
+
+async def main() -> int:
+    from database import db
+
+    result = await rebuild_rollups(db)
+    await _mark_built(db, result)
+    print(
+        f"{result['counters']} counters rebuilt from {result['interactions']} interactions "
+        f"({result['replayed']} recorded during the rebuild replayed)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['rebuild'])
+    parser.parse_args()
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,115 @@
+"""User preference feature vectors for vectorized collaborative filtering"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Similarity weight of each shared feature: departments 3, categories 2, age range 1, travel style 2
+FEATURE_WEIGHTS = {
+    'department': 3.0,
+    'category': 2.0,
+    'age_range': 1.0,
+    'travel_style': 2.0,
+}
+
+# Fields read to encode a user (name, email and the rest are never loaded)
+PREFERENCE_FIELDS = {
+    '_id': 0, 'id': 1, 'preferred_departments': 1, 'preferred_categories': 1, 'age_range': 1, 'travel_style': 1
+}
+
+
+def preference_features(prefs: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """One (kind, value) feature per distinct preference, so a dot product counts shared ones"""
+    features = set()
+    for dept in prefs.get('preferred_departments') or []:
+        features.add(('department', dept))
+    for category in prefs.get('preferred_categories') or []:
+        features.add(('category', category))
+    if prefs.get('age_range') is not None:
+        features.add(('age_range', prefs['age_range']))
+    if prefs.get('travel_style') is not None:
+        features.add(('travel_style', prefs['travel_style']))
+    return list(features)
+
+
+class UserVectorIndex:
+    """Binary user x feature matrix; similarity to every user is one matrix-vector product"""
+
+    def __init__(self, row_capacity: int = 1024, column_capacity: int = 64):
+        self._matrix = np.zeros((row_capacity, column_capacity), dtype=np.float32)
+        self._columns: Dict[Tuple[str, str], int] = {}
+        self._rows: Dict[str, int] = {}
+        self._user_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _column(self, feature: Tuple[str, str]) -> int:
+        column = self._columns.get(feature)
+        if column is None:
+            column = len(self._columns)
+            if column >= self._matrix.shape[1]:
+                grown = np.zeros((self._matrix.shape[0], self._matrix.shape[1] * 2), dtype=np.float32)
+                grown[:, :self._matrix.shape[1]] = self._matrix
+                self._matrix = grown
+            self._columns[feature] = column
+        return column
+
+    def _row(self, user_id: str) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            return row
+        row = len(self._user_ids)
+        if row >= self._matrix.shape[0]:
+            grown = np.zeros((self._matrix.shape[0] * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._matrix.shape[0]] = self._matrix
+            self._matrix = grown
+        self._user_ids.append(user_id)
+        self._rows[user_id] = row
+        return row
+
+    def upsert(self, prefs: Dict[str, Any]):
+        """Encode (or re-encode) one user's preferences"""
+        user_id = prefs['id']
+        columns = [self._column(feature) for feature in preference_features(prefs)]
+        row = self._row(user_id)
+        self._matrix[row] = 0.0
+        self._matrix[row, columns] = 1.0
+
+    def query_vector(self, prefs: Dict[str, Any]) -> np.ndarray:
+        """Weighted vector of the user's features that other users can share"""
+        query = np.zeros(self._matrix.shape[1], dtype=np.float32)
+        for kind, value in preference_features(prefs):
+            column = self._columns.get((kind, value))
+            if column is not None:
+                query[column] = FEATURE_WEIGHTS[kind]
+        return query
+
+    def top_similar(self, prefs: Dict[str, Any], k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """Top-k users by weighted shared preferences (score > 0), best first"""
+        used_rows = len(self._user_ids)
+        if not used_rows or k <= 0:
+            return []
+
+        scores = self._matrix[:used_rows] @ self.query_vector(prefs)
+        for user_id in exclude:
+            row = self._rows.get(user_id)
+            if row is not None:
+                scores[row] = 0.0
+
+        k = min(k, used_rows)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [
+            (self._user_ids[row], float(scores[row]))
+            for row in candidates
+            if scores[row] > 0
+        ]
+
+    @classmethod
+    async def load(cls, collection) -> 'UserVectorIndex':
+        """Build an index from every stored preference document (only the encoded fields are read)"""
+        index = cls()
+        async for prefs in collection.find({}, PREFERENCE_FIELDS):
+            if prefs.get('id'):
+                index.upsert(prefs)
+        return index
@@ -0,0 +1,161 @@
+"""Bounded write-behind buffer that flushes events to MongoDB in batches"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Backoff between attempts to flush a failing batch: doubles from the base up to the cap
+FLUSH_RETRY_BASE_SECONDS = 0.1
+FLUSH_RETRY_MAX_SECONDS = float(os.environ.get('WRITE_BEHIND_RETRY_MAX_SECONDS', '5'))
+
+# Seconds stop() keeps retrying and draining before the remaining events are dropped
+DRAIN_TIMEOUT_SECONDS = float(os.environ.get('WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS', '30'))
+
+
+class WriteBehindBuffer:
+    """Queue events in memory and write them by size or time with one flush call per batch
+
+    offer() never blocks: it returns False when the queue is full so the caller
+    can apply backpressure. A failing batch stays at the head and is retried
+    with capped backoff until it is written (the queue fills up meanwhile, so
+    offer() starts refusing events). stop() drains everything still queued
+    and only drops events once drain_timeout has passed.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        drain_timeout: float = DRAIN_TIMEOUT_SECONDS,
+    ):
+        self._flush = flush
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._drain_deadline = 0.0
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting events and wait until the queue is drained"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._drain_deadline = time.monotonic() + self.drain_timeout
+        await self._task
+        self._task = None
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queue an event, or return False if the buffer is full or stopped"""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _drain_expired(self) -> bool:
+        return self._stopping and time.monotonic() >= self._drain_deadline
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._write(batch)
+            if self._drain_expired() and not self._queue.empty():
+                remaining = self._queue.qsize()
+                while not self._queue.empty():
+                    self._queue.get_nowait()
+                self.dropped += remaining
+                print(f"Dropped {remaining} buffered events still queued at the drain deadline")
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f"Error flushing {len(batch)} buffered events (attempt {attempt}): {str(e)}")
+                if self._drain_expired():
+                    self.dropped += len(batch)
+                    print(f"Dropped {len(batch)} buffered events unwritten at the drain deadline")
+                    return
+                delay = min(FLUSH_RETRY_BASE_SECONDS * 2 ** (attempt - 1), FLUSH_RETRY_MAX_SECONDS)
+                if self._stopping:
+                    delay = min(delay, max(self._drain_deadline - time.monotonic(), 0.0))
+                await asyncio.sleep(delay)
+                continue
+
+            elapsed = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed += len(batch)
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+            return
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# The backend modules use flat imports and run from backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory Motor database with the declared indexes"""
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    from indexes import ensure_indexes
+
+    database = mongomock_motor.AsyncMongoMockClient().test
+    asyncio.run(ensure_indexes(database))
+    return database
+
+
+@pytest.fixture
+def fail_once(monkeypatch, db):
+    """fail_once('user_balances', 'bulk_write') makes the next such call raise, then behave normally
+
+    Motor collections share one class, so the method is patched there and
+    filtered by collection name.
+    """
+    def install(collection: str, method: str):
+        cls = type(db[collection])
+        original = getattr(cls, method)
+        state = {'failed': False}
+
+        async def flaky(self, *args, **kwargs):
+            if self.name == collection and not state['failed']:
+                state['failed'] = True
+                raise RuntimeError(f'{collection}.{method} unavailable')
+            return await original(self, *args, **kwargs)
+
+        monkeypatch.setattr(cls, method, flaky)
+        return state
+    return install
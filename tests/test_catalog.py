@@ -0,0 +1,140 @@
+import asyncio
+
+import numpy as np
+
+import catalog
+from catalog import CatalogStore, build_snapshot
+
+RNT_ROWS = [
+    {'rnt': str(i), 'razon_social': f'Hotel {name}', 'categoria': category, 'nomdep': dept, 'nombre_muni': muni, 'habitaciones': 4}
+    for i, (name, category, dept, muni) in enumerate([
+        ('Sol', 'ALOJAMIENTO HOTELERO', 'BOYACA', 'TUNJA'),
+        ('Lago', 'ALOJAMIENTO RURAL', 'CUNDINAMARCA', 'GUATAVITA'),
+        ('Real', 'ALOJAMIENTO HOTELERO', 'BOYACA', 'PAIPA'),
+        ('Sal', 'GUIA DE TURISMO', 'CUNDINAMARCA', 'ZIPAQUIRA'),
+    ])
+]
+
+
+def user_row(suffix, name, category='ALOJAMIENTO RURAL', latitude=5.5, longitude=-73.3):
+    return {
+        'rnt': f'USR-{suffix}', 'source': 'user', 'razon_social': name, 'categoria': category,
+        'nomdep': 'BOYACA', 'nombre_muni': 'VILLA DE LEYVA', 'latitude': latitude, 'longitude': longitude,
+    }
+
+
+def process(row):
+    return dict(row)
+
+
+def names(snapshot, query):
+    return sorted(snapshot.destinations[position]['razon_social'] for position, _ in snapshot.search_index.search(query))
+
+
+def test_added_row_matches_a_full_build():
+    previous = build_snapshot(RNT_ROWS, process)
+    added = user_row('1', 'Finca Lago Azul', category='ECOTURISMO')
+    snapshot = previous.with_destinations([added])
+    full = build_snapshot(RNT_ROWS + [added], process)
+
+    assert snapshot.version == full.version
+    assert snapshot.statistics_payload == full.statistics_payload
+    for query in ('lago', 'hotel', 'finca azul', 'alojamiento'):
+        assert names(snapshot, query) == names(full, query)
+    assert snapshot.facets.counts() == full.facets.counts()
+    position = snapshot.content.positions_of(['USR-1'])[0]
+    assert snapshot.destinations[position] is added
+    profile = snapshot.content.profile({'preferred_categories': ['ecoturismo'], 'preferred_departments': ['Boyacá']})
+    assert snapshot.content.top_k(profile, 1) == [(position, 5.0)]
+    assert [dest['rnt'] for dest, _ in snapshot.geo.nearby(5.5, -73.3, 1)] == ['USR-1']
+    # The new row is a neighbour of the other 'lago' row, but not in the filtered lists
+    lago = snapshot.content.positions_of(['1'])[0]
+    assert position in [neighbor for neighbor, _ in snapshot.similar.similar(lago, 5)]
+    assert position not in [neighbor for neighbor, _ in snapshot.similar.similar(lago, 5, filtered=True)]
+
+    # The snapshot it was derived from is left as it was
+    assert len(previous.destinations) == len(RNT_ROWS)
+    assert names(previous, 'lago') == ['Hotel Lago']
+    assert previous.statistics_payload['total_destinations'] == len(RNT_ROWS)
+    assert previous.similar.filtered_neighbors is previous.similar.neighbors
+    assert len(previous.geo) == 0
+
+
+def test_replaced_row_drops_its_old_values():
+    snapshot = build_snapshot(RNT_ROWS + [user_row('1', 'Finca Lago Azul')], process)
+    updated = snapshot.with_destinations([user_row('1', 'Posada Colonial', category='GUIA DE TURISMO', latitude=4.0)])
+    assert len(updated.destinations) == len(snapshot.destinations)
+    assert names(updated, 'finca') == []
+    assert names(updated, 'posada') == ['Posada Colonial']
+    assert updated.facets.counts()['category'] == {'GUIA DE TURISMO': 2, 'ALOJAMIENTO HOTELERO': 2, 'ALOJAMIENTO RURAL': 1}
+    assert updated.statistics_payload['by_category']['GUIA DE TURISMO'] == 2
+    assert updated.geo.nearby(5.5, -73.3, 1) == []
+    assert len(updated.geo.nearby(4.0, -73.3, 1)) == 1
+    assert snapshot.with_destinations([user_row('1', 'Finca Lago Azul')]) is snapshot
+
+
+def test_incremental_neighbours_match_brute_force():
+    rows = RNT_ROWS + [user_row(str(i), f'Finca {word} Hotel') for i, word in enumerate(['Lago', 'Sol', 'Real'])]
+    snapshot = build_snapshot(RNT_ROWS, process)
+    for row in rows[len(RNT_ROWS):]:
+        snapshot = snapshot.with_destinations([row])
+    index = snapshot.similar
+    similarities = (index.matrix @ index.matrix.T).toarray()
+    np.fill_diagonal(similarities, -1)
+    for position in range(index.size):
+        expected = sorted((score for score in similarities[position] if score > 0), reverse=True)[:index.top_k]
+        assert np.allclose([score for _, score in index.similar(position, index.top_k)], expected)
+
+
+def test_unchanged_rows_keep_the_indexes():
+    previous = build_snapshot(RNT_ROWS, process)
+    snapshot = build_snapshot([dict(row) for row in RNT_ROWS], process, previous)
+    assert snapshot is not previous
+    assert snapshot.similar is previous.similar
+    assert snapshot.statistics_json is previous.statistics_json
+
+
+def test_upserted_rows_are_applied_without_a_rebuild(monkeypatch):
+    async def scenario():
+        async def loader():
+            return RNT_ROWS
+
+        async def extra_loader():
+            return []
+
+        store = CatalogStore(loader, process, extra_loader=extra_loader)
+        await store.get()
+        builds = []
+        monkeypatch.setattr(catalog, 'build_snapshot', lambda *args: builds.append(args))
+        store.upsert_rows([user_row('1', 'Finca Lago Azul')])
+        store.upsert_rows([user_row('2', 'Cabaña Sol')])
+        await store._rebuild_task
+        assert builds == []
+        assert names(store.snapshot, 'finca cabana') == []
+        assert names(store.snapshot, 'lago') == ['Finca Lago Azul', 'Hotel Lago']
+        assert names(store.snapshot, 'cabana') == ['Cabaña Sol']
+    asyncio.run(scenario())
+
+
+def test_rows_upserted_during_the_first_build_are_applied_after_it(monkeypatch):
+    async def scenario():
+        async def loader():
+            return RNT_ROWS
+
+        async def extra_loader():
+            return []
+
+        store = CatalogStore(loader, process, extra_loader=extra_loader)
+        loop = asyncio.get_running_loop()
+        build = catalog.build_snapshot
+
+        def approved_while_building(*args):
+            # The approval lands after the rows for this build were collected
+            loop.call_soon_threadsafe(store.upsert_rows, [user_row('1', 'Finca Lago Azul')])
+            return build(*args)
+
+        monkeypatch.setattr(catalog, 'build_snapshot', approved_while_building)
+        await store.get()
+        await store._rebuild_task
+        assert names(store.snapshot, 'finca') == ['Finca Lago Azul']
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import asyncio
+import gzip
+import threading
+
+import compression
+from catalog import build_snapshot
+from compression import CompressionMiddleware, precompress
+
+
+def respond(body, headers=()):
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json'), *headers]})
+        await send({'type': 'http.response.body', 'body': body})
+    return app
+
+
+def call(app, accept_encoding='gzip'):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=16)(scope, None, send))
+    start, body = sent
+    return dict(start['headers']), body['body']
+
+
+def compressed_on(monkeypatch):
+    threads = []
+    compress = compression.compress
+
+    def recorded(body, encoding):
+        threads.append(threading.get_ident())
+        return compress(body, encoding)
+
+    monkeypatch.setattr(compression, 'compress', recorded)
+    return threads
+
+
+def test_large_bodies_are_compressed_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_THREAD_MIN_SIZE', 1000)
+    threads = compressed_on(monkeypatch)
+    body = b'{"rows": "' + b'x' * 2000 + b'"}'
+    headers, compressed = call(respond(body))
+    assert headers[b'content-encoding'] == b'gzip'
+    assert gzip.decompress(compressed) == body
+    assert threads != [threading.get_ident()]
+
+    threads.clear()
+    call(respond(b'{"rows": "' + b'x' * 100 + b'"}'))
+    assert threads == [threading.get_ident()]
+
+
+def test_already_encoded_bodies_pass_through(monkeypatch):
+    threads = compressed_on(monkeypatch)
+    body = gzip.compress(b'{"rows": "' + b'x' * 2000 + b'"}')
+    _, sent = call(respond(body, [(b'content-encoding', b'gzip')]))
+    assert sent == body
+    assert threads == []
+
+
+def test_statistics_are_compressed_once_per_snapshot():
+    rows = [{'rnt': str(i), 'nomdep': 'BOYACA', 'nombre_muni': f'MUNICIPIO {i}', 'categoria': 'HOTEL'} for i in range(100)]
+    snapshot = build_snapshot(rows, dict)
+    assert set(snapshot.statistics_compressed) == set(compression.available_encodings())
+    assert gzip.decompress(snapshot.statistics_compressed['gzip']) == snapshot.statistics_json
+    updated = snapshot.with_destinations([{'rnt': 'USR-1', 'nomdep': 'BOYACA', 'nombre_muni': 'TUNJA', 'categoria': 'HOTEL'}])
+    assert gzip.decompress(updated.statistics_compressed['gzip']) == updated.statistics_json
+    assert updated.statistics_json != snapshot.statistics_json
+    assert precompress(b'{}') == {}
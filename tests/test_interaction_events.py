@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from interaction_events import (
+    award_points,
+    insert_interactions,
+    mark_processed,
+    persist_interactions,
+    unprocessed_interactions,
+)
+from points import get_balance, reconcile_balances
+from trend_rollups import record_interactions
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def interaction(event_id, action='like', user_id='u1'):
+    return {'id': event_id, 'user_id': user_id, 'destination_rnt': f'rnt-{event_id}', 'action': action, 'timestamp': datetime.now()}
+
+
+async def store(db, interactions):
+    """The synchronous store path of the API, without the caches"""
+    pending, duplicates = await persist_interactions(db, interactions)
+    await record_interactions(db, pending)
+    await mark_processed(db, pending)
+    return duplicates
+
+
+async def total_rollup(db):
+    doc = await db.trend_rollups.find_one({'granularity': 'day', 'dimension': 'interactions'})
+    return doc['count'] if doc else 0
+
+
+def test_repeated_ids_in_one_batch_are_duplicates(db):
+    async def scenario():
+        pending, duplicates = await insert_interactions(db, [interaction('a'), interaction('a'), interaction('b')])
+        assert [event['id'] for event in pending] == ['a', 'b']
+        assert duplicates == {1}
+        assert await db.user_interactions.count_documents({'processed': False}) == 2
+    run(scenario())
+
+
+def test_processed_repeats_are_duplicates_and_earn_nothing(db):
+    async def scenario():
+        await store(db, [interaction('a'), interaction('b', 'view')])
+        duplicates = await store(db, [interaction('a'), interaction('c', 'save')])
+        assert duplicates == {0}
+        assert await get_balance(db, 'u1') == 3 + 1 + 2
+        assert await total_rollup(db) == 3
+    run(scenario())
+
+
+def test_unfinished_repeat_is_processed_from_the_stored_copy(db):
+    async def scenario():
+        stored = interaction('a')
+        await db.user_interactions.insert_one({**stored, 'processed': False})
+        # The retry carries a different payload; the stored event wins
+        pending, duplicates = await insert_interactions(db, [{**stored, 'action': 'view'}])
+        assert duplicates == set()
+        assert [(event['id'], event['action']) for event in pending] == [('a', 'like')]
+    run(scenario())
+
+
+@pytest.mark.parametrize('collection, method, rollup', [
+    ('user_interactions', 'insert_many', 3),
+    ('point_transactions', 'insert_many', 3),
+    ('user_balances', 'bulk_write', 3),
+    ('trend_rollups', 'bulk_write', 3),
+    # Rollups are at-least-once: a failure after them counts the batch again
+    ('user_interactions', 'update_many', 6),
+])
+def test_retry_after_a_failed_step_counts_points_once(db, fail_once, collection, method, rollup):
+    async def scenario():
+        batch = [interaction('a'), interaction('b', 'view'), interaction('c', 'save')]
+        fail_once(collection, method)
+        with pytest.raises(RuntimeError):
+            await store(db, batch)
+        assert await store(db, batch) == set()
+        # Once finished, a further retry only sees duplicates
+        assert await store(db, batch) == {0, 1, 2}
+        assert await db.point_transactions.count_documents({}) == 3
+        assert await get_balance(db, 'u1') == 6
+        assert await db.user_interactions.count_documents({'processed': False}) == 0
+        assert await reconcile_balances(db) == []
+        assert await total_rollup(db) == rollup
+    run(scenario())
+
+
+def test_sweep_finishes_interactions_nobody_retried(db, fail_once):
+    async def scenario():
+        fail_once('point_transactions', 'insert_many')
+        with pytest.raises(RuntimeError):
+            await store(db, [interaction('a'), interaction('b', 'view')])
+        # ObjectId times have second resolution
+        assert await unprocessed_interactions(db, older_than=60) == []
+        unfinished = await unprocessed_interactions(db, older_than=-2)
+        assert sorted(event['id'] for event in unfinished) == ['a', 'b']
+        await award_points(db, unfinished)
+        await mark_processed(db, unfinished)
+        assert await get_balance(db, 'u1') == 4
+        assert await unprocessed_interactions(db, older_than=-2) == []
+    run(scenario())
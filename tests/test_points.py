@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from points import (
+    apply_pending_transactions,
+    apply_transactions,
+    build_transaction,
+    get_balance,
+    initialize_balance,
+    reconcile_balances,
+    record_transaction,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def balance_of(db, user_id):
+    doc = await db.user_balances.find_one({'user_id': user_id})
+    return doc and doc['balance']
+
+
+def test_apply_transactions_counts_each_id_once(db):
+    async def scenario():
+        transactions = [build_transaction('u1', 5, 'bonus', 'a'), build_transaction('u1', 3, 'bonus', 'b')]
+        await db.point_transactions.insert_many([dict(t) for t in transactions])
+        await apply_transactions(db, transactions)
+        await apply_transactions(db, transactions)
+        assert await balance_of(db, 'u1') == 8
+        assert await db.point_transactions.count_documents({'applied': True}) == 2
+    run(scenario())
+
+
+def test_initialize_balance_ignores_pending_rows(db):
+    async def scenario():
+        applied = {**build_transaction('u1', 10, 'bonus', 'applied'), 'applied': True}
+        legacy = build_transaction('u1', 4, 'bonus', 'before the flag')
+        del legacy['applied']
+        pending = build_transaction('u1', 7, 'bonus', 'pending')
+        await db.point_transactions.insert_many([applied, legacy, dict(pending)])
+        assert await initialize_balance(db, 'u1') == 14
+        # The pending row is applied on top, not counted twice
+        await apply_pending_transactions(db)
+        assert await get_balance(db, 'u1') == 21
+    run(scenario())
+
+
+def test_record_transaction_retry_after_failed_balance_update(db, fail_once):
+    async def scenario():
+        await initialize_balance(db, 'u1')
+        fail_once('user_balances', 'bulk_write')
+        with pytest.raises(RuntimeError):
+            await record_transaction(db, 'u1', 5, 'bonus', 'retried', transaction_id='t1')
+        assert await balance_of(db, 'u1') == 0
+        await record_transaction(db, 'u1', 5, 'bonus', 'retried', transaction_id='t1')
+        await record_transaction(db, 'u1', 5, 'bonus', 'retried', transaction_id='t1')
+        assert await balance_of(db, 'u1') == 5
+        assert await db.point_transactions.count_documents({'id': 't1'}) == 1
+    run(scenario())
+
+
+def test_pending_sweep_finishes_a_transaction_left_unapplied(db, fail_once):
+    async def scenario():
+        await initialize_balance(db, 'u1')
+        fail_once('user_balances', 'bulk_write')
+        with pytest.raises(RuntimeError):
+            await record_transaction(db, 'u1', 5, 'bonus', 'interrupted', transaction_id='t1')
+        assert await apply_pending_transactions(db) == 1
+        assert await apply_pending_transactions(db) == 0
+        assert await balance_of(db, 'u1') == 5
+    run(scenario())
+
+
+def test_apply_survives_failed_applied_flag(db, fail_once):
+    async def scenario():
+        await initialize_balance(db, 'u1')
+        fail_once('point_transactions', 'update_many')
+        with pytest.raises(RuntimeError):
+            await record_transaction(db, 'u1', 5, 'bonus', 'flag lost', transaction_id='t1')
+        # The balance already holds t1; the sweep only sets the flag
+        await apply_pending_transactions(db)
+        assert await balance_of(db, 'u1') == 5
+        assert await reconcile_balances(db) == []
+    run(scenario())
+
+
+def test_reconcile_balances_ignores_pending_rows(db):
+    async def scenario():
+        await record_transaction(db, 'u1', 5, 'bonus', 'applied')
+        await db.point_transactions.insert_one(build_transaction('u1', 3, 'bonus', 'in flight'))
+        assert await reconcile_balances(db) == []
+    run(scenario())
+
+
+def test_reconcile_balances_repairs_drift(db):
+    async def scenario():
+        await record_transaction(db, 'u1', 5, 'bonus', 'applied')
+        await db.user_balances.update_one({'user_id': 'u1'}, {'$set': {'balance': 2}})
+        await db.point_transactions.insert_one({**build_transaction('u2', 4, 'bonus', 'no balance'), 'applied': True})
+        mismatches = await reconcile_balances(db, fix=True)
+        assert sorted((m['user_id'], m['balance'], m['ledger'], m['fixed']) for m in mismatches) == [
+            ('u1', 2, 5, True), ('u2', None, 4, True)
+        ]
+        assert await balance_of(db, 'u1') == 5
+        assert await balance_of(db, 'u2') == 4
+    run(scenario())
+
+
+def test_reconcile_balances_does_not_overwrite_a_concurrent_inc(db, monkeypatch):
+    import points
+
+    async def scenario():
+        await record_transaction(db, 'u1', 5, 'bonus', 'applied')
+        await db.user_balances.update_one({'user_id': 'u1'}, {'$set': {'balance': 2}})
+        repair = points.repair_balance
+
+        async def inc_first(db, user_id, observed, expected):
+            # A live $inc lands between the comparison and the repair
+            await db.user_balances.update_one({'user_id': user_id}, {'$inc': {'balance': 1}})
+            return await repair(db, user_id, observed, expected)
+
+        monkeypatch.setattr(points, 'repair_balance', inc_first)
+        [mismatch] = await reconcile_balances(db, fix=True)
+        assert mismatch['fixed'] is False
+        assert await balance_of(db, 'u1') == 3
+    run(scenario())
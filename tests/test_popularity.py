@@ -0,0 +1,143 @@
+import asyncio
+import math
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+import popularity
+from popularity import PopularityTracker, SpaceSaving
+
+
+def test_exact_while_under_capacity():
+    summary = SpaceSaving(5)
+    for item in 'aabbbc':
+        summary.add(item)
+    assert summary.top(3) == [('b', 3.0, 0.0), ('a', 2.0, 0.0), ('c', 1.0, 0.0)]
+    assert len(summary) == 3
+
+
+def test_new_item_evicts_smallest_counter_and_inherits_it():
+    summary = SpaceSaving(2)
+    for item in 'aaab':
+        summary.add(item)
+    summary.add('c')
+    assert 'b' not in summary.counts
+    assert summary.counts['c'] == 2.0
+    assert summary.errors['c'] == 1.0
+    # 'c' (2) is now below 'a' (3), so the next newcomer replaces it
+    summary.add('d')
+    assert set(summary.counts) == {'a', 'd'}
+    assert summary.counts['d'] == 3.0
+    assert summary.errors['d'] == 2.0
+
+
+def test_eviction_skips_stale_heap_entries():
+    summary = SpaceSaving(2)
+    summary.add('a')
+    summary.add('b')
+    # 'a' grows past 'b'; its old heap entry (1, 'a') must not be taken for the minimum
+    summary.add('a')
+    summary.add('a')
+    summary.add('c')
+    assert set(summary.counts) == {'a', 'c'}
+    assert summary.counts['a'] == 3.0
+
+
+def test_error_bounds_on_a_skewed_stream():
+    rng = random.Random(7)
+    items = [f'd{i}' for i in range(200)]
+    weights = [1 / (rank + 1) ** 1.2 for rank in range(len(items))]
+    stream = rng.choices(items, weights, k=20000)
+    truth = Counter(stream)
+    capacity = 40
+    summary = SpaceSaving(capacity)
+    for item in stream:
+        summary.add(item)
+
+    assert len(summary) == capacity
+    assert sum(summary.counts.values()) == pytest.approx(len(stream))
+    for item, count in summary.counts.items():
+        error = summary.errors[item]
+        # Overestimates by at most the error, which never exceeds N / capacity
+        assert count - error <= truth[item] <= count
+        assert error <= len(stream) / capacity
+    # Every item above N / capacity is tracked
+    for item, count in truth.items():
+        if count > len(stream) / capacity:
+            assert item in summary.counts
+
+
+def test_scale_multiplies_counts_and_errors():
+    summary = SpaceSaving(1)
+    summary.add('a', 4.0)
+    summary.add('b', 2.0)
+    summary.scale(0.5)
+    assert summary.counts == {'b': 3.0}
+    assert summary.errors == {'b': 2.0}
+
+
+def test_tracker_counts_only_popular_actions():
+    tracker = PopularityTracker(capacity=10)
+    now = datetime.now()
+    tracker.add_interactions([
+        {'action': 'like', 'destination_rnt': 'r1', 'timestamp': now},
+        {'action': 'view', 'destination_rnt': 'r1', 'timestamp': now},
+        {'action': 'save', 'destination_rnt': 'r2', 'timestamp': now},
+        {'action': 'view', 'destination_rnt': None, 'timestamp': now},
+        {'action': 'view', 'destination_rnt': 'r3', 'timestamp': now},
+    ])
+    assert tracker.top(5) == [('r1', 2.0), ('r3', 1.0)]
+    assert tracker.metrics() == {'events': 3, 'tracked': 2, 'capacity': 10}
+
+
+def test_trending_decays_with_half_life():
+    tracker = PopularityTracker(capacity=10, half_life_hours=1)
+    now = datetime.now()
+    tracker.add('old', now - timedelta(hours=2))
+    tracker.add('new', now)
+    assert tracker.top(2) == [('old', 1.0), ('new', 1.0)]
+    scores = dict(tracker.top(2, 'trending'))
+    assert scores['new'] == pytest.approx(1.0, rel=1e-3)
+    assert scores['old'] == pytest.approx(0.25, rel=1e-3)
+    assert [rnt for rnt, _ in tracker.top(2, 'trending')] == ['new', 'old']
+
+
+def test_trending_rescale_keeps_relative_scores(monkeypatch):
+    monkeypatch.setattr(popularity, 'RESCALE_EXPONENT', 2.0)
+    tracker = PopularityTracker(capacity=10, half_life_hours=1)
+    tau_hours = 1 / math.log(2)
+    start = datetime.now() - timedelta(hours=6 * tau_hours)
+    tracker.add('a', start)
+    tracker.add('a', start)
+    # Three tau later the exponent passes the threshold and the counters are rescaled
+    tracker.add('b', start + timedelta(hours=3 * tau_hours))
+    assert max(tracker.trending.counts.values()) <= math.exp(2.0)
+    counts = tracker.trending.counts
+    assert counts['a'] / counts['b'] == pytest.approx(2 * math.exp(-3))
+
+
+def test_trending_is_empty_before_any_event():
+    assert PopularityTracker(capacity=3).top(3, 'trending') == []
+
+
+def test_catch_up_reads_each_stored_interaction_once(db):
+    def interaction(event_id, rnt, action='view'):
+        return {'id': event_id, 'user_id': 'u1', 'destination_rnt': rnt, 'action': action, 'timestamp': datetime.now()}
+
+    async def scenario():
+        await db.user_interactions.insert_many([interaction('1', 'r1'), interaction('2', 'r1'), interaction('3', 'r2', 'save')])
+        tracker = PopularityTracker(capacity=10)
+        # ObjectId times have second resolution, so read up to two seconds ahead
+        assert await tracker.catch_up(db.user_interactions, lag_seconds=-2) == 2
+        assert await tracker.catch_up(db.user_interactions, lag_seconds=-2) == 0
+        # Inserted by another worker after the first pass
+        await db.user_interactions.insert_one(interaction('4', 'r2', 'like'))
+        assert await tracker.catch_up(db.user_interactions, lag_seconds=-2) == 1
+        assert tracker.top(5) == [('r1', 2.0), ('r2', 1.0)]
+        # Inserts younger than the lag wait for the next pass
+        await db.user_interactions.insert_one(interaction('5', 'r3'))
+        assert await tracker.catch_up(db.user_interactions, lag_seconds=60) == 0
+
+    asyncio.run(scenario())
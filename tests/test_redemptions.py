@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from points import (
+    RedemptionError,
+    fail_redemption,
+    get_balance,
+    reconcile_balances,
+    reconcile_redemptions,
+    record_transaction,
+    redeem_reward,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def setup(db, balance=100, max_redemptions=5, users=('u1',)):
+    await db.rewards.insert_one({
+        'id': 'r1', 'title': 'Café', 'points_required': 30, 'active': True,
+        'max_redemptions': max_redemptions, 'current_redemptions': 0, 'partner_contact': 'x',
+    })
+    for user_id in users:
+        await record_transaction(db, user_id, balance, 'bonus', 'seed')
+
+
+async def stock(db):
+    return (await db.rewards.find_one({'id': 'r1'}))['current_redemptions']
+
+
+async def statuses(db):
+    return sorted([doc['status'] async for doc in db.redemptions.find({})])
+
+
+def test_redeem_debits_reserves_and_records(db):
+    async def scenario():
+        await setup(db)
+        result = await redeem_reward(db, 'u1', 'r1')
+        assert result['redemption']['status'] == 'active'
+        assert result['redemption']['points_spent'] == 30
+        assert await get_balance(db, 'u1') == 70
+        assert await stock(db) == 1
+        assert await db.point_transactions.count_documents({'transaction_type': 'redeem_reward'}) == 1
+        assert await reconcile_balances(db) == []
+    run(scenario())
+
+
+def test_insufficient_points_releases_the_unit(db):
+    async def scenario():
+        await setup(db, balance=10)
+        with pytest.raises(RedemptionError) as error:
+            await redeem_reward(db, 'u1', 'r1')
+        assert error.value.detail == 'Insufficient points'
+        assert await stock(db) == 0
+        assert await get_balance(db, 'u1') == 10
+        assert await statuses(db) == ['failed']
+    run(scenario())
+
+
+@pytest.mark.parametrize('reward, detail', [
+    ({'id': 'r1', 'active': False, 'points_required': 1}, 'Reward is not active'),
+    ({'id': 'r1', 'active': True, 'points_required': 1, 'max_redemptions': 1, 'current_redemptions': 1},
+     'Reward redemption limit reached'),
+])
+def test_rejected_reservation(db, reward, detail):
+    async def scenario():
+        await db.rewards.insert_one(reward)
+        with pytest.raises(RedemptionError) as error:
+            await redeem_reward(db, 'u1', 'r1')
+        assert error.value.detail == detail
+        assert await statuses(db) == []
+    run(scenario())
+
+
+def test_concurrent_redemptions_never_oversell(db):
+    async def scenario():
+        users = [f'u{i}' for i in range(8)]
+        await setup(db, max_redemptions=3, users=users)
+        results = await asyncio.gather(*(redeem_reward(db, user_id, 'r1') for user_id in users), return_exceptions=True)
+        assert sum(not isinstance(result, Exception) for result in results) == 3
+        assert await stock(db) == 3
+        assert await db.redemptions.count_documents({'status': 'active'}) == 3
+    run(scenario())
+
+
+def test_failing_twice_releases_once(db):
+    async def scenario():
+        await setup(db)
+        await db.rewards.update_one({'id': 'r1'}, {'$set': {'current_redemptions': 1}})
+        redemption = {'id': 'x', 'reward_id': 'r1', 'status': 'pending'}
+        await db.redemptions.insert_one(dict(redemption))
+        released = await asyncio.gather(fail_redemption(db, redemption), fail_redemption(db, redemption))
+        assert sorted(released) == [False, True]
+        assert await stock(db) == 0
+    run(scenario())
+
+
+@pytest.mark.parametrize('collection, method, outcome', [
+    # Crash at the debit: the reserved unit is released
+    ('user_balances', 'update_one', ('failed', 0, 100)),
+    # Crash after the debit: the sweep writes the ledger row and activates it
+    ('point_transactions', 'insert_one', ('active', 1, 70)),
+    ('redemptions', 'update_one', ('active', 1, 70)),
+])
+def test_sweep_finishes_a_redemption_interrupted_at_each_step(db, fail_once, collection, method, outcome):
+    async def scenario():
+        await setup(db)
+        fail_once(collection, method)
+        with pytest.raises(RuntimeError):
+            await redeem_reward(db, 'u1', 'r1')
+        await reconcile_redemptions(db, older_than=-1)
+        # A second sweep finds nothing left to do
+        assert await reconcile_redemptions(db, older_than=-1) == {'completed': 0, 'rolled_back': 0}
+        status, reserved, balance = outcome
+        assert await statuses(db) == [status]
+        assert await stock(db) == reserved
+        assert await get_balance(db, 'u1') == balance
+        assert await reconcile_balances(db) == []
+    run(scenario())
+
+
+def test_sweep_leaves_recent_redemptions_alone(db, fail_once):
+    async def scenario():
+        await setup(db)
+        fail_once('point_transactions', 'insert_one')
+        with pytest.raises(RuntimeError):
+            await redeem_reward(db, 'u1', 'r1')
+        assert await reconcile_redemptions(db) == {'completed': 0, 'rolled_back': 0}
+        assert await statuses(db) == ['pending']
+    run(scenario())
@@ -0,0 +1,80 @@
+import codecs
+import json
+
+import pytest
+
+from catalog import TARGET_DEPARTMENTS, filter_target_departments
+from rnt_client import JSONArrayStream, department_filter
+
+ROWS = [
+    {"rnt": "101", "razon_social": "Hotel Boyacá [centro], \"La Casona\"", "nomdep": "BOYACA", "habitaciones": "12"},
+    {"rnt": "102", "razon_social": "Guía {Zipaquirá} \\ Catedral", "nomdep": " cundinamarca ", "camas": None},
+    {"rnt": "103", "razon_social": "Cabañas ñandú 🌄", "nomdep": "BOYACA", "tags": [1, [2, 3], {"a": []}]},
+]
+
+
+def parse_chunks(chunks):
+    """Feed byte chunks through the incremental UTF-8 decoder and parser, like RNTClient.iter_rows"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parser = JSONArrayStream()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(decoder.decode(chunk)))
+    items.extend(parser.feed(decoder.decode(b'', final=True)))
+    parser.close()
+    return items
+
+
+@pytest.mark.parametrize('payload', [
+    json.dumps(ROWS, ensure_ascii=False),
+    json.dumps(ROWS, ensure_ascii=False, indent=2),
+    json.dumps(ROWS),
+    '[123, -4.5e10, true, null, "x", [], {}]',
+    '[]',
+    ' \n[ ]\n',
+])
+def test_every_split_point(payload):
+    data = payload.encode('utf-8')
+    expected = json.loads(payload)
+    for offset in range(len(data) + 1):
+        assert parse_chunks([data[:offset], data[offset:]]) == expected, offset
+
+
+def test_byte_at_a_time():
+    data = json.dumps(ROWS, ensure_ascii=False).encode('utf-8')
+    assert parse_chunks([data[i:i + 1] for i in range(len(data))]) == ROWS
+
+
+def test_every_pair_of_split_points():
+    data = b'[1, 22, {"a": "b]"}, 333]'
+    for first in range(len(data) + 1):
+        for second in range(first, len(data) + 1):
+            chunks = [data[:first], data[first:second], data[second:]]
+            assert parse_chunks(chunks) == [1, 22, {"a": "b]"}, 333], (first, second)
+
+
+def test_buffer_keeps_only_the_partial_element():
+    parser = JSONArrayStream()
+    assert parser.feed('[{"rnt": "1"}, {"rnt": "2"}, {"rn') == [{"rnt": "1"}, {"rnt": "2"}]
+    assert len(parser._buffer) < len('{"rnt": "2"}, {"rn')
+    assert parser.feed('t": "3"}]') == [{"rnt": "3"}]
+    assert parser.finished
+
+
+def test_truncated_array():
+    data = json.dumps(ROWS).encode('utf-8')
+    for offset in range(len(data)):
+        with pytest.raises(ValueError):
+            parse_chunks([data[:offset]])
+
+
+def test_rejects_non_array():
+    with pytest.raises(ValueError):
+        JSONArrayStream().feed('{"error": "throttled"}')
+
+
+def test_department_filter_normalizes_like_local_filter():
+    assert department_filter(TARGET_DEPARTMENTS) == "upper(trim(nomdep)) in('BOYACA','CUNDINAMARCA')"
+    assert department_filter(["d'Arc"]) == "upper(trim(nomdep)) in('D''ARC')"
+    rows = [{"nomdep": "BOYACA"}, {"nomdep": " Cundinamarca "}, {"nomdep": "ANTIOQUIA"}]
+    assert filter_target_departments(rows) == rows[:2]
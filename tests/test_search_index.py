@@ -0,0 +1,91 @@
+import math
+
+import pytest
+
+from search_index import BM25_B, BM25_K1, SearchIndex, fold_accents, tokenize
+
+DOCS = [
+    {'razon_social': 'Hotel Boyacá Real', 'categoria': 'ALOJAMIENTO HOTELERO', 'subcategoria': 'HOTEL', 'nombre_muni': 'TUNJA'},
+    {'razon_social': 'Hostal La Candelaria', 'categoria': 'ALOJAMIENTO HOTELERO', 'subcategoria': 'HOSTAL', 'nombre_muni': 'VILLA DE LEYVA'},
+    {'razon_social': 'Guía Zipaquirá', 'categoria': 'GUÍA DE TURISMO', 'subcategoria': 'GUIA', 'nombre_muni': 'ZIPAQUIRÁ'},
+    {'razon_social': 'Turismo Tunja Tours', 'categoria': 'AGENCIA DE VIAJES', 'subcategoria': 'OPERADOR', 'nombre_muni': 'TUNJA'},
+    {'razon_social': 'Cabañas del Lago', 'categoria': 'ALOJAMIENTO RURAL', 'subcategoria': 'CABAÑA', 'nombre_muni': 'GUATAVITA'},
+]
+
+
+@pytest.mark.parametrize('text, folded', [
+    ('Boyacá', 'boyaca'),
+    ('ZIPAQUIRÁ', 'zipaquira'),
+    ('CABAÑA', 'cabana'),
+    ('Güicán', 'guican'),
+    ('', ''),
+    (None, ''),
+])
+def test_fold_accents(text, folded):
+    assert fold_accents(text) == folded
+
+
+def test_tokenize_splits_on_punctuation_and_folds():
+    assert tokenize('Hotel "Boyacá", S.A.S. - Nº 12') == ['hotel', 'boyaca', 's', 'a', 's', 'no', '12']
+    assert tokenize('  ') == []
+
+
+def test_accent_and_case_insensitive_match():
+    index = SearchIndex(DOCS)
+    assert [position for position, _ in index.search('zipaquira')] == [2]
+    assert [position for position, _ in index.search('ZIPAQUIRÁ')] == [2]
+    assert [position for position, _ in index.search('Boyaca')] == [0]
+
+
+def test_every_term_must_match():
+    index = SearchIndex(DOCS)
+    assert {position for position, _ in index.search('tunja')} == {0, 3}
+    assert [position for position, _ in index.search('tunja hotel')] == [0]
+    assert index.search('tunja lago') == []
+    assert index.search('') == []
+    assert index.search('!!') == []
+
+
+def test_last_term_matches_as_prefix():
+    index = SearchIndex(DOCS)
+    assert [position for position, _ in index.search('cand')] == [1]
+    assert [position for position, _ in index.search('alojamiento hot')] == [0, 1]
+    # Only the last term expands
+    assert index.search('cand hostal') == []
+
+
+def test_bm25_score_of_single_term():
+    index = SearchIndex(DOCS)
+    # 'lago' appears once in razon_social (boost 2.0) of document 4
+    frequency = 2.0
+    df = 1
+    idf = math.log(1 + (len(DOCS) - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * index.doc_lengths[4] / index.average_length)
+    expected = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+    [(position, score)] = index.search('lago')
+    assert position == 4
+    assert score == pytest.approx(expected)
+
+
+def test_field_boost_and_length_order_results():
+    docs = [
+        {'razon_social': 'Posada', 'nombre_muni': 'PAIPA'},
+        {'razon_social': 'Paipa', 'nombre_muni': 'SOGAMOSO'},
+        {'razon_social': 'Hotel', 'categoria': 'HOTEL', 'nombre_muni': 'PAIPA'},
+    ]
+    index = SearchIndex(docs)
+    ranked = index.search('paipa')
+    # Same length: razon_social (2.0) outweighs nombre_muni (1.5); the longer document ranks last
+    assert [position for position, _ in ranked] == [1, 0, 2]
+    assert all(a[1] >= b[1] for a, b in zip(ranked, ranked[1:]))
+
+
+def test_ties_keep_catalog_order():
+    docs = [{'razon_social': 'Hotel Sol'}, {'razon_social': 'Hotel Sol'}, {'razon_social': 'Hotel Sol'}]
+    assert [position for position, _ in SearchIndex(docs).search('sol')] == [0, 1, 2]
+
+
+def test_empty_index():
+    index = SearchIndex([])
+    assert index.search('hotel') == []
+    assert index.average_length == 0.0
@@ -0,0 +1,28 @@
+from text_vectors import TextVectorIndex
+
+DOCS = [
+    {'razon_social': f'Hotel Sol {i}', 'nombre_muni': 'TUNJA', 'source': 'user' if i % 2 else 'rnt'}
+    for i in range(12)
+]
+
+
+def test_neighbours_skip_the_row_itself_and_are_sorted():
+    index = TextVectorIndex(DOCS, top_k=4)
+    neighbours = index.similar(0, 4)
+    assert len(neighbours) == 4
+    assert all(position != 0 for position, _ in neighbours)
+    assert [score for _, score in neighbours] == sorted((score for _, score in neighbours), reverse=True)
+
+
+def test_filtered_neighbours_fill_top_k_without_excluded_rows():
+    excluded = [doc['source'] == 'user' for doc in DOCS]
+    index = TextVectorIndex(DOCS, top_k=4, excluded=excluded)
+    filtered = index.similar(0, 4, filtered=True)
+    assert len(filtered) == 4
+    assert not any(excluded[position] for position, _ in filtered)
+    assert any(excluded[position] for position, _ in index.similar(0, 4))
+
+
+def test_unrelated_rows_are_not_neighbours():
+    index = TextVectorIndex([{'razon_social': 'Hotel Sol'}, {'razon_social': 'Guia Lago'}], top_k=3)
+    assert index.similar(0, 3) == []
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import trend_rollups
+from trend_rollups import backfill_once, range_buckets, read_trends, record_interactions, rollups_status
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture(autouse=True)
+def not_built(monkeypatch):
+    monkeypatch.setattr(trend_rollups, '_built', False)
+
+
+async def seed(db, count=3):
+    await db.user_preferences.insert_one({
+        'id': 'u1', 'preferred_departments': ['Boyacá'], 'preferred_categories': ['Hotel'], 'travel_style': 'aventura'
+    })
+    await db.user_interactions.insert_many([
+        {'id': str(i), 'user_id': 'u1', 'destination_rnt': str(i), 'action': 'view', 'timestamp': datetime.now()}
+        for i in range(count)
+    ])
+
+
+def test_backfill_runs_once(db):
+    async def scenario():
+        await seed(db)
+        assert await rollups_status(db) == 'missing'
+        result = await backfill_once(db)
+        assert result['interactions'] == 3
+        assert await backfill_once(db) is None
+        assert await rollups_status(db) == 'built'
+        assert (await read_trends(db))['total_interactions'] == 3
+    run(scenario())
+
+
+def test_concurrent_workers_backfill_once(db, monkeypatch):
+    async def scenario():
+        await seed(db)
+        calls = []
+        rebuild = trend_rollups.rebuild_rollups
+
+        async def counted(db):
+            calls.append(1)
+            return await rebuild(db)
+
+        monkeypatch.setattr(trend_rollups, 'rebuild_rollups', counted)
+        results = await asyncio.gather(*(backfill_once(db) for _ in range(4)))
+        assert len(calls) == 1
+        assert sum(result is not None for result in results) == 1
+        assert (await read_trends(db))['total_interactions'] == 3
+    run(scenario())
+
+
+def test_expired_or_failed_attempts_are_taken_over(db):
+    async def scenario():
+        await seed(db)
+        await db.sync_state.insert_one({'_id': 'trend_rollups', 'status': 'building', 'lease_until': datetime.now() + timedelta(hours=1)})
+        assert await backfill_once(db) is None
+        assert await rollups_status(db) == 'building'
+        await db.sync_state.update_one({'_id': 'trend_rollups'}, {'$set': {'lease_until': datetime.now() - timedelta(seconds=1)}})
+        assert (await backfill_once(db))['interactions'] == 3
+        await db.sync_state.update_one({'_id': 'trend_rollups'}, {'$set': {'status': 'failed'}})
+        trend_rollups._built = False
+        assert (await backfill_once(db))['interactions'] == 3
+    run(scenario())
+
+
+def test_failed_backfill_is_recorded(db, monkeypatch):
+    async def failing(db):
+        raise RuntimeError('interrupted')
+
+    monkeypatch.setattr(trend_rollups, 'rebuild_rollups', failing)
+
+    async def scenario():
+        await seed(db)
+        with pytest.raises(RuntimeError):
+            await backfill_once(db)
+        assert await rollups_status(db) == 'failed'
+    run(scenario())
+
+
+def test_live_counts_are_kept_across_a_rebuild(db):
+    async def scenario():
+        await seed(db)
+        await backfill_once(db)
+        late = {'id': 'late', 'user_id': 'u1', 'destination_rnt': 'x', 'action': 'like', 'timestamp': datetime.now()}
+        await db.user_interactions.insert_one(dict(late))
+        await record_interactions(db, [late])
+        await trend_rollups.rebuild_rollups(db)
+        trends = await read_trends(db)
+        assert trends['total_interactions'] == 4
+        assert trends['department_trends'] == [{'_id': 'Boyacá', 'count': 4}]
+    run(scenario())
+
+
+def test_old_range_edges_fall_back_to_days():
+    now = datetime(2026, 6, 30, 12)
+    start = now - timedelta(days=60, hours=5)
+    [day_filter] = range_buckets(start, start + timedelta(hours=30), now)
+    assert day_filter['granularity'] == 'day'
+    assert day_filter['bucket']['$gte'] == datetime(2026, 5, 1)
+    assert day_filter['bucket']['$lt'] == datetime(2026, 5, 3)
+    recent = range_buckets(now - timedelta(hours=5), now, now)
+    assert [f['granularity'] for f in recent] == ['hour']
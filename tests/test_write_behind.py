@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import write_behind
+from write_behind import WriteBehindBuffer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(write_behind, 'FLUSH_RETRY_BASE_SECONDS', 0.001)
+    monkeypatch.setattr(write_behind, 'FLUSH_RETRY_MAX_SECONDS', 0.01)
+
+
+class FlakyStore:
+    def __init__(self, failures):
+        self.failures = failures
+        self.written = []
+
+    async def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('failover')
+        self.written.extend(event['id'] for event in batch)
+
+
+def test_batches_are_flushed_by_size_and_time():
+    async def scenario():
+        store = FlakyStore(0)
+        buffer = WriteBehindBuffer(store, batch_size=2, flush_interval=0.01)
+        buffer.start()
+        for i in range(5):
+            assert buffer.offer({'id': i})
+        await buffer.stop()
+        assert store.written == [0, 1, 2, 3, 4]
+        assert buffer.metrics()['flushed'] == 5
+        assert not buffer.offer({'id': 5})
+    run(scenario())
+
+
+def test_failing_batch_is_retried_until_written():
+    async def scenario():
+        store = FlakyStore(20)
+        buffer = WriteBehindBuffer(store, batch_size=10, flush_interval=0.01)
+        buffer.start()
+        for i in range(3):
+            buffer.offer({'id': i})
+        await buffer.stop()
+        assert store.written == [0, 1, 2]
+        metrics = buffer.metrics()
+        assert metrics['failed_flushes'] == 20
+        assert metrics['dropped'] == 0
+    run(scenario())
+
+
+def test_full_queue_refuses_events_while_a_batch_is_retried():
+    async def scenario():
+        store = FlakyStore(10 ** 6)
+        buffer = WriteBehindBuffer(store, max_queue=3, batch_size=1, flush_interval=0.01, drain_timeout=0.05)
+        buffer.start()
+        buffer.offer({'id': 0})
+        await asyncio.sleep(0.05)
+        accepted = [buffer.offer({'id': i}) for i in range(1, 6)]
+        assert accepted == [True, True, True, False, False]
+        assert buffer.metrics()['rejected'] == 2
+        await buffer.stop()
+        # Only the drain deadline gives up on them
+        assert store.written == []
+        assert buffer.metrics()['dropped'] == 4
+    run(scenario())
+
+
+def test_stop_waits_for_a_recovering_store():
+    async def scenario():
+        store = FlakyStore(5)
+        buffer = WriteBehindBuffer(store, flush_interval=0.01, drain_timeout=5)
+        buffer.start()
+        buffer.offer({'id': 0})
+        await buffer.stop()
+        assert store.written == [0]
+        assert buffer.metrics()['dropped'] == 0
+    run(scenario())